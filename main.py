@@ -1,15 +1,142 @@
 import streamlit as st
 import os
 import json
+import time
+import uuid
 from dotenv import load_dotenv
 from src.integrated_workflow import IntegratedWorkflow
+from src.batch_workflow import BatchWorkflow
+from src.job_queue import get_job_queue
+from src.tracing import get_tracer, summarize_spans
 from src.company_analysis.analyzer import CompanyAnalyzer
+from src.company_analysis.company_master import get_company_master
 from src.industry_matching.matcher import IndustryMatcher
 from src.essay_generation.generator import EssayGenerator
 from src.interview_prep.prep import InterviewPrep
 
 load_dotenv()
 
+def render_stream(stream, title: str = None) -> str:
+    """ストリーミング生成されたテキストを逐次表示し、全文を返す"""
+    if title:
+        st.write(title)
+    
+    placeholder = st.empty()
+    text = ""
+    for chunk in stream:
+        text += chunk
+        placeholder.markdown(text + "▌")
+    placeholder.markdown(text)
+    
+    # 体感速度の指標として最初のトークンまでの時間を表示
+    metrics = stream.metrics()
+    if metrics["ttft"] is not None:
+        st.caption(f"⏱ 最初の表示まで {metrics['ttft']:.2f}秒 / 生成完了まで {metrics['total_time']:.2f}秒")
+    return text
+
+def json_preview(formatter):
+    """確定したJSON要素から順にプレビュー表示するイベントハンドラを作成（戻り値: handler, placeholder）"""
+    placeholder = st.empty()
+    lines = []
+    
+    def handler(path, value):
+        line = formatter(path, value)
+        if line:
+            lines.append(line)
+            placeholder.markdown("\n\n".join(lines) + " ▌")
+    
+    return handler, placeholder
+
+def format_gap_event(path, value) -> str:
+    """ギャップ分析のプレビュー行"""
+    labels = {"strengths_match": "✅ 一致", "gaps_identified": "📈 ギャップ"}
+    if path == ("overall_fit_score",):
+        return f"🎯 適合度スコア: {value}/100"
+    if len(path) == 3 and path[1] in labels and isinstance(value, dict):
+        return f"{labels[path[1]]}: {value.get('area', '')}"
+    return ""
+
+def format_fit_event(path, value) -> str:
+    """業界適性診断のプレビュー行"""
+    if len(path) == 2 and path[0] == "industry_scores" and isinstance(value, dict):
+        return f"📊 {path[1]}: {value.get('score', '-')}/10"
+    return ""
+
+def format_essay_event(path, value) -> str:
+    """文章改善のプレビュー行"""
+    if len(path) == 2 and path[0] == "scores":
+        return f"📊 {path[1]}: {value}/10"
+    if len(path) == 2 and path[0] == "improvements" and isinstance(value, dict):
+        return f"📈 {value.get('category', '')}: {value.get('suggestion', '')}"
+    return ""
+
+def submit_job(slot: str, kind: str, fn, *args, dedupe_key: str = None, **kwargs) -> str:
+    """処理をジョブキューに投入し、ジョブIDをセッションに記録"""
+    job_id = get_job_queue().submit(kind, fn, *args, dedupe_key=dedupe_key, **kwargs)
+    st.session_state.setdefault("jobs", {})[slot] = (kind, job_id)
+    return job_id
+
+def poll_job(slot: str, message: str, progress: dict = None):
+    """セッションに記録されたジョブの完了を待って (種類, 結果) を返す（ジョブがなければNone）
+
+    スクリプトが再実行されてもジョブは継続するため、次の実行で続きから待機する。
+    """
+    job = st.session_state.get("jobs", {}).get(slot)
+    if job is None:
+        return None
+    
+    kind, job_id = job
+    queue = get_job_queue()
+    placeholder = st.empty()
+    status = queue.status(job_id)
+    while status is not None and status["status"] in ("queued", "running"):
+        if status["status"] == "queued":
+            text = f"⏳ {message}（順番待ち {status['queue_time']:.0f}秒）"
+        else:
+            text = f"⏳ {message}（{status['run_time']:.0f}秒経過）"
+        with placeholder.container():
+            st.info(text)
+            if progress:
+                finished = len(progress["completed"])
+                st.progress(finished / progress["total"] if progress["total"] else 0.0,
+                            text=f"{finished}/{progress['total']}件 完了")
+        status = queue.wait(job_id, timeout=0.5)
+    placeholder.empty()
+    
+    del st.session_state.jobs[slot]
+    if status is None:
+        return kind, {"status": "error", "error": "ジョブが見つかりません（保持期間を過ぎた可能性があります）"}
+    if status["status"] != "succeeded":
+        return kind, {"status": "error", "error": status["error"] or status["status"]}
+    return kind, queue.result(job_id)
+
+def render_full_analysis(result):
+    """全ステップ一括実行の結果と所要時間を表示"""
+    summary = result["workflow_summary"]
+    gap_analysis = summary.get("gap_analysis") or {}
+    if "overall_fit_score" in gap_analysis:
+        st.metric("🎯 適合度スコア", f"{gap_analysis['overall_fit_score']}/100")
+    
+    essays = summary.get("generated_essays") or {}
+    with st.expander("📝 自己PR"):
+        st.write(essays.get("self_pr", ""))
+    with st.expander("💌 志望動機"):
+        st.write(essays.get("motivation", ""))
+    
+    preparation = summary.get("interview_preparation") or {}
+    with st.expander(f"❓ 想定質問 ({len(preparation.get('questions', []))}問)"):
+        for q in preparation.get("questions", []):
+            st.write(f"• {q.get('question', '')}")
+    with st.expander("📈 パーソナリティ改善プラン"):
+        st.write(preparation.get("development_plan", ""))
+    
+    report = result.get("execution_report", {})
+    if report:
+        st.caption(
+            f"⏱ 所要時間 {report['wall_time']:.1f}秒（逐次実行なら {report['sequential_time']:.1f}秒） / "
+            f"クリティカルパス: {' → '.join(report['critical_path'])}"
+        )
+
 def main():
     st.set_page_config(
         page_title="就活AIコンパス",
@@ -21,15 +148,26 @@ def main():
     
     st.markdown("就活生向けAI支援ツール - 企業分析から始まる一貫した就活支援")
     
-    # ワークフロー状態の初期化
+    # ワークフロー状態の初期化（URLのセッショントークンで前回の結果を復元）
     if 'workflow' not in st.session_state:
-        st.session_state.workflow = IntegratedWorkflow()
+        session_key = st.query_params.get("session")
+        if not session_key:
+            session_key = uuid.uuid4().hex
+            st.query_params["session"] = session_key
+        
+        st.session_state.workflow = IntegratedWorkflow(session_key=session_key)
+        
+        workflow_state = st.session_state.workflow.workflow_state
+        if workflow_state.get("company_analysis"):
+            st.session_state.selected_company = workflow_state["company_analysis"].get("company_name", "")
+            st.session_state.show_detailed_workflow = True
+            st.session_state.workflow_step = st.session_state.workflow.current_step()
     
     # Sidebar for navigation
     st.sidebar.title("📋 メニュー")
     page = st.sidebar.selectbox(
         "機能選択",
-        ["🎯 就活AIコンパス", "👤 プロフィール設定", "❓ ヘルプ"]
+        ["🎯 就活AIコンパス", "👤 プロフィール設定", "❓ ヘルプ", "📊 トレース"]
     )
     
     if page == "🎯 就活AIコンパス":
@@ -38,6 +176,8 @@ def main():
         profile_setting_page()
     elif page == "❓ ヘルプ":
         help_page()
+    elif page == "📊 トレース":
+        trace_page()
 
 def integrated_workflow_page():
     st.header("🎯 統合ワークフロー")
@@ -225,7 +365,9 @@ def integrated_workflow_page():
         
         if st.button("🔍 ギャップ分析実行", type="primary"):
             with st.spinner("ギャップ分析を実行中..."):
-                result = st.session_state.workflow.analyze_personality_gap()
+                handler, preview = json_preview(format_gap_event)
+                result = st.session_state.workflow.analyze_personality_gap(event_handler=handler)
+                preview.empty()
                 
                 if result.get("status") == "success":
                     st.success("✅ ギャップ分析完了！")
@@ -318,54 +460,56 @@ def integrated_workflow_page():
         
         if st.button("💬 面接対策生成", type="primary"):
             with st.spinner("面接戦略を準備中..."):
-                result = st.session_state.workflow.prepare_interview_strategy()
+                # 改善プランはストリーミング表示し、質問・戦略はその上のコンテナに描画する
+                results_area = st.container()
+                result = st.session_state.workflow.prepare_interview_strategy(
+                    plan_renderer=lambda stream: render_stream(stream, "**📈 パーソナリティ改善プラン:**")
+                )
                 
-                if result.get("status") == "success":
-                    st.success("✅ 面接対策完了！")
+                with results_area:
+                    if result.get("status") == "success":
+                        st.success("✅ 面接対策完了！")
                     
-                    interview_prep = result["interview_preparation"]
+                        interview_prep = result["interview_preparation"]
                     
-                    # 想定質問
-                    if "questions" in interview_prep:
-                        st.write("**❓ 想定面接質問:**")
-                        questions = interview_prep["questions"]
+                        # 想定質問
+                        if "questions" in interview_prep:
+                            st.write("**❓ 想定面接質問:**")
+                            questions = interview_prep["questions"]
                         
-                        categories = {}
-                        for q in questions:
-                            category = q.get("category", "その他")
-                            if category not in categories:
-                                categories[category] = []
-                            categories[category].append(q)
+                            categories = {}
+                            for q in questions:
+                                category = q.get("category", "その他")
+                                if category not in categories:
+                                    categories[category] = []
+                                categories[category].append(q)
                         
-                        for category, qs in categories.items():
-                            with st.expander(f"📋 {category} ({len(qs)}問)"):
-                                for i, q in enumerate(qs, 1):
-                                    difficulty_color = {"低": "🟢", "中": "🟡", "高": "🔴"}
-                                    difficulty_icon = difficulty_color.get(q.get("difficulty", "中"), "⚪")
-                                    st.write(f"{i}. {difficulty_icon} {q['question']}")
+                            for category, qs in categories.items():
+                                with st.expander(f"📋 {category} ({len(qs)}問)"):
+                                    for i, q in enumerate(qs, 1):
+                                        difficulty_color = {"低": "🟢", "中": "🟡", "高": "🔴"}
+                                        difficulty_icon = difficulty_color.get(q.get("difficulty", "中"), "⚪")
+                                        st.write(f"{i}. {difficulty_icon} {q['question']}")
                     
-                    # 面接戦略
-                    if "strategy" in interview_prep:
-                        strategy = interview_prep["strategy"]
+                        # 面接戦略
+                        if "strategy" in interview_prep:
+                            strategy = interview_prep["strategy"]
                         
-                        if "highlight_strengths" in strategy:
-                            st.write("**💪 面接でアピールすべき強み:**")
-                            for strength in strategy["highlight_strengths"]:
-                                st.write(f"• {strength}")
+                            if "highlight_strengths" in strategy:
+                                st.write("**💪 面接でアピールすべき強み:**")
+                                for strength in strategy["highlight_strengths"]:
+                                    st.write(f"• {strength}")
                         
-                        if "address_gaps" in strategy:
-                            st.write("**🔧 ギャップへの対処法:**")
-                            for gap in strategy["address_gaps"]:
-                                st.write(f"• {gap}")
-                    
-                    # 改善プラン
-                    if "development_plan" in interview_prep:
-                        st.write("**📈 パーソナリティ改善プラン:**")
-                        st.write(interview_prep["development_plan"])
+                            if "address_gaps" in strategy:
+                                st.write("**🔧 ギャップへの対処法:**")
+                                for gap in strategy["address_gaps"]:
+                                    st.write(f"• {gap}")
                     
+                    else:
+                        st.error(f"❌ エラー: {result.get('error')}")
+                
+                if result.get("status") == "success":
                     st.success("🎉 **ワークフロー完了！** 準備が整いました。")
-                else:
-                    st.error(f"❌ エラー: {result.get('error')}")
 
 def home_page():
     st.header("🎯 就活AIコンパス")
@@ -391,6 +535,24 @@ def home_page():
         key="home_company_input"
     )
     
+    # 企業マスタの候補から選ぶと正式名称で分析する（表記ゆれがあっても同じ企業の結果を再利用できる）
+    # 類似した名称の候補は別の企業の可能性があるため、完全一致しない限り既定は入力のままにする
+    master = get_company_master()
+    suggestions = master.suggest(company_name, limit=8) if company_name else []
+    if suggestions:
+        exact = master.resolve(company_name)
+        selected = st.selectbox(
+            "🔎 候補から企業を選択",
+            suggestions + [None],
+            index=suggestions.index(exact) if exact in suggestions else len(suggestions),
+            format_func=lambda record: (
+                f"{record.name}（{record.company_id}・{record.industry}）" if record else f"入力のまま「{company_name}」"
+            ),
+            key="home_company_suggestion"
+        )
+        if selected is not None:
+            company_name = selected.name
+    
     col1, col2 = st.columns(2)
     
     with col1:
@@ -401,18 +563,32 @@ def home_page():
                 st.session_state.workflow_active = True
                 st.success(f"✅ {company_name} の分析を開始します")
                 
-                # ワークフロー開始
-                with st.spinner("企業分析を実行中..."):
-                    result = st.session_state.workflow.start_workflow(company_name)
-                    
-                    if result.get("status") == "success":
-                        st.success("🎉 企業分析完了！詳細ワークフローで続きを進めてください")
-                        st.session_state.show_detailed_workflow = True
-                        st.rerun()
-                    else:
-                        st.error(f"❌ エラー: {result.get('error', '不明なエラー')}")
+                # 分析はジョブとして実行し、画面の再実行で中断・重複しないようにする
+                workflow = st.session_state.workflow
+                user_info, error = workflow.get_session_user_info()
+                if not error:
+                    # プロフィール設定済みの場合は全ステップを並行実行
+                    submit_job("home_analysis", "full_analysis", workflow.run_full_analysis, company_name, user_info,
+                               dedupe_key=f"full_analysis:{workflow.session_key}:{company_name}")
+                else:
+                    submit_job("home_analysis", "start_workflow", workflow.start_workflow, company_name,
+                               dedupe_key=f"start_workflow:{workflow.session_key}:{company_name}")
             else:
                 st.error("❌ 企業名を入力してください")
+        
+        # 実行中・完了済みのジョブの結果を表示（再実行後も続きから待機する）
+        job = poll_job("home_analysis", "分析を実行中")
+        if job is not None:
+            kind, result = job
+            if kind == "full_analysis" and result.get("status") == "success":
+                st.success("🎉 完全分析完了！")
+                render_full_analysis(result)
+            elif kind == "start_workflow" and result.get("status") == "success":
+                st.success("🎉 企業分析完了！詳細ワークフローで続きを進めてください")
+                st.session_state.show_detailed_workflow = True
+                st.rerun()
+            else:
+                st.error(f"❌ エラー: {result.get('error', '不明なエラー')}")
     
     with col2:
         if st.button("🔍 詳細ワークフロー", use_container_width=True):
@@ -425,6 +601,46 @@ def home_page():
             else:
                 st.error("❌ 企業名を入力してください")
     
+    # 複数企業の一括分析（ユーザー側の分析は一度だけ実行）
+    with st.expander("📚 複数企業を一括分析して適合度順に比較", expanded="home_batch" in st.session_state.get("jobs", {})):
+        batch_input = st.text_area(
+            "🏢 企業名（1行に1社）",
+            placeholder="トヨタ自動車\nソニーグループ\n三菱商事",
+            key="home_batch_companies"
+        )
+        
+        if st.button("📊 一括分析開始", key="home_batch_start"):
+            companies = [line.strip() for line in batch_input.splitlines() if line.strip()]
+            user_info, error = st.session_state.workflow.get_session_user_info()
+            if error:
+                st.error("❌ 一括分析には「👤 プロフィール設定」での基本情報の入力が必要です")
+            elif not companies:
+                st.error("❌ 企業名を入力してください")
+            else:
+                # 進捗はジョブのスレッドから更新されるため、画面側はポーリングで表示する
+                completed = []
+                st.session_state.batch_progress = {"completed": completed, "total": len(companies)}
+                submit_job("home_batch", "batch_workflow", BatchWorkflow().run, companies, user_info,
+                           progress=lambda company, result: completed.append(company),
+                           dedupe_key=f"batch_workflow:{st.session_state.workflow.session_key}")
+        
+        job = poll_job("home_batch", "一括分析を実行中", progress=st.session_state.get("batch_progress"))
+        if job is not None:
+            _, result = job
+            if result.get("status") == "success":
+                st.success(f"✅ {result['execution']['companies']}社の分析完了！（{result['execution']['wall_time']:.1f}秒）")
+                st.dataframe([
+                    {
+                        "順位": item["rank"],
+                        "企業名": item["company_name"],
+                        "適合度スコア": item["overall_fit_score"],
+                        "評価": item["fit_assessment"] if item["status"] == "success" else f"エラー: {item['error']}"
+                    }
+                    for item in result["ranking"]
+                ], use_container_width=True, hide_index=True)
+            else:
+                st.error(f"❌ エラー: {result.get('error', '不明なエラー')}")
+    
     st.divider()
     
     # 機能紹介（簡潔版）
@@ -841,7 +1057,9 @@ def integrated_workflow_content():
             
             if st.button("🔍 ギャップ分析実行", type="primary", key="workflow_gap_next"):
                 with st.spinner("ギャップ分析を実行中..."):
-                    result = st.session_state.workflow.analyze_personality_gap()
+                    handler, preview = json_preview(format_gap_event)
+                    result = st.session_state.workflow.analyze_personality_gap(event_handler=handler)
+                    preview.empty()
                     
                     if result.get("status") == "success":
                         st.success("✅ ギャップ分析完了！")
@@ -936,54 +1154,56 @@ def integrated_workflow_content():
             
             if st.button("💬 面接対策生成", type="primary", key="workflow_interview_next"):
                 with st.spinner("面接戦略を準備中..."):
-                    result = st.session_state.workflow.prepare_interview_strategy()
+                    # 改善プランはストリーミング表示し、質問・戦略はその上のコンテナに描画する
+                    results_area = st.container()
+                    result = st.session_state.workflow.prepare_interview_strategy(
+                        plan_renderer=lambda stream: render_stream(stream, "**📈 パーソナリティ改善プラン:**")
+                    )
                     
-                    if result.get("status") == "success":
-                        st.success("✅ 面接対策完了！")
+                    with results_area:
+                        if result.get("status") == "success":
+                            st.success("✅ 面接対策完了！")
                         
-                        interview_prep = result["interview_preparation"]
+                            interview_prep = result["interview_preparation"]
                         
-                        # 想定質問
-                        if "questions" in interview_prep:
-                            st.write("**❓ 想定面接質問:**")
-                            questions = interview_prep["questions"]
+                            # 想定質問
+                            if "questions" in interview_prep:
+                                st.write("**❓ 想定面接質問:**")
+                                questions = interview_prep["questions"]
                             
-                            categories = {}
-                            for q in questions:
-                                category = q.get("category", "その他")
-                                if category not in categories:
-                                    categories[category] = []
-                                categories[category].append(q)
+                                categories = {}
+                                for q in questions:
+                                    category = q.get("category", "その他")
+                                    if category not in categories:
+                                        categories[category] = []
+                                    categories[category].append(q)
                             
-                            for category, qs in categories.items():
-                                with st.expander(f"📋 {category} ({len(qs)}問)"):
-                                    for i, q in enumerate(qs, 1):
-                                        difficulty_color = {"低": "🟢", "中": "🟡", "高": "🔴"}
-                                        difficulty_icon = difficulty_color.get(q.get("difficulty", "中"), "⚪")
-                                        st.write(f"{i}. {difficulty_icon} {q['question']}")
+                                for category, qs in categories.items():
+                                    with st.expander(f"📋 {category} ({len(qs)}問)"):
+                                        for i, q in enumerate(qs, 1):
+                                            difficulty_color = {"低": "🟢", "中": "🟡", "高": "🔴"}
+                                            difficulty_icon = difficulty_color.get(q.get("difficulty", "中"), "⚪")
+                                            st.write(f"{i}. {difficulty_icon} {q['question']}")
                         
-                        # 面接戦略
-                        if "strategy" in interview_prep:
-                            strategy = interview_prep["strategy"]
+                            # 面接戦略
+                            if "strategy" in interview_prep:
+                                strategy = interview_prep["strategy"]
                             
-                            if "highlight_strengths" in strategy:
-                                st.write("**💪 面接でアピールすべき強み:**")
-                                for strength in strategy["highlight_strengths"]:
-                                    st.write(f"• {strength}")
+                                if "highlight_strengths" in strategy:
+                                    st.write("**💪 面接でアピールすべき強み:**")
+                                    for strength in strategy["highlight_strengths"]:
+                                        st.write(f"• {strength}")
                             
-                            if "address_gaps" in strategy:
-                                st.write("**🔧 ギャップへの対処法:**")
-                                for gap in strategy["address_gaps"]:
-                                    st.write(f"• {gap}")
-                        
-                        # 改善プラン
-                        if "development_plan" in interview_prep:
-                            st.write("**📈 パーソナリティ改善プラン:**")
-                            st.write(interview_prep["development_plan"])
+                                if "address_gaps" in strategy:
+                                    st.write("**🔧 ギャップへの対処法:**")
+                                    for gap in strategy["address_gaps"]:
+                                        st.write(f"• {gap}")
                         
+                        else:
+                            st.error(f"❌ エラー: {result.get('error')}")
+                    
+                    if result.get("status") == "success":
                         st.success("🎉 **ワークフロー完了！** 準備が整いました。")
-                    else:
-                        st.error(f"❌ エラー: {result.get('error')}")
 
 def profile_setting_page():
     st.header("👤 プロフィール設定")
@@ -1275,6 +1495,44 @@ def help_page():
     
     st.info("💡 **ヒント**: プロフィール設定を詳しく記入するほど、AIの分析精度が向上します！")
 
+def trace_page():
+    st.header("📊 トレース")
+    st.markdown("ワークフローのステップ・LLM呼び出しごとの所要時間とトークン数、概算コストを集計します")
+    
+    limit = st.number_input("集計するスパン数（直近）", min_value=100, max_value=100000, value=5000, step=500)
+    spans = get_tracer().spans(int(limit))
+    if not spans:
+        st.info("まだトレースが記録されていません（TRACE_ENABLED / TRACE_PATH を確認してください）")
+        return
+    
+    summary = summarize_spans(spans)
+    totals = summary["totals"]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("LLM呼び出し", totals["llm_calls"])
+    with col2:
+        hit_rate = totals["cache_hits"] / totals["llm_calls"] if totals["llm_calls"] else 0
+        st.metric("キャッシュヒット率", f"{hit_rate:.0%}")
+    with col3:
+        st.metric("トークン（入力 / 出力）", f"{totals['input_tokens']:,} / {totals['output_tokens']:,}")
+    with col4:
+        st.metric("概算コスト", f"${totals['cost']:.4f}")
+    
+    workflows = [row for row in summary["workflows"] if row["name"] == "workflow"]
+    if workflows:
+        avg_cost = sum(row["cost"] for row in workflows) / len(workflows)
+        avg_time = sum(row["duration"] for row in workflows) / len(workflows)
+        st.caption(f"ワークフロー実行 {len(workflows)}回 / 平均 {avg_time:.1f}秒・${avg_cost:.4f}")
+    
+    st.subheader("⏱ ステップ別")
+    st.dataframe(summary["steps"], use_container_width=True)
+    
+    st.subheader("🤖 モデル別")
+    st.dataframe(summary["models"], use_container_width=True)
+    
+    st.subheader("🧾 直近のワークフロー")
+    st.dataframe(summary["workflows"][:50], use_container_width=True)
+
 def company_analysis_page():
     st.header("🏢 企業分析AI")
     st.markdown("企業名を入力すると、IR情報や事業戦略を基にAIが包括的な企業分析を行います。")
@@ -1290,33 +1548,40 @@ def company_analysis_page():
     if analyze_btn and company_name:
         analyzer = CompanyAnalyzer()
         with st.spinner("企業情報を分析中... 少々お待ちください"):
-            result = analyzer.analyze(company_name)
+            result, stream = analyzer.stream_analysis(company_name)
             
-            if result["status"] == "success":
-                st.success("✅ 分析完了！")
-                
-                # 分析結果の表示
-                st.subheader("📊 分析結果")
-                
-                with st.expander("🏢 企業基本情報", expanded=True):
-                    st.write(result["basic_info"])
-                
-                with st.expander("📈 IR情報サマリー"):
-                    st.write(result["ir_summary"])
-                
-                with st.expander("🤖 AI分析レポート"):
-                    st.write(result["ai_analysis"])
-            else:
-                st.error(f"❌ エラーが発生しました: {result.get('error', '不明なエラー')}")
+            # 分析結果の表示
+            st.subheader("📊 分析結果")
+            if result.get("artifact"):
+                created_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(result["artifact"]["created_at"]))
+                st.caption(f"💾 {created_at} に作成した分析結果を再利用しています")
+            
+            with st.expander("🏢 企業基本情報", expanded=True):
+                st.write(result["basic_info"])
+            
+            with st.expander("📈 IR情報サマリー"):
+                st.write(result["ir_summary"])
+            
+            with st.expander("🤖 AI分析レポート", expanded=True):
+                try:
+                    result["ai_analysis"] = render_stream(stream)
+                    st.success("✅ 分析完了！")
+                except Exception as e:
+                    st.error(f"❌ エラーが発生しました: {str(e)}")
     
     if questions_btn and company_name:
         analyzer = CompanyAnalyzer()
         with st.spinner("想定質問を生成中..."):
-            questions = analyzer.get_interview_points(company_name)
+            try:
+                questions = analyzer.get_interview_points(company_name)
+            except Exception as e:
+                st.error(f"❌ エラーが発生しました: {str(e)}")
+                questions = None
             
-            st.subheader("❓ 面接想定質問")
-            for i, question in enumerate(questions, 1):
-                st.write(f"{i}. {question}")
+            if questions is not None:
+                st.subheader("❓ 面接想定質問")
+                for i, question in enumerate(questions, 1):
+                    st.write(f"{i}. {question}")
 
 def industry_matching_page():
     st.header("🎯 業界適性診断")
@@ -1347,7 +1612,15 @@ def industry_matching_page():
                 }
                 
                 with st.spinner("業界適性を分析中..."):
-                    result = matcher.analyze_fit(user_profile)
+                    handler, preview = json_preview(format_fit_event)
+                    try:
+                        events = matcher.stream_fit(user_profile)
+                        for path, value in events:
+                            handler(path, value)
+                        result = events.result
+                    except Exception as e:
+                        result = {"error": str(e), "status": "error"}
+                    preview.empty()
                     
                     if result.get("status") != "error":
                         st.success("✅ 診断完了！")
@@ -1411,18 +1684,17 @@ def essay_generation_page():
                     "achievements": achievements
                 }
                 
-                with st.spinner("自己PRを生成中..."):
-                    result = generator.generate_self_pr(user_info, target_company)
+                st.subheader("📄 生成された自己PR")
+                try:
+                    with st.spinner("自己PRを生成中..."):
+                        self_pr = render_stream(generator.stream_self_pr(user_info, target_company))
                     
-                    if result["status"] == "success":
-                        st.success("✅ 自己PR生成完了！")
-                        st.subheader("📄 生成された自己PR")
-                        st.write(result["self_pr"])
-                        
-                        # コピー用のテキストエリア
-                        st.text_area("📋 コピー用", value=result["self_pr"], height=150)
-                    else:
-                        st.error(f"❌ エラー: {result.get('error')}")
+                    st.success("✅ 自己PR生成完了！")
+                    
+                    # コピー用のテキストエリア
+                    st.text_area("📋 コピー用", value=self_pr, height=150)
+                except Exception as e:
+                    st.error(f"❌ エラー: {str(e)}")
     
     with tab2:
         st.subheader("🎯 志望動機生成")
@@ -1436,15 +1708,18 @@ def essay_generation_page():
                 generator = EssayGenerator()
                 analyzer = CompanyAnalyzer()
                 
-                with st.spinner("企業分析と志望動機を生成中..."):
+                with st.spinner("企業分析中..."):
                     company_info = analyzer.analyze(company_name)
                     user_info = {"experiences": user_experiences}
-                    
-                    motivation = generator.generate_motivation_letter(company_info, user_info)
+                
+                st.subheader("📄 生成された志望動機")
+                try:
+                    with st.spinner("志望動機を生成中..."):
+                        render_stream(generator.stream_motivation_letter(company_info, user_info))
                     
                     st.success("✅ 志望動機生成完了！")
-                    st.subheader("📄 生成された志望動機")
-                    st.write(motivation)
+                except Exception as e:
+                    st.error(f"❌ エラー: {str(e)}")
     
     with tab3:
         st.subheader("✏️ 文章改善・添削")
@@ -1457,7 +1732,15 @@ def essay_generation_page():
                 generator = EssayGenerator()
                 
                 with st.spinner("文章を分析・改善中..."):
-                    result = generator.improve_essay(essay_text, essay_type)
+                    handler, preview = json_preview(format_essay_event)
+                    try:
+                        events = generator.stream_improve_essay(essay_text, essay_type)
+                        for path, value in events:
+                            handler(path, value)
+                        result = events.result
+                    except Exception as e:
+                        result = {"error": str(e), "status": "error"}
+                    preview.empty()
                     
                     if "scores" in result:
                         st.success("✅ 改善提案完了！")
@@ -1514,7 +1797,15 @@ def interview_prep_page():
                 prep = InterviewPrep()
                 
                 with st.spinner("想定質問を生成中..."):
-                    questions = prep.generate_questions(company_name, industry, job_type)
+                    handler, preview = json_preview(lambda path, value: f"• {value}")
+                    questions = []
+                    try:
+                        for q in prep.stream_questions(company_name, industry, job_type):
+                            questions.append(q)
+                            handler((q["category"],), q["question"])
+                    except Exception as e:
+                        questions = [{"error": str(e), "status": "error"}]
+                    preview.empty()
                     
                     if questions and not questions[0].get("error"):
                         st.success("✅ 想定質問生成完了！")
@@ -1,55 +1,1180 @@
 import os
-from typing import Dict, Any, Optional
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Awaitable, TypeVar, Iterator, AsyncIterator, Callable, Tuple
 import anthropic
 import openai
+from .tracing import Span, get_tracer, traced_iter, atraced_iter
 from abc import ABC, abstractmethod
 
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant for job hunting support."
+
+T = TypeVar("T")
+
+class ProviderLimiter:
+    """プロバイダごとの同時リクエスト数を制限するセマフォ（スレッド・asyncio共用）"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._active = 0
+        self._peak = 0
+        self._waiters = deque()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                self._peak = max(self._peak, self._active)
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        # release() から枠が直接引き渡されるまで待機
+        event.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                self._peak = max(self._peak, self._active)
+                return
+            waiter = {"loop": loop, "future": loop.create_future(), "handed": False}
+            self._waiters.append(waiter)
+
+        try:
+            await waiter["future"]
+        except asyncio.CancelledError:
+            with self._lock:
+                if not waiter["handed"]:
+                    self._waiters.remove(waiter)
+                    raise
+            # 枠を受け取った後にキャンセルされた場合は返却する
+            self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                if waiter["loop"].is_closed():
+                    continue
+                waiter["handed"] = True
+                waiter["loop"].call_soon_threadsafe(self._hand_over, waiter["future"])
+                return
+            self._active -= 1
+
+    @staticmethod
+    def _hand_over(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(None)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    async def __aenter__(self):
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"limit": self.limit, "active": self._active, "peak": self._peak, "waiting": len(self._waiters)}
+
+_provider_limiters: Dict[str, ProviderLimiter] = {}
+_provider_limiters_lock = threading.Lock()
+
+def get_provider_limiter(provider: str) -> ProviderLimiter:
+    """プロバイダ単位で共有される同時実行リミッターを取得"""
+    with _provider_limiters_lock:
+        if provider not in _provider_limiters:
+            limit = os.getenv(f"AI_MAX_CONCURRENCY_{provider.upper()}", os.getenv("AI_MAX_CONCURRENCY", "8"))
+            _provider_limiters[provider] = ProviderLimiter(int(limit))
+        return _provider_limiters[provider]
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """非同期SDKクライアントを使い回すための常駐イベントループ"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="ai-client-loop", daemon=True).start()
+        return _loop
+
+def run_async(coro: Awaitable[T]) -> T:
+    """同期コード（Streamlitのスクリプトスレッド等）からコルーチンを実行して結果を返す"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop()).result()
+
+class AIClientError(Exception):
+    """AI API呼び出しの失敗（リトライしても解決しなかったもの）"""
+
+    def __init__(self, message: str, provider: str = "", status_code: Optional[int] = None,
+                 retryable: bool = False):
+        super().__init__(message)
+        self.provider = provider
+        self.status_code = status_code
+        # 呼び出し元が同じリクエストをやり直せば成功しうるか
+        self.retryable = retryable
+
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（日本語は1文字≒1トークン、英数字は4文字≒1トークン）"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+class TokenBucket:
+    """1分あたりの予算を持つトークンバケット（不足分は待ち時間として予約）"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """予算を確保し、実行可能になるまでの待ち秒数を返す"""
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, delta: float) -> None:
+        """見積もりと実績の差分を反映（正なら追加消費、負なら返却）"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+class RateLimitScheduler:
+    """プロバイダごとのRPM/TPM予算管理と一時的エラーのリトライを行うスケジューラ"""
+
+    def __init__(self, provider: str, rpm: float, tpm: float, max_retries: int = 4,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        self.provider = provider
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._counters = {"calls": 0, "retries": 0, "failures": 0, "queued_seconds": 0.0}
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        with self._lock:
+            # retry-afterで指示された停止期間は全呼び出しで共有する
+            wait = max(wait, self._paused_until - time.monotonic())
+            self._counters["calls"] += 1
+            self._counters["queued_seconds"] += wait
+        return wait
+
+    def acquire(self, estimated_tokens: int) -> None:
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, estimated_tokens: int) -> None:
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """APIのusageで見積もりを補正"""
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def call(self, fn: Callable[[], T], estimated_tokens: int) -> T:
+        attempt = 0
+        while True:
+            self.acquire(estimated_tokens)
+            try:
+                return fn()
+            except Exception as e:
+                time.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], estimated_tokens: int) -> T:
+        attempt = 0
+        while True:
+            await self.aacquire(estimated_tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    def stream(self, open_stream: Callable[[], Iterator[str]], estimated_tokens: int) -> Iterator[str]:
+        """ストリーミング呼び出し（最初のチャンク受信前の失敗のみリトライ）"""
+        attempt = 0
+        while True:
+            self.acquire(estimated_tokens)
+            started = False
+            try:
+                for chunk in open_stream():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise self._to_error(e) from e
+                time.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    async def astream(self, open_stream: Callable[[], AsyncIterator[str]], estimated_tokens: int) -> AsyncIterator[str]:
+        attempt = 0
+        while True:
+            await self.aacquire(estimated_tokens)
+            started = False
+            try:
+                async for chunk in open_stream():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise self._to_error(e) from e
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """リトライまでの待ち秒数を返す（リトライ不可ならAIClientErrorを送出）"""
+        if not self._is_transient(error) or attempt >= self.max_retries:
+            with self._lock:
+                self._counters["failures"] += 1
+            raise self._to_error(error) from error
+
+        # full jitter付き指数バックオフ。retry-afterがあればそれ以上待つ
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+        with self._lock:
+            self._counters["retries"] += 1
+        return delay
+
+    def _is_transient(self, error: Exception) -> bool:
+        if isinstance(error, AIClientError):
+            return False
+        if isinstance(error, (anthropic.APIConnectionError, openai.APIConnectionError)):
+            # タイムアウトも接続エラーのサブクラス
+            return True
+        return getattr(error, "status_code", None) in TRANSIENT_STATUS_CODES
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return float(retry_after_ms) / 1000
+            except ValueError:
+                pass
+
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+
+    def _to_error(self, error: Exception) -> AIClientError:
+        if isinstance(error, AIClientError):
+            return error
+        return AIClientError(
+            f"{self.provider} API error: {error}",
+            provider=self.provider,
+            status_code=getattr(error, "status_code", None)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats.update({
+            "rpm": self.requests.capacity,
+            "tpm": self.tokens.capacity,
+            "requests_available": self.requests.available(),
+            "tokens_available": self.tokens.available()
+        })
+        return stats
+
+_rate_schedulers: Dict[str, RateLimitScheduler] = {}
+_rate_schedulers_lock = threading.Lock()
+
+def get_rate_scheduler(provider: str) -> RateLimitScheduler:
+    """プロバイダ単位で共有されるレート制限スケジューラを取得"""
+    def setting(name: str, default: str) -> str:
+        return os.getenv(f"{name}_{provider.upper()}", os.getenv(name, default))
+
+    with _rate_schedulers_lock:
+        if provider not in _rate_schedulers:
+            _rate_schedulers[provider] = RateLimitScheduler(
+                provider,
+                rpm=float(setting("AI_RPM", "50")),
+                tpm=float(setting("AI_TPM", "40000")),
+                max_retries=int(setting("AI_MAX_RETRIES", "4"))
+            )
+        return _rate_schedulers[provider]
+
+class _CountingClient:
+    """HTTPPoolのクライアントに混ぜて、送信中のリクエスト数を失敗時も含めて数えるmixin"""
+
+    http_pool: "HTTPPool"
+
+    def send(self, request, **kwargs):
+        self.http_pool._on_request()
+        try:
+            response = super().send(request, **kwargs)
+        except BaseException:
+            # 接続エラー・タイムアウト・キャンセルでも送信中の数を戻す
+            self.http_pool._on_response(failed=True)
+            raise
+        self.http_pool._on_response()
+        return response
+
+class _AsyncCountingClient:
+    http_pool: "HTTPPool"
+
+    async def send(self, request, **kwargs):
+        self.http_pool._on_request()
+        try:
+            response = await super().send(request, **kwargs)
+        except BaseException:
+            self.http_pool._on_response(failed=True)
+            raise
+        self.http_pool._on_response()
+        return response
+
+class HTTPPool:
+    """プロバイダごとに共有するHTTPコネクションプール（keep-alive・タイムアウト設定済み）"""
+
+    def __init__(self, provider: str, sdk):
+        self.provider = provider
+        # SDKが採用しているhttpx実装に合わせてLimits/Timeoutを生成する
+        self.limits = type(sdk.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", "30"))
+        )
+        self.timeout = sdk.Timeout(
+            float(os.getenv("AI_HTTP_TIMEOUT", "60")),
+            connect=float(os.getenv("AI_HTTP_CONNECT_TIMEOUT", "10"))
+        )
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "responses": 0, "errors": 0, "in_flight": 0}
+
+        # SDKが設定するトランスポート（keep-alive・プロキシ）はそのまま使い、送信処理だけを包む
+        client_class = type("CountingHttpxClient", (_CountingClient, sdk.DefaultHttpxClient), {})
+        async_client_class = type("AsyncCountingHttpxClient", (_AsyncCountingClient, sdk.DefaultAsyncHttpxClient), {})
+        self.client = client_class(limits=self.limits, timeout=self.timeout)
+        self.client.http_pool = self
+        self.async_client = async_client_class(limits=self.limits, timeout=self.timeout)
+        self.async_client.http_pool = self
+
+    def _on_request(self) -> None:
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["in_flight"] += 1
+
+    def _on_response(self, failed: bool = False) -> None:
+        with self._lock:
+            self._counters["errors" if failed else "responses"] += 1
+            self._counters["in_flight"] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry
+        })
+        return counters
+
+class ResponseStream:
+    """テキスト差分を逐次返すストリーム（最初のトークンまでの時間などを計測）"""
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self.text = ""
+        self.started_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def __iter__(self) -> Iterator[str]:
+        self.started_at = time.perf_counter()
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.text += chunk
+            yield chunk
+        self.finished_at = time.perf_counter()
+
+    def metrics(self) -> Dict[str, Any]:
+        """TTFT・合計時間・文字数"""
+        return _stream_metrics(self)
+
+class AsyncResponseStream(ResponseStream):
+    """非同期版のレスポンスストリーム"""
+
+    def __init__(self, chunks: AsyncIterator[str]):
+        super().__init__(iter(()))
+        self._achunks = chunks
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        self.started_at = time.perf_counter()
+        async for chunk in self._achunks:
+            if not chunk:
+                continue
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.text += chunk
+            yield chunk
+        self.finished_at = time.perf_counter()
+
+def _stream_metrics(stream: ResponseStream) -> Dict[str, Any]:
+    def elapsed(end: Optional[float]) -> Optional[float]:
+        if stream.started_at is None or end is None:
+            return None
+        return end - stream.started_at
+
+    return {
+        "ttft": elapsed(stream.first_token_at),
+        "total_time": elapsed(stream.finished_at),
+        "chars": len(stream.text)
+    }
+
 class AIClient(ABC):
+    model: str = ""
+    provider: str = ""
+    max_tokens: int = 2000
+
     @abstractmethod
     def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
         pass
 
+    async def agenerate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """非同期版のレスポンス生成（既定ではスレッドで同期版を実行）"""
+        return await asyncio.to_thread(self.generate_response, prompt, system_prompt)
+
+    def stream_response(self, prompt: str, system_prompt: Optional[str] = None) -> ResponseStream:
+        """テキスト差分を逐次返すストリーミング生成"""
+        return ResponseStream(self._iter_chunks(prompt, system_prompt))
+
+    def astream_response(self, prompt: str, system_prompt: Optional[str] = None) -> AsyncResponseStream:
+        """非同期版のストリーミング生成"""
+        return AsyncResponseStream(self._aiter_chunks(prompt, system_prompt))
+
+    def _iter_chunks(self, prompt: str, system_prompt: Optional[str]) -> Iterator[str]:
+        # ストリーミング非対応のクライアントは全文を1チャンクで返す
+        yield self.generate_response(prompt, system_prompt)
+
+    async def _aiter_chunks(self, prompt: str, system_prompt: Optional[str]) -> AsyncIterator[str]:
+        yield await self.agenerate_response(prompt, system_prompt)
+
+    def estimate_request_tokens(self, prompt: str, system_prompt: Optional[str] = None) -> int:
+        """入力トークン数の概算と最大出力トークン数の合計"""
+        return estimate_tokens(system_prompt or DEFAULT_SYSTEM_PROMPT) + estimate_tokens(prompt) + self.max_tokens
+
+    def cache_key(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """モデル・最大トークン数・プロンプトからキャッシュキーを生成"""
+        payload = json.dumps(
+            [self.model, self.max_tokens, system_prompt or DEFAULT_SYSTEM_PROMPT, prompt],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
 class ClaudeClient(AIClient):
-    def __init__(self):
+    model = "claude-3-5-sonnet-20241022"
+    provider = "anthropic"
+
+    def __init__(self, http_pool: Optional[HTTPPool] = None):
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
-        self.client = anthropic.Anthropic(api_key=api_key)
-    
+        # リトライはRateLimitSchedulerで行うためSDK側では無効化
+        self.client = anthropic.Anthropic(
+            api_key=api_key,
+            max_retries=0,
+            http_client=http_pool.client if http_pool else None
+        )
+        self.async_client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            max_retries=0,
+            http_client=http_pool.async_client if http_pool else None
+        )
+        self.scheduler = get_rate_scheduler(self.provider)
+
+    def _request(self, prompt: str, system_prompt: Optional[str]) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "system": system_prompt or DEFAULT_SYSTEM_PROMPT,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+
+    def _record_usage(self, estimated: int, usage, span: Optional[Span] = None) -> None:
+        if usage is not None:
+            self.scheduler.record_usage(estimated, usage.input_tokens + usage.output_tokens)
+            if span is not None:
+                span.set(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+
     def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        try:
-            message = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=2000,
-                system=system_prompt or "You are a helpful assistant for job hunting support.",
-                messages=[{"role": "user", "content": prompt}]
-            )
+        estimated = self.estimate_request_tokens(prompt, system_prompt)
+
+        with get_tracer().span("llm", "llm", model=self.model, provider=self.provider, cache_hit=False) as span:
+            def call():
+                with get_provider_limiter(self.provider):
+                    span.dispatched()
+                    return self.client.messages.create(**self._request(prompt, system_prompt))
+
+            message = self.scheduler.call(call, estimated)
+            self._record_usage(estimated, message.usage, span)
             return message.content[0].text
-        except Exception as e:
-            return f"Error: {str(e)}"
+
+    async def agenerate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        estimated = self.estimate_request_tokens(prompt, system_prompt)
+
+        with get_tracer().span("llm", "llm", model=self.model, provider=self.provider, cache_hit=False) as span:
+            async def call():
+                async with get_provider_limiter(self.provider):
+                    span.dispatched()
+                    return await self.async_client.messages.create(**self._request(prompt, system_prompt))
+
+            message = await self.scheduler.acall(call, estimated)
+            self._record_usage(estimated, message.usage, span)
+            return message.content[0].text
+
+    def _iter_chunks(self, prompt: str, system_prompt: Optional[str]) -> Iterator[str]:
+        estimated = self.estimate_request_tokens(prompt, system_prompt)
+        span = get_tracer().start("llm", "llm", model=self.model, provider=self.provider, cache_hit=False, stream=True)
+
+        def open_stream():
+            with get_provider_limiter(self.provider):
+                span.dispatched()
+                with self.client.messages.stream(**self._request(prompt, system_prompt)) as stream:
+                    for text in stream.text_stream:
+                        yield text
+                    self._record_usage(estimated, stream.get_final_message().usage, span)
+
+        return traced_iter(span, self.scheduler.stream(open_stream, estimated))
+
+    def _aiter_chunks(self, prompt: str, system_prompt: Optional[str]) -> AsyncIterator[str]:
+        estimated = self.estimate_request_tokens(prompt, system_prompt)
+        span = get_tracer().start("llm", "llm", model=self.model, provider=self.provider, cache_hit=False, stream=True)
+
+        async def open_stream():
+            async with get_provider_limiter(self.provider):
+                span.dispatched()
+                async with self.async_client.messages.stream(**self._request(prompt, system_prompt)) as stream:
+                    async for text in stream.text_stream:
+                        yield text
+                    self._record_usage(estimated, (await stream.get_final_message()).usage, span)
+
+        return atraced_iter(span, self.scheduler.astream(open_stream, estimated))
 
 class OpenAIClient(AIClient):
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
+    model = "gpt-4"
+    provider = "openai"
+
+    def __init__(self, http_pool: Optional[HTTPPool] = None):
+        # リトライはRateLimitSchedulerで行うためSDK側では無効化
+        self.client = openai.OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            http_client=http_pool.client if http_pool else None
+        )
+        self.async_client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            http_client=http_pool.async_client if http_pool else None
+        )
+        self.scheduler = get_rate_scheduler(self.provider)
+
+    def _request(self, prompt: str, system_prompt: Optional[str]) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt or DEFAULT_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": self.max_tokens
+        }
+
+    def _record_usage(self, estimated: int, usage, span: Optional[Span] = None) -> None:
+        if usage is not None:
+            self.scheduler.record_usage(estimated, usage.total_tokens)
+            if span is not None:
+                span.set(input_tokens=usage.prompt_tokens, output_tokens=usage.completion_tokens)
+
     def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt or "You are a helpful assistant for job hunting support."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=2000
-            )
+        estimated = self.estimate_request_tokens(prompt, system_prompt)
+
+        with get_tracer().span("llm", "llm", model=self.model, provider=self.provider, cache_hit=False) as span:
+            def call():
+                with get_provider_limiter(self.provider):
+                    span.dispatched()
+                    return self.client.chat.completions.create(**self._request(prompt, system_prompt))
+
+            response = self.scheduler.call(call, estimated)
+            self._record_usage(estimated, response.usage, span)
+            return response.choices[0].message.content
+
+    async def agenerate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        estimated = self.estimate_request_tokens(prompt, system_prompt)
+
+        with get_tracer().span("llm", "llm", model=self.model, provider=self.provider, cache_hit=False) as span:
+            async def call():
+                async with get_provider_limiter(self.provider):
+                    span.dispatched()
+                    return await self.async_client.chat.completions.create(**self._request(prompt, system_prompt))
+
+            response = await self.scheduler.acall(call, estimated)
+            self._record_usage(estimated, response.usage, span)
             return response.choices[0].message.content
+
+    def _iter_chunks(self, prompt: str, system_prompt: Optional[str]) -> Iterator[str]:
+        estimated = self.estimate_request_tokens(prompt, system_prompt)
+        span = get_tracer().start("llm", "llm", model=self.model, provider=self.provider, cache_hit=False, stream=True)
+
+        def open_stream():
+            with get_provider_limiter(self.provider):
+                span.dispatched()
+                # 最後のチャンクでusageを受け取る
+                stream = self.client.chat.completions.create(
+                    **self._request(prompt, system_prompt), stream=True, stream_options={"include_usage": True}
+                )
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                    if chunk.usage is not None:
+                        self._record_usage(estimated, chunk.usage, span)
+
+        return traced_iter(span, self.scheduler.stream(open_stream, estimated))
+
+    def _aiter_chunks(self, prompt: str, system_prompt: Optional[str]) -> AsyncIterator[str]:
+        estimated = self.estimate_request_tokens(prompt, system_prompt)
+        span = get_tracer().start("llm", "llm", model=self.model, provider=self.provider, cache_hit=False, stream=True)
+
+        async def open_stream():
+            async with get_provider_limiter(self.provider):
+                span.dispatched()
+                stream = await self.async_client.chat.completions.create(
+                    **self._request(prompt, system_prompt), stream=True, stream_options={"include_usage": True}
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                    if chunk.usage is not None:
+                        self._record_usage(estimated, chunk.usage, span)
+
+        return atraced_iter(span, self.scheduler.astream(open_stream, estimated))
+
+class ResponseCache:
+    """SQLiteを使ったLLMレスポンスの永続キャッシュ（TTL・サイズ上限付きLRU）"""
+
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600, max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "bytes_served": 0, "bytes_written": 0, "evictions": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュからレスポンスを取得（期限切れは削除してミス扱い）"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, size, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+
+            response, size, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._counters["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._counters["hits"] += 1
+            self._counters["bytes_served"] += size
+            return response
+
+    def set(self, key: str, response: str) -> None:
+        """レスポンスを保存し、サイズ上限を超えた分を古い順に削除"""
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now)
+            )
+            self._counters["bytes_written"] += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """合計サイズが上限以下になるまで最終アクセスの古いエントリを削除"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        """キャッシュを全削除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミス・バイト数などの統計情報"""
+        with self._lock:
+            entries, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            counters = dict(self._counters)
+
+        lookups = counters["hits"] + counters["misses"]
+        counters.update({
+            "entries": entries,
+            "bytes_stored": stored_bytes,
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0
+        })
+        return counters
+
+class AIClientWrapper(AIClient):
+    """別のAIClientに処理を委譲するラッパーの基底クラス"""
+
+    def __init__(self, client: AIClient):
+        self.client = client
+        self.model = client.model
+        self.provider = client.provider
+        self.max_tokens = client.max_tokens
+
+    def cache_key(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        return self.client.cache_key(prompt, system_prompt)
+
+    def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        return self.client.generate_response(prompt, system_prompt)
+
+    async def agenerate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        return await self.client.agenerate_response(prompt, system_prompt)
+
+    def _iter_chunks(self, prompt: str, system_prompt: Optional[str]) -> Iterator[str]:
+        return iter(self.client.stream_response(prompt, system_prompt))
+
+    def _aiter_chunks(self, prompt: str, system_prompt: Optional[str]) -> AsyncIterator[str]:
+        return self.client.astream_response(prompt, system_prompt).__aiter__()
+
+class CachedAIClient(AIClientWrapper):
+    """任意のAIClientをラップしてレスポンスをキャッシュする"""
+
+    def __init__(self, client: AIClient, cache: ResponseCache):
+        super().__init__(client)
+        self.cache = cache
+
+    def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        key = self.cache_key(prompt, system_prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._record_hit()
+            return cached
+
+        response = self.client.generate_response(prompt, system_prompt)
+        self._store(key, response)
+        return response
+
+    async def agenerate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        key = self.cache_key(prompt, system_prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._record_hit()
+            return cached
+
+        response = await self.client.agenerate_response(prompt, system_prompt)
+        self._store(key, response)
+        return response
+
+    def _iter_chunks(self, prompt: str, system_prompt: Optional[str]) -> Iterator[str]:
+        key = self.cache_key(prompt, system_prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._record_hit()
+            yield cached
+            return
+
+        text = ""
+        for chunk in self.client.stream_response(prompt, system_prompt):
+            text += chunk
+            yield chunk
+        # 最後まで受信できた場合のみ保存する
+        self._store(key, text)
+
+    async def _aiter_chunks(self, prompt: str, system_prompt: Optional[str]) -> AsyncIterator[str]:
+        key = self.cache_key(prompt, system_prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._record_hit()
+            yield cached
+            return
+
+        text = ""
+        async for chunk in self.client.astream_response(prompt, system_prompt):
+            text += chunk
+            yield chunk
+        self._store(key, text)
+
+    def _store(self, key: str, response: str) -> None:
+        if response:
+            self.cache.set(key, response)
+
+    def _record_hit(self) -> None:
+        get_tracer().record("llm", "llm", model=self.model, provider=self.provider, cache_hit=True)
+
+class SingleFlight:
+    """同一キーで同時に実行中の処理を1回にまとめ、結果を全呼び出し元で共有する
+
+    実行担当が結果を出さずに終わった場合（ストリームが途中で破棄された・キャンセルされた場合）は、
+    合流した呼び出し元にリトライ可能なAIClientErrorを渡して各自で実行し直させる。
+    合流した呼び出し元が wait_timeout 秒待っても結果が出なければ、同様に自分で実行する。
+    """
+
+    def __init__(self, wait_timeout: Optional[float] = None):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._counters = {"leaders": 0, "coalesced": 0, "abandoned": 0, "timeouts": 0, "reissued": 0}
+
+    def join(self, key: str) -> Tuple[Future, bool]:
+        """実行中の呼び出しに合流する（戻り値の2番目が True なら自分が実行担当）"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self._counters["leaders"] += 1
+            return future, True
+
+    def finish(self, key: str, future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        """実行担当が結果（または例外）を待機中の呼び出し元に配布する"""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def abandon(self, key: str, future: Future) -> None:
+        """実行担当が結果を出さずに終わったことを、合流した呼び出し元に伝える"""
+        with self._lock:
+            self._counters["abandoned"] += 1
+        self.finish(key, future, error=AIClientError("合流した呼び出しが完了前に中断されました", retryable=True))
+
+    def wait(self, key: str, future: Future) -> Tuple[bool, Any]:
+        """合流した呼び出しの結果を待つ（戻り値の1番目が False なら自分で実行し直す）"""
+        try:
+            return True, future.result(timeout=self.wait_timeout)
+        except FutureTimeoutError:
+            self._reissue(key, future)
+        except AIClientError as e:
+            if not e.retryable:
+                raise
+            self._reissue(key, future)
+        return False, None
+
+    async def await_result(self, key: str, future: Future) -> Tuple[bool, Any]:
+        """wait() の非同期版（待っている側がキャンセルされても実行担当の結果には影響しない）"""
+        try:
+            return True, await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self._reissue(key, future)
+        except AIClientError as e:
+            if not e.retryable:
+                raise
+            self._reissue(key, future)
+        return False, None
+
+    def _reissue(self, key: str, future: Future) -> None:
+        with self._lock:
+            self._counters["reissued"] += 1
+            if not future.done():
+                # 応答のない実行担当には以降の呼び出しを合流させない
+                self._counters["timeouts"] += 1
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        future, leader = self.join(key)
+        if not leader:
+            done, result = self.wait(key, future)
+            return result if done else fn()
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        except BaseException:
+            self.abandon(key, future)
+            raise
+        self.finish(key, future, result=result)
+        return result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        future, leader = self.join(key)
+        if not leader:
+            done, result = await self.await_result(key, future)
+            return result if done else await fn()
+        try:
+            result = await fn()
         except Exception as e:
-            return f"Error: {str(e)}"
+            self.finish(key, future, error=e)
+            raise
+        except BaseException:
+            self.abandon(key, future)
+            raise
+        self.finish(key, future, result=result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+class SingleFlightAIClient(AIClientWrapper):
+    """同じプロンプトの同時リクエストを1回のAPI呼び出しにまとめるラッパー"""
+
+    def __init__(self, client: AIClient, group: Optional[SingleFlight] = None):
+        super().__init__(client)
+        self.group = group or SingleFlight()
+
+    def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        return self.group.do(
+            self.cache_key(prompt, system_prompt),
+            lambda: self.client.generate_response(prompt, system_prompt)
+        )
+
+    async def agenerate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        return await self.group.ado(
+            self.cache_key(prompt, system_prompt),
+            lambda: self.client.agenerate_response(prompt, system_prompt)
+        )
+
+    def _iter_chunks(self, prompt: str, system_prompt: Optional[str]) -> Iterator[str]:
+        key = self.cache_key(prompt, system_prompt)
+        future, leader = self.group.join(key)
+        if not leader:
+            # 合流した呼び出しは完成したテキストを1チャンクで受け取る
+            done, text = self.group.wait(key, future)
+            if done:
+                yield text
+            else:
+                yield from self.client.stream_response(prompt, system_prompt)
+            return
+
+        text = ""
+        try:
+            for chunk in self.client.stream_response(prompt, system_prompt):
+                text += chunk
+                yield chunk
+        except Exception as e:
+            self.group.finish(key, future, error=e)
+            raise
+        except BaseException:
+            # 読み手がストリームを途中で破棄した（GeneratorExit）場合など
+            self.group.abandon(key, future)
+            raise
+        self.group.finish(key, future, result=text)
+
+    async def _aiter_chunks(self, prompt: str, system_prompt: Optional[str]) -> AsyncIterator[str]:
+        key = self.cache_key(prompt, system_prompt)
+        future, leader = self.group.join(key)
+        if not leader:
+            done, text = await self.group.await_result(key, future)
+            if done:
+                yield text
+            else:
+                async for chunk in self.client.astream_response(prompt, system_prompt):
+                    yield chunk
+            return
+
+        text = ""
+        try:
+            async for chunk in self.client.astream_response(prompt, system_prompt):
+                text += chunk
+                yield chunk
+        except Exception as e:
+            self.group.finish(key, future, error=e)
+            raise
+        except BaseException:
+            self.group.abandon(key, future)
+            raise
+        self.group.finish(key, future, result=text)
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """環境変数の設定に従って共有レスポンスキャッシュを取得"""
+    global _response_cache
+    if os.getenv("AI_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                path=os.getenv("AI_CACHE_PATH", ".cache/ai_responses.db"),
+                ttl_seconds=float(os.getenv("AI_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+                max_bytes=int(float(os.getenv("AI_CACHE_MAX_MB", "100")) * 1024 * 1024)
+            )
+        return _response_cache
+
+class ClientRegistry:
+    """プロセス全体で共有するAIクライアントのレジストリ（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, AIClient] = {}
+        self._pools: Dict[str, HTTPPool] = {}
+        self._single_flight = SingleFlight(wait_timeout=float(os.getenv("AI_SINGLE_FLIGHT_TIMEOUT", "300")))
+        self._counters = {"lookups": 0, "clients_created": 0}
+
+    def get(self, model: str) -> AIClient:
+        with self._lock:
+            self._counters["lookups"] += 1
+            if model not in self._clients:
+                self._clients[model] = self._create(model)
+                self._counters["clients_created"] += 1
+            return self._clients[model]
+
+    def _create(self, model: str) -> AIClient:
+        if model in ("fake", "replay"):
+            from .fake_client import create_fake_client
+            # 自前処理のオーバーヘッド計測用なのでキャッシュ等のラッパーは付けない
+            return create_fake_client(strict=(model == "replay"))
+
+        if model == "claude":
+            client = ClaudeClient(self._pool("anthropic"))
+        elif model == "openai":
+            client = OpenAIClient(self._pool("openai"))
+        else:
+            raise ValueError(f"Unsupported model: {model}")
+
+        record_path = os.getenv("AI_RECORD_FIXTURES")
+        if record_path:
+            from .fake_client import RecordingAIClient, FixtureStore
+            client = RecordingAIClient(client, FixtureStore(record_path))
+
+        # キャッシュミス時の同時リクエストは1回にまとめる
+        client = SingleFlightAIClient(client, self._single_flight)
+
+        cache = get_response_cache()
+        if cache is not None:
+            return CachedAIClient(client, cache)
+        return client
+
+    def _pool(self, provider: str) -> HTTPPool:
+        if provider not in self._pools:
+            sdk = anthropic if provider == "anthropic" else openai
+            self._pools[provider] = HTTPPool(provider, sdk)
+        return self._pools[provider]
+
+    def stats(self) -> Dict[str, Any]:
+        """レジストリとコネクションプールの統計情報"""
+        with self._lock:
+            pools = dict(self._pools)
+            stats = dict(self._counters)
+        stats["pools"] = {provider: pool.stats() for provider, pool in pools.items()}
+        stats["limiters"] = {provider: get_provider_limiter(provider).stats() for provider in pools}
+        stats["rate_limits"] = {provider: get_rate_scheduler(provider).stats() for provider in pools}
+        stats["single_flight"] = self._single_flight.stats()
+        return stats
+
+_registry = ClientRegistry()
+
+def get_client_registry() -> ClientRegistry:
+    return _registry
 
 def get_ai_client(model: str = "claude") -> AIClient:
-    if model == "claude":
-        return ClaudeClient()
-    elif model == "openai":
-        return OpenAIClient()
-    else:
-        raise ValueError(f"Unsupported model: {model}")
\ No newline at end of file
+    return _registry.get(model)
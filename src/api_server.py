@@ -0,0 +1,419 @@
+"""分析機能とワークフローのステップをJSONで提供するHTTP APIサーバー
+
+    python -m src.api_server            # API_HOST / API_PORT / API_WORKERS で起動
+    uvicorn src.api_server:app --workers 4
+
+各エンドポイントは stream=true を指定すると、生成途中の結果を改行区切りのJSON（NDJSON）で返す。
+リクエストIDは X-Request-ID ヘッダーで受け取り（なければ生成）、レスポンスヘッダーとトレースに記録する。
+"""
+import os
+import json
+import uuid
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from .ai_client import ProviderLimiter, ResponseStream, get_client_registry
+from .company_analysis.analyzer import CompanyAnalyzer
+from .company_analysis.company_master import get_company_master
+from .artifact_store import get_analysis_artifact_store
+from .industry_matching.matcher import IndustryMatcher
+from .essay_generation.generator import EssayGenerator
+from .interview_prep.prep import InterviewPrep
+from .integrated_workflow import IntegratedWorkflow
+from .streaming_json import JSONEventStream
+from .tracing import get_tracer
+from .workflow_state import get_artifact_pool, get_idle_compactor
+
+logger = logging.getLogger(__name__)
+
+class RequestLimiter:
+    """プロセス内で同時に処理するリクエスト数の上限（待ち時間が長すぎるリクエストは拒否する）
+
+    枠の管理はイベントループをまたいで使えるProviderLimiterに任せる。
+    """
+
+    def __init__(self, limit: int, queue_timeout: float):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._slots = ProviderLimiter(limit)
+        self._lock = threading.Lock()
+        self._counters = {"accepted": 0, "rejected": 0}
+
+    async def acquire(self) -> bool:
+        try:
+            await asyncio.wait_for(self._slots.aacquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._counters["rejected"] += 1
+            return False
+        with self._lock:
+            self._counters["accepted"] += 1
+        return True
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {"queue_timeout": self.queue_timeout, **self._slots.stats(), **counters}
+
+class RequestContextMiddleware:
+    """リクエストIDの付与とリクエスト単位のトレース（ストリーミングの送信完了までを1スパンとする）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+        status = {"code": None}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers") or []) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        started = time.perf_counter()
+        with get_tracer().span("request", "request", request_id=request_id, method=scope["method"],
+                               path=scope["path"]) as span:
+            await self.app(scope, receive, send_with_id)
+            span.set(status=status["code"])
+        logger.info("%s %s %s %.3fs request_id=%s", scope["method"], scope["path"], status["code"],
+                    time.perf_counter() - started, request_id)
+
+app = FastAPI(title="就活AIコンパス API", version="1.0.0")
+app.add_middleware(RequestContextMiddleware)
+
+limiter = RequestLimiter(
+    limit=int(os.getenv("API_MAX_CONCURRENCY", "16")),
+    queue_timeout=float(os.getenv("API_QUEUE_TIMEOUT", "30"))
+)
+
+DEFAULT_MODEL = os.getenv("API_AI_MODEL", "claude")
+
+# 同じセッションのワークフローを同時に更新しないためのロック（セッションキー -> [ロック, 使用中の数]）
+_session_locks: Dict[str, List[Any]] = {}
+_session_locks_lock = threading.Lock()
+
+@contextmanager
+def _session_lock(session_key: str) -> Iterator[None]:
+    """セッション単位の排他（使用中・待機中のリクエストがなくなったらロックを破棄する）"""
+    with _session_locks_lock:
+        entry = _session_locks.setdefault(session_key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _session_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _session_locks[session_key]
+
+class AIRequest(BaseModel):
+    model: Optional[str] = None
+
+class CompanyRequest(AIRequest):
+    company_name: str
+
+class ProfileRequest(AIRequest):
+    user_profile: Dict[str, Any]
+
+class MotivationTemplateRequest(AIRequest):
+    industry_name: str
+    user_strengths: List[str] = Field(default_factory=list)
+
+class SelfPRRequest(AIRequest):
+    user_info: Dict[str, Any]
+    target_company: Optional[str] = None
+
+class ImproveEssayRequest(AIRequest):
+    essay_text: str
+    essay_type: str = "自己PR"
+
+class MotivationLetterRequest(AIRequest):
+    company_info: Dict[str, Any]
+    user_info: Dict[str, Any]
+
+class QuestionsRequest(AIRequest):
+    company_name: str
+    industry: str = ""
+    job_type: str = "総合職"
+
+class AnswerTemplateRequest(AIRequest):
+    question: str
+    user_profile: Dict[str, Any]
+
+class MockInterviewRequest(AIRequest):
+    questions: List[str]
+    user_answers: List[str]
+
+class WorkflowRunRequest(AIRequest):
+    company_name: str
+    user_info: Dict[str, Any]
+    steps: Optional[List[str]] = None
+    session_key: Optional[str] = None
+
+class WorkflowStepRequest(AIRequest):
+    company_name: Optional[str] = None
+    user_info: Optional[Dict[str, Any]] = None
+
+def _model(request: AIRequest) -> str:
+    return request.model or DEFAULT_MODEL
+
+async def _call(fn: Callable[..., Any], *args: Any) -> Any:
+    """同時実行数の枠内で分析処理をスレッドで実行（トレースのコンテキストは引き継がれる）"""
+    if not await limiter.acquire():
+        raise HTTPException(status_code=503, detail="サーバーが混み合っています", headers={"Retry-After": "5"})
+    try:
+        return await asyncio.to_thread(fn, *args)
+    finally:
+        limiter.release()
+
+def _respond(result: Any) -> Any:
+    """分析結果を返す（status=errorの結果は502として返す）"""
+    if isinstance(result, dict) and result.get("status") == "error":
+        return JSONResponse(result, status_code=502)
+    return result
+
+async def _call_value(key: str, fn: Callable[..., Any], *args: Any) -> Any:
+    """文字列・リストを返す分析処理を実行し、結果を key に入れて返す（失敗はstatus=errorの502として返す）"""
+    try:
+        value = await _call(fn, *args)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.warning("%s failed: %s", getattr(fn, "__name__", fn), e)
+        return _respond({"error": str(e), "status": "error"})
+    return {"status": "success", key: value}
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+async def _stream(events: Callable[[], Iterator[Dict[str, Any]]]) -> StreamingResponse:
+    """イベントを生成する関数をスレッドで実行し、NDJSONとして逐次返す
+
+    同時実行数の枠はストリームを送り終えるまで保持する。
+    """
+    if not await limiter.acquire():
+        raise HTTPException(status_code=503, detail="サーバーが混み合っています", headers={"Retry-After": "5"})
+
+    async def body() -> AsyncIterator[bytes]:
+        sentinel = object()
+        try:
+            iterator = await asyncio.to_thread(events)
+            while True:
+                event = await asyncio.to_thread(next, iterator, sentinel)
+                if event is sentinel:
+                    break
+                yield _ndjson(event)
+        except Exception as e:
+            logger.warning("stream failed: %s", e)
+            yield _ndjson({"type": "error", "error": str(e)})
+        finally:
+            limiter.release()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+def text_events(open_stream: Callable[[], ResponseStream],
+                finish: Callable[[str], Any] = lambda text: text) -> Iterator[Dict[str, Any]]:
+    """テキストストリームを delta イベントと最後の done イベントに変換"""
+    stream = open_stream()
+    for chunk in stream:
+        yield {"type": "delta", "text": chunk}
+    yield {"type": "done", "result": finish(stream.text), "metrics": stream.metrics()}
+
+def json_events(open_stream: Callable[[], JSONEventStream]) -> Iterator[Dict[str, Any]]:
+    """JSONの確定した項目を event イベントとして返し、最後に検証済みの結果を done で返す"""
+    events = open_stream()
+    for path, value in events:
+        yield {"type": "event", "path": list(path), "value": value}
+    yield {"type": "done", "result": events.result}
+
+def item_events(open_items: Callable[[], Iterator[Any]]) -> Iterator[Dict[str, Any]]:
+    items = []
+    for item in open_items():
+        items.append(item)
+        yield {"type": "item", "value": item}
+    yield {"type": "done", "result": items}
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/stats")
+async def stats():
+    """同時実行数の状況とAIクライアントの統計"""
+    compactor = get_idle_compactor()
+    artifacts = get_analysis_artifact_store()
+    return {
+        "requests": limiter.stats(),
+        "ai_clients": get_client_registry().stats(),
+        "shared_artifacts": get_artifact_pool().stats(),
+        "idle_compaction": compactor.stats() if compactor else None,
+        "analysis_artifacts": artifacts.stats() if artifacts else None
+    }
+
+@app.get("/company/suggest")
+async def company_suggest(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    """企業名の入力補完（企業マスタの前方一致・類似した名称）"""
+    return {"status": "success", "companies": [record.to_dict() for record in get_company_master().suggest(q, limit)]}
+
+@app.post("/company/analyze")
+async def analyze_company(request: CompanyRequest, stream: bool = Query(False)):
+    analyzer = CompanyAnalyzer(_model(request))
+    if stream:
+        def events():
+            result, text_stream = analyzer.stream_analysis(request.company_name)
+            return text_events(lambda: text_stream, lambda text: {**result, "ai_analysis": text})
+        return await _stream(events)
+    return _respond(await _call(analyzer.analyze, request.company_name))
+
+@app.post("/company/interview-points")
+async def company_interview_points(request: CompanyRequest):
+    analyzer = CompanyAnalyzer(_model(request))
+    return await _call_value("points", analyzer.get_interview_points, request.company_name)
+
+@app.post("/industry/fit")
+async def industry_fit(request: ProfileRequest, stream: bool = Query(False)):
+    matcher = IndustryMatcher(_model(request))
+    if stream:
+        return await _stream(lambda: json_events(lambda: matcher.stream_fit(request.user_profile)))
+    return _respond(await _call(matcher.analyze_fit, request.user_profile))
+
+@app.get("/industry/{industry_name}")
+async def industry_info(industry_name: str, model: Optional[str] = None):
+    matcher = IndustryMatcher(model or DEFAULT_MODEL)
+    return _respond(await _call(matcher.get_industry_info, industry_name))
+
+@app.post("/industry/motivation-template")
+async def industry_motivation_template(request: MotivationTemplateRequest):
+    matcher = IndustryMatcher(_model(request))
+    return await _call_value("template", matcher.generate_motivation_template, request.industry_name,
+                             request.user_strengths)
+
+@app.post("/essay/self-pr")
+async def essay_self_pr(request: SelfPRRequest, stream: bool = Query(False)):
+    generator = EssayGenerator(_model(request))
+    if stream:
+        return await _stream(lambda: text_events(
+            lambda: generator.stream_self_pr(request.user_info, request.target_company),
+            lambda text: {"self_pr": text, "status": "success"}
+        ))
+    return _respond(await _call(generator.generate_self_pr, request.user_info, request.target_company))
+
+@app.post("/essay/improve")
+async def essay_improve(request: ImproveEssayRequest, stream: bool = Query(False)):
+    generator = EssayGenerator(_model(request))
+    if stream:
+        return await _stream(lambda: json_events(
+            lambda: generator.stream_improve_essay(request.essay_text, request.essay_type)
+        ))
+    return _respond(await _call(generator.improve_essay, request.essay_text, request.essay_type))
+
+@app.post("/essay/motivation")
+async def essay_motivation(request: MotivationLetterRequest, stream: bool = Query(False)):
+    generator = EssayGenerator(_model(request))
+    if stream:
+        return await _stream(lambda: text_events(
+            lambda: generator.stream_motivation_letter(request.company_info, request.user_info),
+            lambda text: {"motivation_letter": text, "status": "success"}
+        ))
+    return await _call_value("motivation_letter", generator.generate_motivation_letter, request.company_info,
+                             request.user_info)
+
+@app.get("/essay/templates")
+async def essay_templates():
+    return EssayGenerator(DEFAULT_MODEL).get_essay_templates()
+
+@app.post("/interview/questions")
+async def interview_questions(request: QuestionsRequest, stream: bool = Query(False)):
+    prep = InterviewPrep(_model(request))
+    if stream:
+        return await _stream(lambda: item_events(
+            lambda: prep.stream_questions(request.company_name, request.industry, request.job_type)
+        ))
+    questions = await _call(prep.generate_questions, request.company_name, request.industry, request.job_type)
+    return {"status": "success", "questions": questions}
+
+@app.post("/interview/answer-template")
+async def interview_answer_template(request: AnswerTemplateRequest):
+    prep = InterviewPrep(_model(request))
+    return _respond(await _call(prep.generate_answer_template, request.question, request.user_profile))
+
+@app.post("/interview/mock")
+async def interview_mock(request: MockInterviewRequest):
+    if len(request.questions) != len(request.user_answers):
+        raise HTTPException(status_code=422, detail="質問と回答の数が一致しません")
+    prep = InterviewPrep(_model(request))
+    return _respond(await _call(prep.mock_interview_session, request.questions, request.user_answers))
+
+@app.post("/workflow/run")
+async def workflow_run(request: WorkflowRunRequest):
+    """統合ワークフローを一括実行（session_keyを指定すると結果をチェックポイントとして保存）"""
+    def run():
+        workflow = IntegratedWorkflow(_model(request), session_key=request.session_key)
+        return workflow.run_full_analysis(request.company_name, request.user_info, steps=request.steps)
+
+    if request.session_key:
+        def run_locked():
+            with _session_lock(request.session_key):
+                return run()
+        return _respond(await _call(run_locked))
+    return _respond(await _call(run))
+
+# セッションのワークフローで1ステップずつ実行する場合のステップ名と処理
+WORKFLOW_STEPS: Dict[str, Callable[[IntegratedWorkflow, WorkflowStepRequest], Dict[str, Any]]] = {
+    "company": lambda workflow, request: workflow.start_workflow(request.company_name or ""),
+    "user-personality": lambda workflow, request: workflow.define_user_personality(request.user_info),
+    "gap": lambda workflow, request: workflow.analyze_personality_gap(),
+    "essays": lambda workflow, request: workflow.generate_tailored_essays(),
+    "interview": lambda workflow, request: workflow.prepare_interview_strategy()
+}
+
+@app.get("/workflow/sessions/{session_key}")
+async def workflow_session(session_key: str, model: Optional[str] = None):
+    """保存済みのワークフローの結果と次に実行するステップ"""
+    def load():
+        workflow = IntegratedWorkflow(model or DEFAULT_MODEL, session_key=session_key)
+        return {**workflow.get_complete_workflow_summary(), "current_step": workflow.current_step()}
+    return await _call(load)
+
+@app.post("/workflow/sessions/{session_key}/{step}")
+async def workflow_step(session_key: str, step: str, request: WorkflowStepRequest):
+    """セッションのワークフローでステップを1つ実行（前のステップの結果はチェックポイントから復元）"""
+    if step not in WORKFLOW_STEPS:
+        raise HTTPException(status_code=404, detail=f"Unknown workflow step: {step}")
+
+    def run():
+        with _session_lock(session_key):
+            workflow = IntegratedWorkflow(_model(request), session_key=session_key)
+            return WORKFLOW_STEPS[step](workflow, request)
+    return _respond(await _call(run))
+
+def main() -> None:
+    import uvicorn
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    uvicorn.run(
+        "src.api_server:app",
+        host=os.getenv("API_HOST", "127.0.0.1"),
+        port=int(os.getenv("API_PORT", "8000")),
+        workers=int(os.getenv("API_WORKERS", "1"))
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+def fingerprint(*inputs: Any) -> str:
+    """分析の入力のフィンガープリント（内容が同じなら同じ値）"""
+    data = json.dumps(inputs, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+class Artifact:
+    """保存された分析結果（入力のフィンガープリント・プロンプトのバージョン・モデル・作成日時付き）"""
+
+    __slots__ = ("artifact_id", "kind", "subject", "fingerprint", "prompt_version", "model", "data", "created_at")
+
+    def __init__(self, artifact_id: int, kind: str, subject: str, fingerprint: str, prompt_version: int,
+                 model: str, data: Any, created_at: float):
+        self.artifact_id = artifact_id
+        self.kind = kind
+        self.subject = subject
+        self.fingerprint = fingerprint
+        self.prompt_version = prompt_version
+        self.model = model
+        self.data = data
+        self.created_at = created_at
+
+    def metadata(self) -> Dict[str, Any]:
+        """結果に添付する出典情報（再利用した場合も新規に保存した場合も同じ内容）"""
+        return {
+            "artifact_id": self.artifact_id,
+            "fingerprint": self.fingerprint,
+            "prompt_version": self.prompt_version,
+            "model": self.model,
+            "created_at": self.created_at
+        }
+
+class AnalysisArtifactStore:
+    """企業分析などの結果を入力のフィンガープリントとプロンプトのバージョンごとに保存するストア
+
+    入力・プロンプト・モデルが同じ分析は保存済みの結果を返し、想定質問や求める人物像のような
+    派生する処理は保存済みの企業分析を使うことで、同じ分析のLLM呼び出しを繰り返さない。
+    プロンプトを変更した場合はバージョンを上げれば古い結果は使われなくなる（有効期限まで履歴として残る）。
+    保存時に、有効期限切れの結果と同じ条件で置き換えられた結果を削除し、企業ごとの履歴も
+    HISTORY_LIMIT 件までに抑える。
+    """
+
+    # 種類・対象ごとに保持する結果の件数
+    HISTORY_LIMIT = 20
+
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "saved": 0, "pruned": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS artifacts (
+                artifact_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                prompt_version INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_artifacts_lookup
+            ON artifacts (kind, subject, fingerprint, prompt_version, model, created_at)
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_created ON artifacts (created_at)")
+        self._conn.commit()
+
+    def get(self, kind: str, subject: str, fingerprint: str, prompt_version: int, model: str) -> Optional[Artifact]:
+        """条件に一致する最新の結果（有効期限切れ・未保存ならNone）"""
+        min_created_at = time.time() - self.ttl_seconds if self.ttl_seconds else 0
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT artifact_id, data, created_at FROM artifacts
+                   WHERE kind = ? AND subject = ? AND fingerprint = ? AND prompt_version = ? AND model = ?
+                     AND created_at >= ?
+                   ORDER BY created_at DESC LIMIT 1""",
+                (kind, subject, fingerprint, prompt_version, model, min_created_at)
+            ).fetchone()
+            self._counters["hits" if row is not None else "misses"] += 1
+        if row is None:
+            return None
+        artifact_id, data, created_at = row
+        return Artifact(artifact_id, kind, subject, fingerprint, prompt_version, model, json.loads(data), created_at)
+
+    def put(self, kind: str, subject: str, fingerprint: str, prompt_version: int, model: str, data: Any) -> Artifact:
+        created_at = time.time()
+        serialized = json.dumps(data, ensure_ascii=False, default=str)
+        with self._lock:
+            cursor = self._conn.execute(
+                """INSERT INTO artifacts (kind, subject, fingerprint, prompt_version, model, data, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (kind, subject, fingerprint, prompt_version, model, serialized, created_at)
+            )
+            self._counters["pruned"] += self._prune(cursor.lastrowid, kind, subject, fingerprint, prompt_version,
+                                                    model, created_at)
+            self._conn.commit()
+            self._counters["saved"] += 1
+        return Artifact(cursor.lastrowid, kind, subject, fingerprint, prompt_version, model, data, created_at)
+
+    def _prune(self, artifact_id: int, kind: str, subject: str, fingerprint: str, prompt_version: int,
+               model: str, created_at: float) -> int:
+        """保存した結果で不要になった行を削除し、削除件数を返す（ロックの中で呼び出す）"""
+        # 同じ条件の古い結果は get() で返されることがないため置き換える
+        deleted = self._conn.execute(
+            """DELETE FROM artifacts
+               WHERE kind = ? AND subject = ? AND fingerprint = ? AND prompt_version = ? AND model = ?
+                 AND artifact_id != ?""",
+            (kind, subject, fingerprint, prompt_version, model, artifact_id)
+        ).rowcount
+        if self.ttl_seconds:
+            deleted += self._conn.execute(
+                "DELETE FROM artifacts WHERE created_at < ?", (created_at - self.ttl_seconds,)
+            ).rowcount
+        deleted += self._conn.execute(
+            """DELETE FROM artifacts WHERE kind = ? AND subject = ? AND artifact_id NOT IN
+                 (SELECT artifact_id FROM artifacts WHERE kind = ? AND subject = ?
+                  ORDER BY created_at DESC LIMIT ?)""",
+            (kind, subject, kind, subject, self.HISTORY_LIMIT)
+        ).rowcount
+        return deleted
+
+    def history(self, kind: str, subject: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """保存された結果の履歴（新しい順、本文を除く）"""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT artifact_id, fingerprint, prompt_version, model, created_at FROM artifacts
+                   WHERE kind = ? AND subject = ? ORDER BY created_at DESC LIMIT ?""",
+                (kind, subject, limit)
+            ).fetchall()
+        return [dict(zip(("artifact_id", "fingerprint", "prompt_version", "model", "created_at"), row))
+                for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["artifacts"] = self._conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+        return stats
+
+_artifact_store: Optional[AnalysisArtifactStore] = None
+_artifact_store_lock = threading.Lock()
+
+def get_analysis_artifact_store() -> Optional[AnalysisArtifactStore]:
+    """環境変数の設定に従って共有の分析結果ストアを取得（ARTIFACT_STORE_PATH が空なら無効）"""
+    global _artifact_store
+    path = os.getenv("ARTIFACT_STORE_PATH", ".cache/analysis_artifacts.db")
+    if not path:
+        return None
+
+    with _artifact_store_lock:
+        if _artifact_store is None:
+            _artifact_store = AnalysisArtifactStore(
+                path,
+                ttl_seconds=float(os.getenv("ARTIFACT_TTL_SECONDS", str(7 * 24 * 3600)))
+            )
+        return _artifact_store
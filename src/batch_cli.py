@@ -0,0 +1,302 @@
+"""学生×企業の組み合わせを一括で分析するコマンドラインツール
+
+    python -m src.batch_cli students.csv companies.csv -o results.jsonl
+
+学生プロフィールと対象企業をCSV/JSONLから読み込み、組み合わせごとに統合ワークフローを実行して
+結果をJSONLに1行ずつ追記する。途中で停止しても、同じ出力ファイルを指定して再実行すれば
+成功済みの組み合わせを飛ばして続きから処理する。
+"""
+import os
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from .ai_client import get_client_registry
+from .batch_workflow import BATCH_STEPS, parse_fit_score
+from .company_analysis.company_master import get_company_master
+from .integrated_workflow import IntegratedWorkflow
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# プロフィールの項目（Streamlitのプロフィール設定と同じ）
+PROFILE_FIELDS = [
+    "name", "university", "graduation_year", "club_activities", "part_time_job", "internship",
+    "gakuchika", "strengths", "values", "career_goals", "target_industries", "job_types"
+]
+
+def read_records(path: str) -> List[Dict[str, Any]]:
+    """CSV / JSONL ファイルを辞書のリストとして読み込む（拡張子で判定）"""
+    if path.endswith(".jsonl") or path.endswith(".ndjson"):
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return [dict(row) for row in csv.DictReader(f)]
+
+def load_students(path: str) -> List[Tuple[str, Dict[str, Any], List[str]]]:
+    """学生ごとの (ID, ユーザー情報, 個別の対象企業) を読み込む
+
+    IDは student_id / id 列（なければ行番号）。companies 列があれば
+    「;」区切りの企業名をその学生だけの対象企業とする。
+    """
+    students = []
+    for index, record in enumerate(read_records(path), 1):
+        student_id = str(record.get("student_id") or record.get("id") or f"row-{index}")
+        user_info = {field: _text(record.get(field)) for field in PROFILE_FIELDS}
+        companies = record.get("companies") or []
+        if isinstance(companies, str):
+            companies = companies.split(";")
+        students.append((student_id, user_info, [name.strip() for name in companies if name and name.strip()]))
+    return students
+
+def load_companies(path: str) -> List[str]:
+    """対象企業名を読み込む（company_name / name 列、またはテキストファイルの1行1社）"""
+    if path.endswith(".txt"):
+        with open(path, encoding="utf-8") as f:
+            names = [line.strip() for line in f]
+    else:
+        names = [_text(record.get("company_name") or record.get("name")) for record in read_records(path)]
+    return list(dict.fromkeys(name for name in names if name))
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    return str(value).strip()
+
+class ResultWriter:
+    """結果をJSONLに1件ずつ追記し、再実行時に成功済みの組み合わせを判定する"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._repair_tail()
+
+    def _repair_tail(self) -> None:
+        """書き込み途中で停止した最後の行を切り詰める"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+                logger.warning("truncated incomplete last line in %s", self.path)
+
+    def completed(self) -> Set[Tuple[str, str]]:
+        """成功済みの (学生ID, 企業名)"""
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("status") == "success":
+                    done.add((record["student_id"], record["company_name"]))
+        return done
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+class CohortRunner:
+    """学生×企業の組み合わせを上限付きのワーカーで並行実行する
+
+    学生ごとのパーソナリティ定義は最初の組み合わせで一度だけ計算し、同じ学生の他の企業で再利用する。
+    定義を持つワークフローはその学生の最後の組み合わせが終わった時点で手放す。
+    LLM呼び出しはプロセス内で共有するプロバイダごとの同時実行数・レート制限に従うため、
+    ワーカーはプロセスではなくスレッドで並行させる。
+    """
+
+    def __init__(self, ai_model: str = "claude", max_workers: Optional[int] = None,
+                 steps: Optional[List[str]] = None):
+        self.ai_model = ai_model
+        self.max_workers = max_workers or int(os.getenv("BATCH_MAX_WORKERS", "4"))
+        self.steps = steps or BATCH_STEPS
+        self._lock = threading.Lock()
+        self._bases: Dict[str, Future] = {}
+        # 学生ごとの未完了の組み合わせ数（0になったらユーザー側のワークフローを手放す）
+        self._pending: Counter = Counter()
+
+    def pairs(self, students: List[Tuple[str, Dict[str, Any], List[str]]],
+              companies: List[str]) -> Iterator[Tuple[str, Dict[str, Any], str]]:
+        # 企業名は企業マスタの正式名称にそろえ、表記ゆれによる重複と再実行時の取りこぼしを防ぐ
+        master = get_company_master()
+        for student_id, user_info, own_companies in students:
+            for company_name in dict.fromkeys(master.canonical_name(name) for name in own_companies or companies):
+                yield student_id, user_info, company_name
+
+    def run(self, students: List[Tuple[str, Dict[str, Any], List[str]]], companies: List[str],
+            writer: ResultWriter) -> Dict[str, Any]:
+        started_at = time.perf_counter()
+        done = writer.completed()
+        pairs = list(self.pairs(students, companies))
+        todo = [pair for pair in pairs if (pair[0], pair[2]) not in done]
+        with self._lock:
+            self._pending.update(student_id for student_id, _, _ in todo)
+        logger.info("%d pairs (%d already done), %d workers", len(pairs), len(pairs) - len(todo), self.max_workers)
+
+        counts = {"succeeded": 0, "failed": 0}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cohort") as pool:
+            futures = {
+                pool.submit(contextvars.copy_context().run, self._analyze, student_id, user_info, company_name):
+                    (student_id, company_name)
+                for student_id, user_info, company_name in todo
+            }
+            for future in as_completed(futures):
+                record = future.result()
+                writer.write(record)
+                counts["succeeded" if record["status"] == "success" else "failed"] += 1
+                finished = counts["succeeded"] + counts["failed"]
+                if finished % 10 == 0 or finished == len(todo):
+                    logger.info("%d/%d pairs finished (%d failed)", finished, len(todo), counts["failed"])
+
+        wall_time = time.perf_counter() - started_at
+        processed = counts["succeeded"] + counts["failed"]
+        return {
+            "pairs": len(pairs),
+            "skipped": len(pairs) - len(todo),
+            **counts,
+            "wall_time": round(wall_time, 3),
+            "pairs_per_hour": round(processed / wall_time * 3600, 1) if wall_time > 0 else None,
+            "max_workers": self.max_workers,
+            "providers": provider_report(wall_time)
+        }
+
+    def _base(self, student_id: str, user_info: Dict[str, Any], retry: bool = True) -> IntegratedWorkflow:
+        """学生ごとのユーザー側の結果を持つワークフロー（同時に要求された場合は1回だけ計算）
+
+        計算に失敗すると、その計算を待っていた組み合わせにも同じ例外が伝わる。
+        待っていた側は一度だけ自分で計算し直し、それ以降の組み合わせは改めて計算する。
+        """
+        with self._lock:
+            future = self._bases.get(student_id)
+            leader = future is None
+            if leader:
+                future = self._bases[student_id] = Future()
+
+        if leader:
+            try:
+                base = IntegratedWorkflow(self.ai_model)
+                result = base.run_full_analysis(None, user_info, steps=["user_personality"])
+                if result.get("status") != "success":
+                    raise RuntimeError(result.get("error", "パーソナリティ分析に失敗しました"))
+            except Exception as e:
+                # 失敗した場合は次の組み合わせで再計算させる
+                with self._lock:
+                    if self._bases.get(student_id) is future:
+                        del self._bases[student_id]
+                future.set_exception(e)
+                raise
+            future.set_result(base)
+            return base
+
+        try:
+            return future.result()
+        except Exception:
+            if not retry:
+                raise
+            return self._base(student_id, user_info, retry=False)
+
+    def _release(self, student_id: str) -> None:
+        """組み合わせの完了を記録し、学生の最後の組み合わせならユーザー側のワークフローを手放す"""
+        with self._lock:
+            self._pending[student_id] -= 1
+            if self._pending[student_id] <= 0:
+                del self._pending[student_id]
+                self._bases.pop(student_id, None)
+
+    def _analyze(self, student_id: str, user_info: Dict[str, Any], company_name: str) -> Dict[str, Any]:
+        """1組分のワークフローを実行して出力用のレコードを返す"""
+        record = {"student_id": student_id, "company_name": company_name}
+        try:
+            with get_tracer().span("cohort_pair", "batch", student_id=student_id, company_name=company_name):
+                workflow = IntegratedWorkflow(self.ai_model)
+                workflow.adopt_user_results(self._base(student_id, user_info))
+                result = workflow.run_full_analysis(company_name, user_info, steps=self.steps)
+        except Exception as e:
+            logger.warning("pair %s / %s failed: %s", student_id, company_name, e)
+            return {**record, "status": "error", "error": str(e), "finished_at": time.time()}
+        finally:
+            self._release(student_id)
+
+        gap_analysis = (result.get("workflow_summary") or {}).get("gap_analysis") or {}
+        return {
+            **record,
+            "status": result.get("status"),
+            "error": result.get("error"),
+            "overall_fit_score": parse_fit_score(gap_analysis.get("overall_fit_score")),
+            "workflow_summary": result.get("workflow_summary"),
+            "execution_report": result.get("execution_report"),
+            "finished_at": time.time()
+        }
+
+def provider_report(wall_time: float) -> Dict[str, Any]:
+    """プロバイダごとの同時実行数・レート制限の遵守状況"""
+    stats = get_client_registry().stats()
+    report = {}
+    for provider, limiter in stats["limiters"].items():
+        rate = stats["rate_limits"].get(provider, {})
+        calls = rate.get("calls", 0)
+        report[provider] = {
+            "concurrency_limit": limiter["limit"],
+            "peak_concurrency": limiter["peak"],
+            "within_concurrency_limit": limiter["peak"] <= limiter["limit"],
+            "rpm_limit": rate.get("rpm"),
+            "average_rpm": round(calls / wall_time * 60, 1) if wall_time > 0 else None,
+            "calls": calls,
+            "retries": rate.get("retries", 0),
+            "failures": rate.get("failures", 0),
+            "queued_seconds": round(rate.get("queued_seconds", 0.0), 1)
+        }
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="学生×企業の統合ワークフローを一括実行してJSONLに出力します")
+    parser.add_argument("students", help="学生プロフィールのCSV / JSONL")
+    parser.add_argument("companies", nargs="?", help="対象企業のCSV / JSONL / TXT（学生ごとのcompanies列があれば省略可）")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="結果を追記するJSONL（再実行時は続きから処理）")
+    parser.add_argument("--model", default="claude", help="claude / openai / fake")
+    parser.add_argument("--workers", type=int, default=None, help="同時に処理する組み合わせ数（既定: BATCH_MAX_WORKERS）")
+    parser.add_argument("--steps", default=",".join(BATCH_STEPS), help="実行する最終ステップ（カンマ区切り）")
+    parser.add_argument("--report", default=None, help="スループット等のレポートを保存するJSONファイル")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    students = load_students(args.students)
+    companies = load_companies(args.companies) if args.companies else []
+    if not students:
+        parser.error("学生プロフィールが1件もありません")
+    if not companies and not all(own for _, _, own in students):
+        parser.error("対象企業を指定してください")
+
+    runner = CohortRunner(args.model, args.workers, [step.strip() for step in args.steps.split(",") if step.strip()])
+    report = runner.run(students, companies, ResultWriter(args.output))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0 if report["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
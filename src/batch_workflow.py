@@ -0,0 +1,117 @@
+import os
+import re
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+from .integrated_workflow import IntegratedWorkflow
+from .company_analysis.company_master import get_company_master
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# 複数企業の分析で実行するステップ（面接対策は企業を絞り込んだ後に個別に実行する）
+BATCH_STEPS = ["gap_analysis", "self_pr", "motivation"]
+
+def parse_fit_score(value: Any) -> Optional[float]:
+    """"70" / 70 / "70点" / "70/100" などの表記から適合度スコアを取り出す"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = re.search(r"\d+(?:\.\d+)?", value)
+        if match:
+            return float(match.group())
+    return None
+
+class BatchWorkflow:
+    """複数企業の統合ワークフローを一括実行し、適合度スコア順にまとめる
+
+    ユーザーのパーソナリティ定義は企業に依存しないため一度だけ計算し、
+    企業ごとの分析（企業分析・求める人物像・ギャップ分析・ES）を上限付きのワーカーで並行実行する。
+    """
+
+    def __init__(self, ai_model: str = "claude", max_workers: Optional[int] = None):
+        self.ai_model = ai_model
+        self.max_workers = max_workers or int(os.getenv("BATCH_MAX_WORKERS", "4"))
+
+    def run(self, company_names: List[str], user_info: Dict[str, Any],
+            steps: Optional[List[str]] = None,
+            progress: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """企業ごとの分析を並行実行し、overall_fit_score順のランキングを返す
+
+        progressは企業ごとの分析が完了するたびに (企業名, 結果) で呼び出される。
+        """
+        started_at = time.perf_counter()
+        # 表記ゆれで同じ企業を重複して分析しないよう、企業マスタと完全一致する企業名は正式名称にそろえる
+        # （似た名称の別企業はそのまま残し、ランキングから黙って消えないようにする）
+        master = get_company_master()
+        companies = list(dict.fromkeys(master.canonical_name(name) for name in company_names if name and name.strip()))
+        if not companies:
+            return {"status": "error", "error": "企業名を1つ以上入力してください"}
+
+        with get_tracer().span("batch", "batch", companies=len(companies)):
+            # ユーザー側の計算は全企業で共通
+            base = IntegratedWorkflow(self.ai_model)
+            user_result = base.run_full_analysis(None, user_info, steps=["user_personality"])
+            if user_result.get("status") != "success":
+                return {"status": "error", "error": user_result.get("error", "パーソナリティ分析に失敗しました")}
+
+            results: Dict[str, Dict[str, Any]] = {}
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch") as pool:
+                # 企業ごとのトレースを一括実行のスパンの子にする
+                futures = {
+                    pool.submit(contextvars.copy_context().run, self._analyze_company, base, company_name, user_info,
+                                steps or BATCH_STEPS): company_name
+                    for company_name in companies
+                }
+                for future in as_completed(futures):
+                    company_name = futures[future]
+                    results[company_name] = future.result()
+                    if progress:
+                        progress(company_name, results[company_name])
+
+        ranking = self._rank(companies, results)
+        wall_time = time.perf_counter() - started_at
+        logger.info("batch workflow finished: %d companies in %.1fs", len(companies), wall_time)
+
+        return {
+            "status": "success",
+            "ranking": ranking,
+            "results": results,
+            "user_personality": user_result["workflow_summary"]["user_personality"],
+            "execution": {
+                "companies": len(companies),
+                "failed": sum(1 for item in ranking if item["status"] != "success"),
+                "wall_time": round(wall_time, 3),
+                "max_workers": self.max_workers
+            }
+        }
+
+    def _analyze_company(self, base: IntegratedWorkflow, company_name: str, user_info: Dict[str, Any],
+                         steps: List[str]) -> Dict[str, Any]:
+        """1社分のワークフローを実行（ユーザー側の結果は共有）"""
+        workflow = IntegratedWorkflow(self.ai_model)
+        workflow.adopt_user_results(base)
+        return workflow.run_full_analysis(company_name, user_info, steps=steps)
+
+    def _rank(self, companies: List[str], results: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """適合度スコアの高い順に並べる（スコアが取れない企業・失敗した企業は末尾）"""
+        items = []
+        for company_name in companies:
+            result = results[company_name]
+            gap_analysis = (result.get("workflow_summary") or {}).get("gap_analysis") or {}
+            items.append({
+                "company_name": company_name,
+                "overall_fit_score": parse_fit_score(gap_analysis.get("overall_fit_score")),
+                "fit_assessment": gap_analysis.get("fit_assessment", ""),
+                "status": result.get("status"),
+                "error": result.get("error")
+            })
+
+        items.sort(key=lambda item: (item["overall_fit_score"] is None, -(item["overall_fit_score"] or 0)))
+        for rank, item in enumerate(items, 1):
+            item["rank"] = rank
+        return items
@@ -1,33 +1,55 @@
 import requests
 from bs4 import BeautifulSoup
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import re
-from ..ai_client import get_ai_client
+from ..ai_client import get_ai_client, ResponseStream
+from ..prompt_builder import serialize_for_prompt, get_budget
+from ..artifact_store import Artifact, fingerprint, get_analysis_artifact_store
+from .ir_store import get_ir_store
+from .ir_retrieval import PassageRetriever
+from .company_master import get_company_master
 
 class CompanyAnalyzer:
+    # プロンプトを変更したら上げる（保存済みの分析結果・想定質問は使われなくなる）
+    PROMPT_VERSION = 1
+    INTERVIEW_POINTS_PROMPT_VERSION = 1
+    
     def __init__(self, ai_model: str = "claude"):
         self.ai_client = get_ai_client(ai_model)
+        self.artifacts = get_analysis_artifact_store()
         
     def analyze(self, company_name: str) -> Dict[str, Any]:
-        """企業の総合分析を実行"""
+        """企業の総合分析を実行（企業名は企業マスタの正式名称にそろえる）
+
+        基本情報・IR情報・プロンプトのバージョン・モデルが同じ分析が保存済みであれば、それを返す。
+        """
         try:
+            company_name = get_company_master().canonical_name(company_name)
+            
             # 1. 企業の基本情報を取得
             company_info = self._fetch_company_info(company_name)
             
             # 2. IR情報を取得
             ir_data = self._fetch_ir_data(company_name)
             
-            # 3. AIで分析
+            # 3. 保存済みの分析結果がなければAIで分析
+            inputs_fingerprint = fingerprint(company_name, company_info, ir_data)
+            artifact = self._load_artifact("company_analysis", company_name, inputs_fingerprint, self.PROMPT_VERSION)
+            if artifact is not None:
+                return {**artifact.data, "artifact": artifact.metadata()}
+            
             analysis = self._analyze_with_ai(company_name, company_info, ir_data)
             
-            return {
+            result = {
                 "company_name": company_name,
                 "basic_info": company_info,
                 "ir_summary": ir_data,
                 "ai_analysis": analysis,
                 "status": "success"
             }
+            return self._save_artifact("company_analysis", company_name, inputs_fingerprint, self.PROMPT_VERSION,
+                                       result)
         except Exception as e:
             return {
                 "company_name": company_name,
@@ -35,9 +57,71 @@ class CompanyAnalyzer:
                 "status": "error"
             }
     
+    def stream_analysis(self, company_name: str) -> Tuple[Dict[str, Any], ResponseStream]:
+        """企業分析をストリーミング実行（基本情報・IR情報とAI分析のストリームを返す）
+
+        保存済みの分析結果があればその本文を1チャンクで返し、なければ生成完了時に保存する。
+        """
+        company_name = get_company_master().canonical_name(company_name)
+        company_info = self._fetch_company_info(company_name)
+        ir_data = self._fetch_ir_data(company_name)
+        
+        result = {
+            "company_name": company_name,
+            "basic_info": company_info,
+            "ir_summary": ir_data,
+            "status": "success"
+        }
+        
+        inputs_fingerprint = fingerprint(company_name, company_info, ir_data)
+        artifact = self._load_artifact("company_analysis", company_name, inputs_fingerprint, self.PROMPT_VERSION)
+        if artifact is not None:
+            result.update(artifact.data)
+            result["artifact"] = artifact.metadata()
+            return result, ResponseStream(iter([artifact.data.get("ai_analysis", "")]))
+        
+        prompt, system_prompt = self._build_analysis_prompt(company_name, company_info, ir_data)
+        
+        def chunks():
+            stream = self.ai_client.stream_response(prompt, system_prompt)
+            yield from stream
+            # 最後まで生成できた場合のみ保存する
+            result["ai_analysis"] = stream.text
+            saved = self._save_artifact("company_analysis", company_name, inputs_fingerprint, self.PROMPT_VERSION,
+                                        dict(result))
+            result["artifact"] = saved.get("artifact")
+        
+        return result, ResponseStream(chunks())
+    
+    def _load_artifact(self, kind: str, company_name: str, inputs_fingerprint: str,
+                       prompt_version: int) -> Optional[Artifact]:
+        if self.artifacts is None:
+            return None
+        return self.artifacts.get(kind, get_company_master().company_key(company_name), inputs_fingerprint,
+                                  prompt_version, self.ai_client.model)
+    
+    def _save_artifact(self, kind: str, company_name: str, inputs_fingerprint: str, prompt_version: int,
+                       data: Any) -> Any:
+        """結果を保存し、辞書の結果には出典情報（artifact）を添付して返す"""
+        if self.artifacts is None:
+            return data
+        artifact = self.artifacts.put(kind, get_company_master().company_key(company_name), inputs_fingerprint,
+                                      prompt_version, self.ai_client.model, data)
+        if isinstance(data, dict):
+            return {**data, "artifact": artifact.metadata()}
+        return data
+    
     def _fetch_company_info(self, company_name: str) -> Dict[str, str]:
-        """企業の基本情報を取得（簡易実装）"""
-        # 実際のプロダクションでは企業データベースAPIを使用
+        """企業の基本情報を取得（企業マスタにない企業は入力された名称のみ）"""
+        record = get_company_master().resolve(company_name)
+        if record is not None:
+            return {
+                "name": record.name,
+                "company_id": record.company_id,
+                "securities_code": record.company_id,
+                "industry": record.industry or "分析中...",
+                "description": "企業情報を取得中..."
+            }
         return {
             "name": company_name,
             "industry": "分析中...",
@@ -45,8 +129,16 @@ class CompanyAnalyzer:
         }
     
     def _fetch_ir_data(self, company_name: str) -> Dict[str, Any]:
-        """IR情報を取得（モックデータ）"""
-        # 実際の実装では上場企業のIR情報をスクレイピング
+        """IR情報を取得（IR文書ストアに取り込み済みの資料があればそこから、なければモックデータ）"""
+        # 決算短信・中期経営計画などは ir_ingest で事前にローカルのストアへ取り込んでおき、
+        # 分析の観点ごとに関連するパッセージだけをプロンプトの予算内で抜き出す
+        store = get_ir_store()
+        ir_data = None
+        if store is not None:
+            ir_data = PassageRetriever(store).retrieve(company_name, get_budget("ir_excerpts"))
+        if ir_data:
+            return ir_data
+
         mock_data = {
             "revenue_trend": "売上高: 増加傾向",
             "profit_trend": "営業利益: 安定",
@@ -65,6 +157,11 @@ class CompanyAnalyzer:
     
     def _analyze_with_ai(self, company_name: str, company_info: Dict, ir_data: Dict) -> str:
         """AIを使用して企業分析を実行"""
+        prompt, system_prompt = self._build_analysis_prompt(company_name, company_info, ir_data)
+        return self.ai_client.generate_response(prompt, system_prompt)
+    
+    def _build_analysis_prompt(self, company_name: str, company_info: Dict, ir_data: Dict) -> Tuple[str, str]:
+        """企業分析用のプロンプトを作成"""
         system_prompt = """
 あなたは就活生向けの企業分析の専門家です。
 提供された企業情報とIR情報を基に、以下の観点で分析してください：
@@ -82,25 +179,34 @@ class CompanyAnalyzer:
 企業名: {company_name}
 
 基本情報:
-{json.dumps(company_info, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(company_info, "company_analysis", max_tokens=get_budget("company_analysis") // 2)}
 
 IR情報:
-{json.dumps(ir_data, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(ir_data, "ir_excerpts")}
 
 上記の情報を基に、就活生向けの企業分析を実行してください。
 """
         
-        return self.ai_client.generate_response(prompt, system_prompt)
+        return prompt, system_prompt
     
     def get_interview_points(self, company_name: str) -> List[str]:
-        """面接で聞かれそうなポイントを抽出"""
+        """面接で聞かれそうなポイントを抽出（保存済みの企業分析と、同じ分析から作成済みの質問を再利用）"""
         analysis_result = self.analyze(company_name)
         
+        # 想定質問は元にした企業分析の結果ごとに保存する
+        source = analysis_result.get("artifact")
+        source_fingerprint = fingerprint(source) if source is not None else None
+        if source is not None:
+            artifact = self._load_artifact("interview_points", analysis_result["company_name"], source_fingerprint,
+                                           self.INTERVIEW_POINTS_PROMPT_VERSION)
+            if artifact is not None:
+                return artifact.data
+        
         prompt = f"""
 以下の企業分析結果を基に、面接で聞かれる可能性が高い質問を5つ生成してください：
 
 企業分析結果:
-{json.dumps(analysis_result, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(analysis_result, "interview_points")}
 
 例：
 - 当社の強みは何だと思いますか？
@@ -113,4 +219,7 @@ IR情報:
         response = self.ai_client.generate_response(prompt)
         # 簡易的な解析（実際はより堅牢な実装が必要）
         questions = [line.strip() for line in response.split('\n') if line.strip() and line.strip().startswith('-')]
+        if source is not None and questions:
+            self._save_artifact("interview_points", analysis_result["company_name"], source_fingerprint,
+                                self.INTERVIEW_POINTS_PROMPT_VERSION, questions[:5])
         return questions[:5]
\ No newline at end of file
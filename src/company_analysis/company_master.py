@@ -0,0 +1,183 @@
+import os
+import re
+import csv
+import bisect
+import logging
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 照合時に取り除く法人格と記号（NFKC正規化後の表記）
+_CORPORATE_FORMS = re.compile(r"株式会社|有限会社|合同会社|\(株\)|\(有\)|\(同\)")
+_IGNORED_CHARS = re.compile(r"[\s・.,、。'’\"\-‐―&]")
+
+# CSVの列名の候補（独自形式と、東証の上場銘柄一覧の列名）
+_CODE_COLUMNS = ("securities_code", "code", "証券コード", "コード")
+_NAME_COLUMNS = ("name", "company_name", "企業名", "銘柄名")
+_ALIAS_COLUMNS = ("aliases", "別名")
+_KANA_COLUMNS = ("kana", "読み")
+_INDUSTRY_COLUMNS = ("industry", "業種", "33業種区分")
+
+def normalize_company_name(name: str) -> str:
+    """企業名を照合用に正規化（全角・半角とひらがな・カタカナの統一、法人格・空白・記号の除去）"""
+    text = unicodedata.normalize("NFKC", name or "")
+    text = _CORPORATE_FORMS.sub("", text)
+    text = "".join(chr(ord(c) + 0x60) if "ぁ" <= c <= "ゖ" else c for c in text)
+    return _IGNORED_CHARS.sub("", text).lower()
+
+def _ngrams(key: str) -> Set[str]:
+    if len(key) < 2:
+        return {key} if key else set()
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+class CompanyRecord:
+    """上場企業マスタの1社分（company_id は証券コード）"""
+
+    __slots__ = ("company_id", "name", "aliases", "industry")
+
+    def __init__(self, company_id: str, name: str, aliases: List[str], industry: str):
+        self.company_id = company_id
+        self.name = name
+        self.aliases = aliases
+        self.industry = industry
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"company_id": self.company_id, "name": self.name, "aliases": list(self.aliases),
+                "industry": self.industry}
+
+class CompanyMaster:
+    """上場企業マスタ（正式名称・別名・証券コードから企業を特定し、入力補完の候補を返す）
+
+    企業の特定（resolve）は正規化した名称・別名・証券コードの完全一致だけで行う。
+    入力補完（suggest）は前方一致を名称をソートした配列の二分探索で、表記ゆれは文字2-gramの
+    転置インデックスで候補を絞ってから類似度で選ぶ（類似した名称は別の企業のことがあるため候補に留める）。
+    """
+
+    def __init__(self, records: Optional[List[CompanyRecord]] = None):
+        self._records: Dict[str, CompanyRecord] = {}
+        self._exact: Dict[str, str] = {}
+        self._keys: List[Tuple[str, str]] = []
+        self._ngram_index: Dict[str, Set[str]] = {}
+        for record in records or []:
+            self.add(record)
+
+    @classmethod
+    def from_csv(cls, path: str, **kwargs) -> "CompanyMaster":
+        """上場企業一覧のCSVから作成（別名は「;」または「|」区切り、読みがあれば別名として扱う）"""
+        records = []
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                code = _column(row, _CODE_COLUMNS)
+                name = _column(row, _NAME_COLUMNS)
+                if not code or not name:
+                    continue
+                aliases = [alias.strip() for alias in re.split(r"[;|]", _column(row, _ALIAS_COLUMNS)) if alias.strip()]
+                kana = _column(row, _KANA_COLUMNS)
+                if kana:
+                    aliases.append(kana)
+                records.append(CompanyRecord(code, name, aliases, _column(row, _INDUSTRY_COLUMNS)))
+        logger.info("loaded %d companies from %s", len(records), path)
+        return cls(records, **kwargs)
+
+    def add(self, record: CompanyRecord) -> None:
+        self._records[record.company_id] = record
+        self._exact.setdefault(normalize_company_name(record.company_id), record.company_id)
+        for name in [record.name] + record.aliases:
+            key = normalize_company_name(name)
+            if not key:
+                continue
+            # 正式名称が別名より優先されるよう、先に登録されたものを残す
+            if self._exact.setdefault(key, record.company_id) != record.company_id:
+                continue
+            bisect.insort(self._keys, (key, record.company_id))
+            for gram in _ngrams(key):
+                self._ngram_index.setdefault(gram, set()).add(key)
+
+    def get(self, company_id: str) -> Optional[CompanyRecord]:
+        return self._records.get(company_id)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def resolve(self, name: str) -> Optional[CompanyRecord]:
+        """入力された企業名に対応する企業（正規化した名称・別名・証券コードの完全一致のみ）
+
+        「トヨタ紡織」と「トヨタ自動車」のように似た名称の別企業を取り違えないよう、類似度では特定しない。
+        """
+        company_id = self._exact.get(normalize_company_name(name))
+        return self._records[company_id] if company_id is not None else None
+
+    def suggest(self, query: str, limit: int = 10) -> List[CompanyRecord]:
+        """入力補完の候補（前方一致を名称の短い順に、足りなければ類似した名称で補う）"""
+        key = normalize_company_name(query)
+        if not key:
+            return []
+
+        company_ids: List[str] = []
+        exact = self._exact.get(key)
+        if exact is not None:
+            company_ids.append(exact)
+
+        start = bisect.bisect_left(self._keys, (key, ""))
+        prefixed = []
+        for matched_key, company_id in self._keys[start:]:
+            if not matched_key.startswith(key):
+                break
+            prefixed.append((len(matched_key), matched_key, company_id))
+        for _, _, company_id in sorted(prefixed):
+            if company_id not in company_ids:
+                company_ids.append(company_id)
+
+        if len(company_ids) < limit:
+            for _, matched_key in self._similar(key, limit):
+                company_id = self._exact[matched_key]
+                if company_id not in company_ids:
+                    company_ids.append(company_id)
+        return [self._records[company_id] for company_id in company_ids[:limit]]
+
+    def _similar(self, key: str, limit: int) -> List[Tuple[float, str]]:
+        """2-gramを共有する名称をDice係数の高い順に返す"""
+        grams = _ngrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._ngram_index.get(gram, ()))
+        scored = [(2 * count / (len(grams) + len(_ngrams(candidate))), candidate)
+                  for candidate, count in shared.items()]
+        scored.sort(key=lambda item: (-item[0], len(item[1]), item[1]))
+        return scored[:limit]
+
+    def company_key(self, name: str) -> str:
+        """キャッシュ・分析結果の保存に使う企業のキー（マスタにあれば証券コード、なければ正規化した名称）"""
+        record = self.resolve(name)
+        return record.company_id if record is not None else normalize_company_name(name)
+
+    def canonical_name(self, name: str) -> str:
+        """マスタにあれば正式名称、なければ入力された名称（前後の空白を除く）"""
+        record = self.resolve(name)
+        return record.name if record is not None else (name or "").strip()
+
+def _column(row: Dict[str, str], candidates: Tuple[str, ...]) -> str:
+    for column in candidates:
+        value = row.get(column)
+        if value:
+            return value.strip()
+    return ""
+
+_company_master: Optional[CompanyMaster] = None
+_company_master_lock = threading.Lock()
+
+def get_company_master() -> CompanyMaster:
+    """環境変数 COMPANY_MASTER_PATH のCSVから読み込んだ企業マスタを取得（ファイルがなければ空）"""
+    global _company_master
+    with _company_master_lock:
+        if _company_master is None:
+            path = os.getenv("COMPANY_MASTER_PATH", "data/companies.csv")
+            if path and os.path.exists(path):
+                _company_master = CompanyMaster.from_csv(path)
+            else:
+                logger.info("company master %s not found, company names are used as typed", path)
+                _company_master = CompanyMaster()
+        return _company_master
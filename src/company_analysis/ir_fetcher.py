@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from bs4 import BeautifulSoup, SoupStrainer
+from ..ai_client import ProviderLimiter
+
+logger = logging.getLogger(__name__)
+
+def html_parser() -> str:
+    """利用できる最速のBeautifulSoupのパーサー（lxmlがなければ標準のhtml.parser）"""
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+class HTTPCache:
+    """ETag / Last-Modified と本文を保存するディスク上のHTTPキャッシュ（再検証用）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS http_responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, headers, body, fetched_at, expires_at FROM http_responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, headers, body, fetched_at, expires_at = row
+        return {"etag": etag, "last_modified": last_modified, "headers": CaseInsensitiveDict(json.loads(headers)),
+                "body": body, "fetched_at": fetched_at, "expires_at": expires_at}
+
+    def put(self, url: str, headers: CaseInsensitiveDict, body: bytes, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO http_responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, headers.get("ETag"), headers.get("Last-Modified"), json.dumps(dict(headers), ensure_ascii=False),
+                 body, time.time(), expires_at)
+            )
+            self._conn.commit()
+
+    def touch(self, url: str, expires_at: float) -> None:
+        """304で再検証できた応答の有効期限を延ばす"""
+        with self._lock:
+            self._conn.execute("UPDATE http_responses SET fetched_at = ?, expires_at = ? WHERE url = ?",
+                               (time.time(), expires_at, url))
+            self._conn.commit()
+
+class FetchResult:
+    """1件の取得結果（from_cache は本文をキャッシュから返したか、revalidated は304で確認したか）"""
+
+    __slots__ = ("url", "status_code", "headers", "content", "from_cache", "revalidated", "wire_bytes", "error")
+
+    def __init__(self, url: str, status_code: int = 0, headers: Optional[CaseInsensitiveDict] = None,
+                 content: bytes = b"", from_cache: bool = False, revalidated: bool = False,
+                 wire_bytes: int = 0, error: Optional[str] = None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers if headers is not None else CaseInsensitiveDict()
+        self.content = content
+        self.from_cache = from_cache
+        self.revalidated = revalidated
+        self.wire_bytes = wire_bytes
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(_charset(self.headers) or "utf-8", errors="replace")
+
+    def soup(self, parse_only: Optional[SoupStrainer] = None) -> BeautifulSoup:
+        """本文をBeautifulSoupで解析（parse_onlyで必要な要素だけを解析すると速い）"""
+        return BeautifulSoup(self.content, html_parser(), parse_only=parse_only,
+                             from_encoding=_charset(self.headers))
+
+def _charset(headers: CaseInsensitiveDict) -> Optional[str]:
+    match = re.search(r"charset=([\w-]+)", headers.get("Content-Type", ""), re.IGNORECASE)
+    return match.group(1) if match else None
+
+class IRFetcher:
+    """IRページ・資料を取得する共有HTTPクライアント
+
+    requests.Session のコネクションプールを全スレッドで共有し、ホストごとの同時リクエスト数を制限する。
+    取得済みのURLは ETag / Last-Modified で条件付きGETを行い、304なら本文をディスクキャッシュから返す。
+    gzip等で圧縮された応答は urllib3 が読み込みながら展開する。
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, cache: Optional[HTTPCache] = None, max_per_host: int = 4, pool_size: int = 20,
+                 timeout: float = 20.0, user_agent: str = "job-hunt-ai-compass/1.0"):
+        self.cache = cache
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": user_agent, "Accept-Encoding": "gzip, deflate"})
+
+        self._hosts: Dict[str, ProviderLimiter] = {}
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "fresh_hits": 0, "not_modified": 0, "downloaded": 0, "errors": 0,
+                          "wire_bytes": 0, "decoded_bytes": 0, "bytes_saved": 0}
+
+    def _host_limiter(self, url: str) -> ProviderLimiter:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = ProviderLimiter(self.max_per_host)
+            return self._hosts[host]
+
+    def _count(self, **increments: int) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                self._counters[name] += value
+
+    def fetch(self, url: str) -> FetchResult:
+        """URLを取得（有効期限内ならキャッシュ、期限切れなら条件付きGETで再検証）"""
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and cached["expires_at"] > time.time():
+            self._count(fresh_hits=1, bytes_saved=len(cached["body"]))
+            return FetchResult(url, 200, cached["headers"], cached["body"], from_cache=True)
+
+        headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with self._host_limiter(url):
+                self._count(requests=1)
+                with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    if response.status_code == 304 and cached is not None:
+                        self.cache.touch(url, _expires_at(response.headers))
+                        self._count(not_modified=1, bytes_saved=len(cached["body"]))
+                        return FetchResult(url, 200, cached["headers"], cached["body"], from_cache=True,
+                                           revalidated=True)
+
+                    response.raise_for_status()
+                    # 展開しながら読み込み、通信量は圧縮された状態のバイト数で数える
+                    content = b"".join(response.iter_content(self.CHUNK_SIZE))
+                    wire_bytes = response.raw.tell() or len(content)
+                    response_headers = response.headers
+        except requests.RequestException as e:
+            logger.warning("failed to fetch %s: %s", url, e)
+            self._count(errors=1)
+            status_code = e.response.status_code if e.response is not None else 0
+            return FetchResult(url, status_code, error=str(e))
+
+        self._count(downloaded=1, wire_bytes=wire_bytes, decoded_bytes=len(content))
+        if self.cache is not None and (response_headers.get("ETag") or response_headers.get("Last-Modified")
+                                       or _max_age(response_headers)):
+            self.cache.put(url, response_headers, content, _expires_at(response_headers))
+        return FetchResult(url, response.status_code, response_headers, content, wire_bytes=wire_bytes)
+
+    def fetch_soup(self, url: str, parse_only: Optional[SoupStrainer] = None) -> Tuple[FetchResult, Optional[BeautifulSoup]]:
+        """URLを取得してBeautifulSoupで解析（取得に失敗した場合は None）"""
+        result = self.fetch(url)
+        return result, result.soup(parse_only) if result.ok else None
+
+    def fetch_many(self, urls: List[str], max_workers: Optional[int] = None) -> List[FetchResult]:
+        """複数のURLを並行して取得（ホストごとの同時リクエスト数の上限は守る）"""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=max_workers or min(len(urls), 16), thread_name_prefix="ir-fetch") as pool:
+            return list(pool.map(self.fetch, urls))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            hosts = {host: limiter.stats() for host, limiter in self._hosts.items()}
+        stats["hosts"] = hosts
+        return stats
+
+def _max_age(headers: CaseInsensitiveDict) -> int:
+    cache_control = headers.get("Cache-Control", "")
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return int(match.group(1)) if match else 0
+
+def _expires_at(headers: CaseInsensitiveDict) -> float:
+    """Cache-Control: max-age の期間だけ再検証を省く（指定がなければ毎回再検証）"""
+    return time.time() + _max_age(headers)
+
+_ir_fetcher: Optional[IRFetcher] = None
+_ir_fetcher_lock = threading.Lock()
+
+def get_ir_fetcher() -> IRFetcher:
+    """環境変数の設定に従ってプロセス全体で共有するIRページの取得クライアントを取得"""
+    global _ir_fetcher
+    with _ir_fetcher_lock:
+        if _ir_fetcher is None:
+            cache_path = os.getenv("IR_HTTP_CACHE_PATH", ".cache/http_cache.db")
+            _ir_fetcher = IRFetcher(
+                cache=HTTPCache(cache_path) if cache_path else None,
+                max_per_host=int(os.getenv("IR_HTTP_MAX_PER_HOST", "4")),
+                pool_size=int(os.getenv("IR_HTTP_POOL_SIZE", "20")),
+                timeout=float(os.getenv("IR_HTTP_TIMEOUT", "20")),
+                user_agent=os.getenv("IR_HTTP_USER_AGENT", "job-hunt-ai-compass/1.0")
+            )
+        return _ir_fetcher
@@ -0,0 +1,293 @@
+"""ローカルに置いたIR資料（決算短信・中期経営計画などのHTML / PDF）をIR文書ストアに取り込むツール
+
+    python -m src.company_analysis.ir_ingest data/ir_inbox --workers 8
+
+inbox直下の企業名のディレクトリ（例: data/ir_inbox/トヨタ自動車/2024年3月期決算短信.pdf）、
+または「企業名_資料名.pdf」形式のファイルを読み込む。PDFはページ単位に分割してプロセスプールで並列に
+テキスト抽出し、見出しごとのセクションに分けて保存する。内容の変わっていないファイルは飛ばす。
+--urls で「企業名,URL」のCSVを指定すると、取り込む前にIRページ・資料をinboxにダウンロードする。
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import csv
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+from typing import Any, Dict, List, Optional, Tuple
+from bs4 import BeautifulSoup
+from .ir_store import get_ir_store
+from .ir_fetcher import get_ir_fetcher, html_parser
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".html", ".htm")
+
+# 1タスクで抽出するPDFのページ数
+PAGES_PER_TASK = int(os.getenv("IR_INGEST_PAGES_PER_TASK", "8"))
+
+# 見出しとみなす行（「1．経営成績等の概況」「(1) 当期の経営成績の概況」「【重点施策】」「第2章」など）
+HEADING_PATTERNS = [
+    re.compile(r"^[(（]?[0-9]{1,2}[)）.．、]\s*\S"),
+    re.compile(r"^[(（][0-9]{1,2}[)）]\s*\S"),
+    re.compile(r"^[【■◆●◇□].+"),
+    re.compile(r"^第[0-9一二三四五六七八九十]+[章節部]"),
+]
+HEADING_MAX_LENGTH = 40
+
+DOC_TYPES = ["決算短信", "中期経営計画", "有価証券報告書", "決算説明資料", "統合報告書"]
+
+_FISCAL_PERIOD = re.compile(r"(20[0-9]{2})年\s*([0-9]{1,2})月期")
+_QUARTER = re.compile(r"第\s*([1-4])\s*四半期")
+_PLAN_PERIOD = re.compile(r"(20[0-9]{2})\s*(?:年度)?\s*[-~〜～–―]\s*(20[0-9]{2})")
+
+def extract_pdf_pages(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """PDFの [start, end) ページのテキストを抽出（プロセスプールのワーカーで実行）"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    pages = []
+    for index in range(start, min(end, len(reader.pages))):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception as e:
+            logger.warning("failed to extract page %d of %s: %s", index + 1, path, e)
+            text = ""
+        pages.append((index + 1, text))
+    return pages
+
+def extract_html_pages(path: str) -> List[Tuple[int, str]]:
+    """HTMLのテキストを見出し・段落・表の行ごとの行に変換（全体を1ページとして扱う）"""
+    with open(path, "rb") as f:
+        soup = BeautifulSoup(f.read(), html_parser())
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+
+    lines = []
+    for element in soup.find_all(["h1", "h2", "h3", "h4", "h5", "p", "li", "tr"]):
+        if element.name == "tr":
+            text = " | ".join(cell.get_text(" ", strip=True) for cell in element.find_all(["th", "td"]))
+        elif element.find_parent(["p", "li", "tr"]) is not None:
+            continue
+        else:
+            text = element.get_text(" ", strip=True)
+        if not text:
+            continue
+        # HTMLの見出しタグは文言によらず見出しとして扱う
+        lines.append(f"【{text}】" if element.name.startswith("h") and not _is_heading(text) else text)
+    if not lines and soup.body is not None:
+        lines = soup.body.get_text("\n", strip=True).splitlines()
+    return [(1, "\n".join(lines))]
+
+def _is_heading(line: str) -> bool:
+    return len(line) <= HEADING_MAX_LENGTH and any(pattern.match(line) for pattern in HEADING_PATTERNS)
+
+def split_sections(pages: List[Tuple[int, str]]) -> List[Dict[str, Any]]:
+    """ページ順のテキストを見出しごとのセクションに分割（ページをまたぐセクションは開始ページを記録）"""
+    sections = []
+    current = {"heading": "概要", "page": pages[0][0] if pages else 1, "lines": []}
+    for page, text in pages:
+        for raw_line in text.splitlines():
+            line = unicodedata.normalize("NFKC", raw_line).strip()
+            if not line:
+                continue
+            if _is_heading(line):
+                if current["lines"]:
+                    sections.append(current)
+                current = {"heading": line.strip("【】"), "page": page, "lines": []}
+            else:
+                current["lines"].append(line)
+    if current["lines"]:
+        sections.append(current)
+    return [{"heading": section["heading"], "page": section["page"], "text": "\n".join(section["lines"])}
+            for section in sections]
+
+def detect_doc_type(title: str, text: str) -> str:
+    for doc_type in DOC_TYPES:
+        if doc_type in title:
+            return doc_type
+    for doc_type in DOC_TYPES:
+        if doc_type in text[:2000]:
+            return doc_type
+    return "IR資料"
+
+def detect_period(title: str, text: str) -> Tuple[str, int]:
+    """資料の対象期間の表記と並べ替え用のキー（新しいほど大きい）を推定"""
+    for source in (unicodedata.normalize("NFKC", title), text[:2000]):
+        match = _FISCAL_PERIOD.search(source)
+        if match:
+            year, month = int(match.group(1)), int(match.group(2))
+            quarter = _QUARTER.search(source)
+            if quarter:
+                return f"{year}年{month}月期 第{quarter.group(1)}四半期", (year * 100 + month) * 10 + int(quarter.group(1))
+            return f"{year}年{month}月期", (year * 100 + month) * 10 + 5
+        match = _PLAN_PERIOD.search(source)
+        if match:
+            start, end = int(match.group(1)), int(match.group(2))
+            return f"{start}-{end}年度", (start * 100 + 4) * 10
+    return "期間不明", 0
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+def discover(inbox: str) -> List[Tuple[str, str, str]]:
+    """inbox内の (企業名, 資料名, パス) を列挙"""
+    found = []
+    for root, _, files in os.walk(inbox):
+        for filename in sorted(files):
+            if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            title = os.path.splitext(filename)[0]
+            relative = os.path.relpath(root, inbox)
+            if relative != ".":
+                company_name = relative.split(os.sep)[0]
+            elif "_" in title:
+                company_name, title = title.split("_", 1)
+            else:
+                logger.warning("skipping %s: company name is not known (put it in a company directory)", path)
+                continue
+            found.append((company_name, title, path))
+    return found
+
+def download(url_list: str, inbox: str) -> Dict[str, Any]:
+    """「企業名,URL」のCSVに書かれたIR資料をinboxの企業名のディレクトリに保存
+
+    取得済みのURLは条件付きGETで再検証するため、更新のない資料はダウンロードし直さない。
+    """
+    with open(url_list, encoding="utf-8-sig", newline="") as f:
+        targets = [(row[0].strip(), row[1].strip()) for row in csv.reader(f)
+                   if len(row) >= 2 and row[1].strip().startswith("http")]
+
+    fetcher = get_ir_fetcher()
+    results = fetcher.fetch_many([url for _, url in targets])
+    by_url = {result.url: result for result in results}
+    saved = 0
+    for company_name, url in targets:
+        result = by_url[url]
+        if not result.ok:
+            continue
+        filename = os.path.basename(urlsplit(url).path) or "index.html"
+        if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            filename += ".pdf" if "pdf" in result.headers.get("Content-Type", "") else ".html"
+        directory = os.path.join(inbox, company_name)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, filename), "wb") as f:
+            f.write(result.content)
+        saved += 1
+    return {"urls": len(targets), "saved": saved, "failed": sum(1 for result in results if not result.ok),
+            **{key: value for key, value in fetcher.stats().items() if key != "hosts"}}
+
+class IRIngestor:
+    """IR資料をページ単位の抽出タスクに分けてプロセスプールで並列処理し、ストアに保存する"""
+
+    def __init__(self, store=None, max_workers: Optional[int] = None, pages_per_task: int = PAGES_PER_TASK):
+        self.store = store or get_ir_store()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_task = max(1, pages_per_task)
+
+    def ingest(self, inbox: str, force: bool = False) -> Dict[str, Any]:
+        started_at = time.perf_counter()
+        counts = {"files": 0, "unchanged": 0, "ingested": 0, "failed": 0, "pages": 0, "sections": 0}
+
+        documents = []
+        for company_name, title, path in discover(inbox):
+            counts["files"] += 1
+            source_path = os.path.abspath(path)
+            sha256 = _sha256(path)
+            if not force and self.store.is_current(source_path, sha256):
+                counts["unchanged"] += 1
+                continue
+            documents.append({"company_name": company_name, "title": title, "source_path": source_path,
+                              "sha256": sha256})
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            # すべての文書のページ範囲を先に投入し、大きなPDFも複数のワーカーで同時に処理する
+            pending = []
+            for document in documents:
+                path = document["source_path"]
+                try:
+                    if path.lower().endswith(".pdf"):
+                        page_count = _pdf_page_count(path)
+                        futures = [pool.submit(extract_pdf_pages, path, start, start + self.pages_per_task)
+                                   for start in range(0, page_count, self.pages_per_task)]
+                    else:
+                        futures = [pool.submit(extract_html_pages, path)]
+                except ImportError:
+                    logger.warning("skipping %s: pypdf is not installed", path)
+                    counts["failed"] += 1
+                    continue
+                except Exception as e:
+                    logger.warning("failed to open %s: %s", path, e)
+                    counts["failed"] += 1
+                    continue
+                pending.append((document, futures))
+
+            for document, futures in pending:
+                try:
+                    pages = [page for future in futures for page in future.result()]
+                except Exception as e:
+                    logger.warning("failed to extract %s: %s", document["source_path"], e)
+                    counts["failed"] += 1
+                    continue
+
+                text = "\n".join(page_text for _, page_text in pages)
+                sections = split_sections(pages)
+                period, period_key = detect_period(document["title"], unicodedata.normalize("NFKC", text))
+                document.update({
+                    "doc_type": detect_doc_type(document["title"], text),
+                    "period": period,
+                    "period_key": period_key,
+                    "pages": len(pages)
+                })
+                self.store.put_document(document, sections)
+                counts["ingested"] += 1
+                counts["pages"] += len(pages)
+                counts["sections"] += len(sections)
+                logger.info("ingested %s (%s %s, %d pages, %d sections)", document["source_path"],
+                            period, document["doc_type"], len(pages), len(sections))
+
+        wall_time = time.perf_counter() - started_at
+        return {
+            **counts,
+            "wall_time": round(wall_time, 3),
+            "pages_per_second": round(counts["pages"] / wall_time, 1) if wall_time > 0 else None,
+            "max_workers": self.max_workers,
+            "store": self.store.stats()
+        }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ローカルのIR資料（HTML / PDF）をIR文書ストアに取り込みます")
+    parser.add_argument("inbox", help="企業名のディレクトリにIR資料を置いたディレクトリ")
+    parser.add_argument("--workers", type=int, default=None, help="抽出に使うプロセス数（既定: CPU数）")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK, help="1タスクで抽出するPDFのページ数")
+    parser.add_argument("--force", action="store_true", help="内容が変わっていないファイルも取り込み直す")
+    parser.add_argument("--urls", default=None, help="取り込む前にダウンロードするIR資料の「企業名,URL」のCSV")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if get_ir_store() is None:
+        parser.error("IR_STORE_PATH が空のため取り込み先がありません")
+    downloads = download(args.urls, args.inbox) if args.urls else None
+    report = IRIngestor(max_workers=args.workers, pages_per_task=args.pages_per_task).ingest(args.inbox, args.force)
+    if downloads is not None:
+        report["downloads"] = downloads
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
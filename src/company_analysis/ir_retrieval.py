@@ -0,0 +1,149 @@
+import os
+import re
+import math
+import heapq
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from ..prompt_builder import count_tokens, compact_json
+
+# 1パッセージの最大文字数（セクションをこの長さ以下に行単位で分割する）
+PASSAGE_CHARS = int(os.getenv("IR_PASSAGE_CHARS", "300"))
+
+# 企業分析の観点ごとの検索クエリ
+ASPECT_QUERIES = {
+    "強み・競争優位性": "強み 競争優位 優位性 シェア 技術力 ブランド 独自 差別化",
+    "事業戦略・成長分野": "事業戦略 成長戦略 重点施策 中期経営計画 投資 新規事業 海外展開 成長分野",
+    "業績・財務状況": "売上高 営業利益 経常利益 当期純利益 増収 増益 業績 財政状態 キャッシュ・フロー",
+    "課題・リスク": "課題 対処すべき課題 リスク 減少 減益 悪化 懸念 事業等のリスク",
+    "人材・組織": "人材 人的資本 採用 育成 従業員 ダイバーシティ 働き方 組織",
+}
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RUNS = re.compile(r"[a-z0-9]+|[^\W\d_a-z]+")
+
+def tokenize(text: str) -> List[str]:
+    """検索用のトークン列（英数字は単語単位、日本語は文字2-gram）"""
+    tokens = []
+    for run in _TOKEN_RUNS.findall(unicodedata.normalize("NFKC", text or "").lower()):
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def chunk_passages(sections: List[Dict[str, Any]], max_chars: int = PASSAGE_CHARS) -> List[Dict[str, Any]]:
+    """セクションを行単位でmax_chars以下のパッセージに分割（長すぎる行はそのまま切る）"""
+    passages = []
+    for section in sections:
+        lines: List[str] = []
+        length = 0
+        for line in section["text"].splitlines():
+            while len(line) > max_chars:
+                passages.append({**_passage_of(section), "text": line[:max_chars]})
+                line = line[max_chars:]
+            if lines and length + len(line) > max_chars:
+                passages.append({**_passage_of(section), "text": "\n".join(lines)})
+                lines, length = [], 0
+            lines.append(line)
+            length += len(line) + 1
+        if lines:
+            passages.append({**_passage_of(section), "text": "\n".join(lines)})
+    return passages
+
+def _passage_of(section: Dict[str, Any]) -> Dict[str, Any]:
+    return {"heading": section["heading"], "page": section["page"]}
+
+def bm25_weight(tf: int, length: int, average_length: float) -> float:
+    """BM25の語の重み（idfを掛ける前の、出現回数と文書長で正規化した値）"""
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1))
+    return tf * (BM25_K1 + 1) / (tf + norm)
+
+def term_frequencies(passage: Dict[str, Any]) -> Counter:
+    """パッセージの索引語と出現回数（見出しの語も含める）"""
+    return Counter(tokenize(passage["heading"]) + tokenize(passage["text"]))
+
+class PassageRetriever:
+    """IR文書ストアのパッセージの転置インデックスをBM25で検索し、観点ごとに予算内の抜粋を選ぶ
+
+    企業ごとの文書の量によらず、プロンプトに入るIR情報は予算のトークン数以下になる。
+    """
+
+    def __init__(self, store, aspects: Optional[Dict[str, str]] = None, top_k: int = 3, max_documents: int = 10):
+        self.store = store
+        self.aspects = aspects or ASPECT_QUERIES
+        self.top_k = top_k
+        self.max_documents = max_documents
+
+    def search(self, company_name: str, query: str, limit: int = 10) -> List[Tuple[float, int]]:
+        """クエリに対するBM25スコアの高いパッセージの (スコア, パッセージID)"""
+        index = self.store.term_weights(company_name)
+        passage_count = index["passages"]
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            matches = index["postings"].get(term)
+            if not matches:
+                continue
+            idf = math.log(1 + (passage_count - len(matches) + 0.5) / (len(matches) + 0.5))
+            for passage_id, weight in matches:
+                scores[passage_id] = scores.get(passage_id, 0.0) + idf * weight
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(score, passage_id) for passage_id, score in top]
+
+    def retrieve(self, company_name: str, max_tokens: int) -> Optional[Dict[str, Any]]:
+        """観点ごとの上位パッセージを、各観点から1件ずつ交互に予算内で選ぶ（文書がなければNone）
+
+        複数の観点で上位になったパッセージは、スコアが最も高い観点に割り当てる。
+        割り当てだけで top_k 件に満たない観点は、他の観点で選ばれなかった候補で補う。
+        """
+        documents = self.store.documents(company_name)
+        if not documents:
+            return None
+
+        rankings = {aspect: self.search(company_name, query, self.top_k * 2) for aspect, query in self.aspects.items()}
+        best: Dict[int, Tuple[float, str]] = {}
+        for aspect, ranking in rankings.items():
+            for score, passage_id in ranking:
+                if passage_id not in best or score > best[passage_id][0]:
+                    best[passage_id] = (score, aspect)
+        owned = {aspect: [passage_id for _, passage_id in ranking if best[passage_id][1] == aspect]
+                 for aspect, ranking in rankings.items()}
+        fallback = {aspect: [passage_id for _, passage_id in ranking] for aspect, ranking in rankings.items()}
+        passages = self.store.passages(set(best))
+
+        result = {
+            "documents": [{"title": document["title"], "doc_type": document["doc_type"], "period": document["period"]}
+                          for document in documents[:self.max_documents]],
+            "excerpts": {aspect: [] for aspect in self.aspects}
+        }
+        used = count_tokens(compact_json(result))
+        selected = set()
+        for candidates in (owned, fallback):
+            for _ in range(self.top_k):
+                for aspect, ranking in candidates.items():
+                    excerpts = result["excerpts"][aspect]
+                    while ranking and len(excerpts) < self.top_k:
+                        passage_id = ranking.pop(0)
+                        if passage_id in selected:
+                            continue
+                        passage = passages.get(passage_id)
+                        if passage is None:
+                            # 検索後に別プロセスで再取り込みされ、パッセージが置き換わった場合
+                            continue
+                        excerpt = {
+                            "document": f"{passage['period']} {passage['doc_type']}",
+                            "section": passage["heading"],
+                            "page": passage["page"],
+                            "text": passage["text"]
+                        }
+                        tokens = count_tokens(compact_json(excerpt))
+                        if used + tokens > max_tokens:
+                            continue
+                        excerpts.append(excerpt)
+                        selected.add(passage_id)
+                        used += tokens
+                        break
+        return result
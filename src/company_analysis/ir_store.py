@@ -0,0 +1,255 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .company_master import get_company_master
+from .ir_retrieval import chunk_passages, term_frequencies, bm25_weight
+
+class IRDocumentStore:
+    """取り込み済みのIR文書（決算短信・中期経営計画など）を企業・期・セクション単位で保持するストア
+
+    取り込みは ir_ingest で行い、分析時は企業キーのインデックスから読み出す。企業キーは企業マスタと
+    完全一致する企業なら証券コード、それ以外は正規化した企業名で、似た名称の別企業の文書は混ぜない。
+    セクションはパッセージに分割し、企業ごとの転置インデックス（postings）も取り込み時に作成する。
+    """
+
+    # 転置インデックスをメモリに保持する企業数
+    INDEX_CACHE_COMPANIES = 32
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                company_key TEXT NOT NULL,
+                company_name TEXT NOT NULL,
+                doc_type TEXT NOT NULL,
+                period TEXT NOT NULL,
+                period_key INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                source_path TEXT NOT NULL UNIQUE,
+                sha256 TEXT NOT NULL,
+                pages INTEGER NOT NULL,
+                ingested_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_company ON documents (company_key, period_key);
+            CREATE TABLE IF NOT EXISTS sections (
+                doc_id INTEGER NOT NULL REFERENCES documents (doc_id) ON DELETE CASCADE,
+                seq INTEGER NOT NULL,
+                heading TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (doc_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS passages (
+                passage_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id INTEGER NOT NULL REFERENCES documents (doc_id) ON DELETE CASCADE,
+                company_key TEXT NOT NULL,
+                heading TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_passages_company ON passages (company_key);
+            CREATE INDEX IF NOT EXISTS idx_passages_doc ON passages (doc_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                company_key TEXT NOT NULL,
+                term TEXT NOT NULL,
+                passage_id INTEGER NOT NULL REFERENCES passages (passage_id) ON DELETE CASCADE,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (company_key, term, passage_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_passage ON postings (passage_id);
+        """)
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.commit()
+        self._rekey_documents()
+        self._index_missing_passages()
+
+    def is_current(self, source_path: str, sha256: str) -> bool:
+        """同じ内容のファイルが取り込み済みか"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256 FROM documents WHERE source_path = ?", (source_path,)
+            ).fetchone()
+        return row is not None and row[0] == sha256
+
+    def put_document(self, document: Dict[str, Any], sections: List[Dict[str, Any]]) -> int:
+        """文書とセクションを保存（同じファイルの既存データは置き換える）"""
+        company_key = get_company_master().company_key(document["company_name"])
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM documents WHERE source_path = ?", (document["source_path"],))
+                cursor = self._conn.execute(
+                    """INSERT INTO documents (company_key, company_name, doc_type, period, period_key, title,
+                                              source_path, sha256, pages, ingested_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (company_key, document["company_name"], document["doc_type"],
+                     document["period"], document["period_key"], document["title"], document["source_path"],
+                     document["sha256"], document["pages"], time.time())
+                )
+                doc_id = cursor.lastrowid
+                self._conn.executemany(
+                    "INSERT INTO sections (doc_id, seq, heading, page, text) VALUES (?, ?, ?, ?, ?)",
+                    [(doc_id, seq, section["heading"], section["page"], section["text"])
+                     for seq, section in enumerate(sections)]
+                )
+                self._index_passages(doc_id, company_key, sections)
+                self._index_cache.pop(company_key, None)
+        return doc_id
+
+    def _index_passages(self, doc_id: int, company_key: str, sections: List[Dict[str, Any]]) -> None:
+        """文書のパッセージと転置インデックスを作成（ロックとトランザクションの中で呼び出す）"""
+        for passage in chunk_passages(sections):
+            frequencies = term_frequencies(passage)
+            cursor = self._conn.execute(
+                "INSERT INTO passages (doc_id, company_key, heading, page, text, length) VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_id, company_key, passage["heading"], passage["page"], passage["text"],
+                 sum(frequencies.values()))
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (company_key, term, passage_id, tf) VALUES (?, ?, ?, ?)",
+                [(company_key, term, cursor.lastrowid, tf) for term, tf in frequencies.items()]
+            )
+
+    def _rekey_documents(self) -> None:
+        """企業キーが現在の企業マスタの解決結果と異なる文書（類似名で別企業に寄せていた文書など）を付け替える"""
+        master = get_company_master()
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT company_key, company_name FROM documents").fetchall()
+            for company_key, company_name in rows:
+                new_key = master.company_key(company_name)
+                if new_key == company_key:
+                    continue
+                with self._conn:
+                    doc_ids = "SELECT doc_id FROM documents WHERE company_key = ? AND company_name = ?"
+                    self._conn.execute(
+                        f"""UPDATE postings SET company_key = ? WHERE passage_id IN
+                            (SELECT passage_id FROM passages WHERE doc_id IN ({doc_ids}))""",
+                        (new_key, company_key, company_name)
+                    )
+                    self._conn.execute(f"UPDATE passages SET company_key = ? WHERE doc_id IN ({doc_ids})",
+                                       (new_key, company_key, company_name))
+                    self._conn.execute("UPDATE documents SET company_key = ? WHERE company_key = ? AND company_name = ?",
+                                       (new_key, company_key, company_name))
+
+    def _index_missing_passages(self) -> None:
+        """パッセージのない文書（インデックス導入前に取り込んだ文書など）の索引を作成"""
+        with self._lock:
+            missing = self._conn.execute(
+                "SELECT doc_id, company_key FROM documents WHERE doc_id NOT IN (SELECT doc_id FROM passages)"
+            ).fetchall()
+            for doc_id, company_key in missing:
+                rows = self._conn.execute(
+                    "SELECT heading, page, text FROM sections WHERE doc_id = ? ORDER BY seq", (doc_id,)
+                ).fetchall()
+                with self._conn:
+                    self._index_passages(doc_id, company_key,
+                                         [dict(zip(("heading", "page", "text"), row)) for row in rows])
+
+    def documents(self, company_name: str) -> List[Dict[str, Any]]:
+        """企業の文書一覧（新しい期から順）"""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT doc_id, doc_type, period, title, pages FROM documents
+                   WHERE company_key = ? ORDER BY period_key DESC, doc_id DESC""",
+                (get_company_master().company_key(company_name),)
+            ).fetchall()
+        return [dict(zip(("doc_id", "doc_type", "period", "title", "pages"), row)) for row in rows]
+
+    def sections(self, doc_id: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT heading, page, text FROM sections WHERE doc_id = ? ORDER BY seq", (doc_id,)
+            ).fetchall()
+        return [dict(zip(("heading", "page", "text"), row)) for row in rows]
+
+    def term_weights(self, company_name: str) -> Dict[str, Any]:
+        """企業の転置インデックス（索引語ごとの (パッセージID, BM25の語の重み)）とパッセージ数
+
+        企業単位でまとめて読み込み、その企業のパッセージが変わるまでメモリに保持する。
+        別プロセス（取り込みCLIなど）で再取り込みされた場合も検知できるよう、読み出しのたびに
+        パッセージIDの最大値と件数を確認し、変わっていれば作り直す。
+        """
+        company_key = get_company_master().company_key(company_name)
+        with self._lock:
+            # 企業キーのインデックスだけで求まるため、キャッシュの確認は本文を読まずに済む
+            generation = self._conn.execute(
+                "SELECT COUNT(*), MAX(passage_id) FROM passages WHERE company_key = ?", (company_key,)
+            ).fetchone()
+            index = self._index_cache.get(company_key)
+            if index is not None and index["generation"] == generation:
+                self._index_cache.move_to_end(company_key)
+                return index
+
+            count = generation[0]
+            average_length = self._conn.execute(
+                "SELECT AVG(length) FROM passages WHERE company_key = ?", (company_key,)
+            ).fetchone()[0]
+            postings: Dict[str, List[Tuple[int, float]]] = {}
+            rows = self._conn.execute(
+                """SELECT postings.term, postings.passage_id, postings.tf, passages.length
+                   FROM postings JOIN passages ON passages.passage_id = postings.passage_id
+                   WHERE postings.company_key = ?""",
+                (company_key,)
+            )
+            for term, passage_id, tf, length in rows:
+                postings.setdefault(term, []).append((passage_id, bm25_weight(tf, length, average_length)))
+
+            index = {"passages": count, "postings": postings, "generation": generation}
+            self._index_cache[company_key] = index
+            self._index_cache.move_to_end(company_key)
+            if len(self._index_cache) > self.INDEX_CACHE_COMPANIES:
+                self._index_cache.popitem(last=False)
+            return index
+
+    def passages(self, passage_ids: Set[int]) -> Dict[int, Dict[str, Any]]:
+        """パッセージIDごとの本文と、出典の文書の種類・期間"""
+        passage_ids = list(passage_ids)
+        if not passage_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in passage_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT passages.passage_id, passages.heading, passages.page, passages.text,
+                           documents.doc_type, documents.period
+                    FROM passages JOIN documents ON documents.doc_id = passages.doc_id
+                    WHERE passages.passage_id IN ({placeholders})""",
+                passage_ids
+            ).fetchall()
+        return {row[0]: dict(zip(("heading", "page", "text", "doc_type", "period"), row[1:])) for row in rows}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            companies, documents, pages = self._conn.execute(
+                "SELECT COUNT(DISTINCT company_key), COUNT(*), COALESCE(SUM(pages), 0) FROM documents"
+            ).fetchone()
+            sections = self._conn.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+            passages = self._conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        return {"companies": companies, "documents": documents, "pages": pages, "sections": sections,
+                "passages": passages}
+
+_ir_store: Optional[IRDocumentStore] = None
+_ir_store_lock = threading.Lock()
+
+def get_ir_store() -> Optional[IRDocumentStore]:
+    """環境変数の設定に従って共有のIR文書ストアを取得（IR_STORE_PATH が空なら無効）"""
+    global _ir_store
+    path = os.getenv("IR_STORE_PATH", ".cache/ir_documents.db")
+    if not path:
+        return None
+
+    with _ir_store_lock:
+        if _ir_store is None:
+            _ir_store = IRDocumentStore(path)
+        return _ir_store
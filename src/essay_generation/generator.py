@@ -1,6 +1,9 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 import json
-from ..ai_client import get_ai_client
+from ..ai_client import get_ai_client, ResponseStream
+from ..prompt_builder import serialize_for_prompt, get_budget
+from ..streaming_json import JSONEventStream
+from ..structured_output import request_json, json_finalizer
 
 class EssayGenerator:
     def __init__(self, ai_model: str = "claude"):
@@ -9,6 +12,29 @@ class EssayGenerator:
     def generate_self_pr(self, user_info: Dict[str, Any], target_company: str = None) -> Dict[str, Any]:
         """自己PR文を生成"""
         
+        prompt, system_prompt = self._build_self_pr_prompt(user_info, target_company)
+        
+        try:
+            response = self.ai_client.generate_response(prompt, system_prompt)
+            return {
+                "self_pr": response,
+                "status": "success"
+            }
+        except Exception as e:
+            return {
+                "error": str(e),
+                "status": "error"
+            }
+    
+    def stream_self_pr(self, user_info: Dict[str, Any], target_company: str = None) -> ResponseStream:
+        """自己PR文をストリーミング生成"""
+        
+        prompt, system_prompt = self._build_self_pr_prompt(user_info, target_company)
+        return self.ai_client.stream_response(prompt, system_prompt)
+    
+    def _build_self_pr_prompt(self, user_info: Dict[str, Any], target_company: str = None) -> Tuple[str, str]:
+        """自己PR生成用のプロンプトを作成"""
+        
         system_prompt = """
 あなたは就活ESの自己PR作成専門家です。
 学生の経験や強みを基に、魅力的で具体的な自己PR文を作成してください。
@@ -26,26 +52,35 @@ class EssayGenerator:
         
         prompt = f"""
 {company_context}学生情報:
-{json.dumps(user_info, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(user_info, "self_pr")}
 
 上記の情報を基に、魅力的な自己PR文を作成してください。
 """
         
-        try:
-            response = self.ai_client.generate_response(prompt, system_prompt)
-            return {
-                "self_pr": response,
-                "status": "success"
-            }
-        except Exception as e:
-            return {
-                "error": str(e),
-                "status": "error"
-            }
+        return prompt, system_prompt
     
     def improve_essay(self, essay_text: str, essay_type: str = "自己PR") -> Dict[str, Any]:
         """ES文章の改善提案"""
         
+        prompt, system_prompt = self._build_improve_prompt(essay_text, essay_type)
+        
+        try:
+            return request_json(self.ai_client, prompt, system_prompt, "essay_improvement")
+        except Exception as e:
+            return {"error": str(e), "status": "error"}
+    
+    def stream_improve_essay(self, essay_text: str, essay_type: str = "自己PR") -> JSONEventStream:
+        """ES文章の改善提案をストリーミング実行（確定した項目から順にイベントを返す）"""
+        
+        prompt, system_prompt = self._build_improve_prompt(essay_text, essay_type)
+        return JSONEventStream(
+            self.ai_client.stream_response(prompt, system_prompt),
+            finalize=json_finalizer(self.ai_client, "essay_improvement", prompt, system_prompt)
+        )
+    
+    def _build_improve_prompt(self, essay_text: str, essay_type: str) -> Tuple[str, str]:
+        """ES添削用のプロンプトを作成"""
+        
         system_prompt = """
 あなたは就活ESの添削専門家です。
 提出されたES文章を以下の観点で評価し、改善提案を行ってください：
@@ -92,27 +127,29 @@ JSONフォーマットで回答してください：
 }}
 """
         
-        try:
-            response = self.ai_client.generate_response(prompt, system_prompt)
-            try:
-                result = json.loads(response)
-                return result
-            except json.JSONDecodeError:
-                return {"raw_response": response, "status": "text_response"}
-        except Exception as e:
-            return {"error": str(e), "status": "error"}
+        return prompt, system_prompt
     
     def generate_motivation_letter(self, company_info: Dict, user_info: Dict) -> str:
         """志望動機を生成"""
         
-        prompt = f"""
+        return self.ai_client.generate_response(self._build_motivation_prompt(company_info, user_info))
+    
+    def stream_motivation_letter(self, company_info: Dict, user_info: Dict) -> ResponseStream:
+        """志望動機をストリーミング生成"""
+        
+        return self.ai_client.stream_response(self._build_motivation_prompt(company_info, user_info))
+    
+    def _build_motivation_prompt(self, company_info: Dict, user_info: Dict) -> str:
+        """志望動機生成用のプロンプトを作成"""
+        
+        return f"""
 以下の情報を基に、説得力のある志望動機を作成してください：
 
 企業情報:
-{json.dumps(company_info, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(company_info, "motivation_letter", max_tokens=get_budget("motivation_letter") * 2 // 3)}
 
 学生情報:
-{json.dumps(user_info, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(user_info, "motivation_letter", max_tokens=get_budget("motivation_letter") // 3)}
 
 構成:
 1. 業界・企業への関心のきっかけ
@@ -122,8 +159,6 @@ JSONフォーマットで回答してください：
 
 400文字程度で作成してください。
 """
-        
-        return self.ai_client.generate_response(prompt)
     
     def get_essay_templates(self) -> Dict[str, str]:
         """ES文章のテンプレート集を提供"""
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Iterator, AsyncIterator
+from .ai_client import AIClient, AIClientWrapper, AIClientError, DEFAULT_SYSTEM_PROMPT, estimate_tokens
+from .structured_output import extract_template
+from .tracing import Span, get_tracer, traced_iter, atraced_iter
+
+def fixture_key(prompt: str, system_prompt: Optional[str] = None) -> str:
+    """モデルに依存しないフィクスチャ用のキー（録画したモデルと再生時のモデルが異なっても一致する）"""
+    payload = json.dumps([system_prompt or DEFAULT_SYSTEM_PROMPT, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LatencyModel:
+    """擬似的な応答遅延の分布（fixed / uniform / lognormal / none）"""
+
+    def __init__(self, kind: str = "none", params: tuple = (), seed: int = 0):
+        self.kind = kind
+        self.params = params
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, seed: int = 0) -> "LatencyModel":
+        """"fixed:0.5" / "uniform:0.5,2.0" / "lognormal:中央値,sigma" 形式の設定を解釈"""
+        if not spec or spec == "none":
+            return cls("none", (), seed)
+
+        kind, _, raw = spec.partition(":")
+        params = tuple(float(v) for v in raw.split(",") if v)
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        return cls(kind, params, seed)
+
+    def sample(self) -> float:
+        """遅延秒数を1つ取り出す"""
+        with self._lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self._random.uniform(*self.params)
+            if self.kind == "lognormal":
+                median, sigma = self.params
+                return self._random.lognormvariate(0, sigma) * median
+            return 0.0
+
+class FixtureStore:
+    """録画したレスポンスをJSONLファイルに保存・読み込みするストア"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._responses: Dict[str, str] = {}
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._responses[record["key"]] = record["response"]
+
+    def get(self, key: str) -> Optional[str]:
+        return self._responses.get(key)
+
+    def put(self, key: str, response: str, prompt: str = "", system_prompt: Optional[str] = None) -> None:
+        """レスポンスを追記保存（プロンプトは確認用に先頭のみ記録）"""
+        with self._lock:
+            self._responses[key] = response
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "key": key,
+                    "system_prompt": (system_prompt or DEFAULT_SYSTEM_PROMPT)[:200],
+                    "prompt": prompt[:200],
+                    "response": response
+                }, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+class FakeAIClient(AIClient):
+    """APIキー不要の決定的なAIクライアント（ベンチマーク・オフライン実行用）
+
+    フィクスチャに録画済みのレスポンスがあればそれを返し、
+    なければプロンプトの種類ごとにスキーマに沿ったダミー応答を合成する。
+    """
+
+    model = "fake"
+    provider = "fake"
+
+    def __init__(self, fixtures: Optional[FixtureStore] = None, latency: Optional[LatencyModel] = None,
+                 strict: bool = False, chunk_size: int = 20):
+        self.fixtures = fixtures
+        self.latency = latency or LatencyModel()
+        self.strict = strict
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "fixture_hits": 0, "synthesized": 0}
+
+    def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        with get_tracer().span("llm", "llm", model=self.model, provider=self.provider, cache_hit=False) as span:
+            span.dispatched()
+            time.sleep(self.latency.sample())
+            return self._respond(prompt, system_prompt, span)
+
+    async def agenerate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        with get_tracer().span("llm", "llm", model=self.model, provider=self.provider, cache_hit=False) as span:
+            span.dispatched()
+            await asyncio.sleep(self.latency.sample())
+            return self._respond(prompt, system_prompt, span)
+
+    def _iter_chunks(self, prompt: str, system_prompt: Optional[str]) -> Iterator[str]:
+        span = get_tracer().start("llm", "llm", model=self.model, provider=self.provider, cache_hit=False, stream=True)
+        return traced_iter(span, self._fake_stream(prompt, system_prompt, span))
+
+    def _aiter_chunks(self, prompt: str, system_prompt: Optional[str]) -> AsyncIterator[str]:
+        span = get_tracer().start("llm", "llm", model=self.model, provider=self.provider, cache_hit=False, stream=True)
+        return atraced_iter(span, self._afake_stream(prompt, system_prompt, span))
+
+    def _fake_stream(self, prompt: str, system_prompt: Optional[str], span: Span) -> Iterator[str]:
+        # サンプルした遅延を最初のチャンクまでの待ち時間とし、以降はまとめて返す
+        span.dispatched()
+        time.sleep(self.latency.sample())
+        for chunk in self._chunks(self._respond(prompt, system_prompt, span)):
+            yield chunk
+
+    async def _afake_stream(self, prompt: str, system_prompt: Optional[str], span: Span) -> AsyncIterator[str]:
+        span.dispatched()
+        await asyncio.sleep(self.latency.sample())
+        for chunk in self._chunks(self._respond(prompt, system_prompt, span)):
+            yield chunk
+            await asyncio.sleep(0)
+
+    def _chunks(self, text: str) -> Iterator[str]:
+        for i in range(0, len(text), self.chunk_size):
+            yield text[i:i + self.chunk_size]
+
+    def _respond(self, prompt: str, system_prompt: Optional[str], span: Optional[Span] = None) -> str:
+        recorded = None
+        if self.fixtures is not None:
+            recorded = self.fixtures.get(fixture_key(prompt, system_prompt))
+
+        if recorded is None and self.strict:
+            raise AIClientError("No recorded fixture for prompt", provider=self.provider)
+
+        with self._lock:
+            self._counters["calls"] += 1
+            self._counters["fixture_hits" if recorded is not None else "synthesized"] += 1
+
+        response = recorded if recorded is not None else self.synthesize(prompt, system_prompt)
+        if span is not None:
+            # APIのusageがないため概算値を記録する
+            span.set(
+                input_tokens=estimate_tokens(system_prompt or DEFAULT_SYSTEM_PROMPT) + estimate_tokens(prompt),
+                output_tokens=estimate_tokens(response),
+                estimated_usage=True
+            )
+        return response
+
+    def synthesize(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """プロンプトの種類に応じたダミー応答を生成"""
+        template = extract_template(prompt)
+        if template is not None:
+            return json.dumps(template, ensure_ascii=False, indent=2)
+
+        if "面接で聞かれる可能性が高い質問を5つ" in prompt:
+            return "\n".join(f"- 想定質問{i}（ダミー）" for i in range(1, 6))
+
+        if "就活生向けの企業分析" in prompt:
+            return json.dumps({
+                "strengths": ["強み1（ダミー）", "強み2（ダミー）"],
+                "business_strategy": "事業戦略の要約（ダミー）",
+                "market_position": "業界内ポジション（ダミー）",
+                "challenges": ["課題1（ダミー）", "課題2（ダミー）"],
+                "points_for_students": ["注目ポイント1（ダミー）", "注目ポイント2（ダミー）"]
+            }, ensure_ascii=False, indent=2)
+
+        if "JSONフォーマット" in prompt:
+            return json.dumps({"summary": "評価コメント（ダミー）", "score": 7}, ensure_ascii=False, indent=2)
+
+        # 自己PR・志望動機・改善プランなどの自由記述
+        return "これはオフライン実行用のダミー応答です。" * 20
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+class RecordingAIClient(AIClientWrapper):
+    """実際のAPIレスポンスをフィクスチャとして録画するラッパー"""
+
+    def __init__(self, client: AIClient, fixtures: FixtureStore):
+        super().__init__(client)
+        self.fixtures = fixtures
+
+    def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        response = self.client.generate_response(prompt, system_prompt)
+        self.fixtures.put(fixture_key(prompt, system_prompt), response, prompt, system_prompt)
+        return response
+
+    async def agenerate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        response = await self.client.agenerate_response(prompt, system_prompt)
+        self.fixtures.put(fixture_key(prompt, system_prompt), response, prompt, system_prompt)
+        return response
+
+    def _iter_chunks(self, prompt: str, system_prompt: Optional[str]) -> Iterator[str]:
+        text = ""
+        for chunk in self.client.stream_response(prompt, system_prompt):
+            text += chunk
+            yield chunk
+        self.fixtures.put(fixture_key(prompt, system_prompt), text, prompt, system_prompt)
+
+    async def _aiter_chunks(self, prompt: str, system_prompt: Optional[str]) -> AsyncIterator[str]:
+        text = ""
+        async for chunk in self.client.astream_response(prompt, system_prompt):
+            text += chunk
+            yield chunk
+        self.fixtures.put(fixture_key(prompt, system_prompt), text, prompt, system_prompt)
+
+def create_fake_client(strict: bool = False) -> FakeAIClient:
+    """環境変数の設定からFakeAIClientを作成"""
+    fixtures_path = os.getenv("FAKE_AI_FIXTURES")
+    return FakeAIClient(
+        fixtures=FixtureStore(fixtures_path) if fixtures_path else None,
+        latency=LatencyModel.parse(os.getenv("FAKE_AI_LATENCY", "none"), int(os.getenv("FAKE_AI_SEED", "0"))),
+        strict=strict
+    )
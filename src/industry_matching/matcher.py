@@ -1,6 +1,9 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 import json
 from ..ai_client import get_ai_client
+from ..prompt_builder import serialize_for_prompt
+from ..streaming_json import JSONEventStream
+from ..structured_output import request_json, json_finalizer
 
 class IndustryMatcher:
     def __init__(self, ai_model: str = "claude"):
@@ -21,6 +24,25 @@ class IndustryMatcher:
     def analyze_fit(self, user_profile: Dict[str, Any]) -> Dict[str, Any]:
         """ユーザープロフィールを基に業界適性を分析"""
         
+        prompt, system_prompt = self._build_fit_prompt(user_profile)
+        
+        try:
+            return request_json(self.ai_client, prompt, system_prompt, "industry_fit")
+        except Exception as e:
+            return {"error": str(e), "status": "error"}
+    
+    def stream_fit(self, user_profile: Dict[str, Any]) -> JSONEventStream:
+        """業界適性分析をストリーミング実行（確定した業界から順にイベントを返す）"""
+        
+        prompt, system_prompt = self._build_fit_prompt(user_profile)
+        return JSONEventStream(
+            self.ai_client.stream_response(prompt, system_prompt),
+            finalize=json_finalizer(self.ai_client, "industry_fit", prompt, system_prompt)
+        )
+    
+    def _build_fit_prompt(self, user_profile: Dict[str, Any]) -> Tuple[str, str]:
+        """業界適性分析用のプロンプトを作成"""
+        
         system_prompt = """
 あなたは就活生の業界適性を分析する専門家です。
 学生の経験、スキル、価値観を基に、どの業界が適しているかを分析してください。
@@ -43,7 +65,7 @@ class IndustryMatcher:
         
         prompt = f"""
 学生プロフィール:
-{json.dumps(user_profile, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(user_profile, "industry_fit")}
 
 上記のプロフィールを基に、業界適性を分析してください。
 
@@ -61,17 +83,7 @@ class IndustryMatcher:
 }}
 """
         
-        try:
-            response = self.ai_client.generate_response(prompt, system_prompt)
-            # JSONの解析を試行
-            try:
-                result = json.loads(response)
-                return result
-            except json.JSONDecodeError:
-                # JSON解析に失敗した場合はテキストレスポンスを返す
-                return {"raw_response": response, "status": "text_response"}
-        except Exception as e:
-            return {"error": str(e), "status": "error"}
+        return prompt, system_prompt
     
     def get_industry_info(self, industry_name: str) -> Dict[str, Any]:
         """特定業界の詳細情報を取得"""
@@ -91,12 +103,7 @@ JSONフォーマットで回答してください。
 """
         
         try:
-            response = self.ai_client.generate_response(prompt)
-            try:
-                result = json.loads(response)
-                return result
-            except json.JSONDecodeError:
-                return {"raw_response": response, "status": "text_response"}
+            return request_json(self.ai_client, prompt, None)
         except Exception as e:
             return {"error": str(e), "status": "error"}
     
@@ -1,55 +1,129 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
+import os
 import json
+import time
+import logging
+import functools
+import threading
+from .ai_client import ResponseStream
 from .company_analysis.analyzer import CompanyAnalyzer
+from .company_analysis.company_master import get_company_master
 from .personality_analysis.analyzer import PersonalityAnalyzer
 from .essay_generation.generator import EssayGenerator
 from .interview_prep.prep import InterviewPrep
+from .workflow_graph import WorkflowGraph, ExecutionReport, StepMemo
+from .workflow_store import WorkflowStore, get_workflow_store
+from .workflow_prefetch import SpeculativeRun
+from .tracing import get_tracer
+from .workflow_state import WorkflowState, compress_entries, decompress_entries, deep_sizeof, get_artifact_pool, get_idle_compactor
+
+logger = logging.getLogger(__name__)
+
+def exclusive_run(method):
+    """同じワークフローのステップ実行を直列化する（バックグラウンドのジョブと画面のボタンからの同時実行を防ぐ）"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._run_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class IntegratedWorkflow:
     """企業分析から始まる統合ワークフロー管理"""
     
-    def __init__(self, ai_model: str = "claude"):
+    # チェックポイントの形式（互換性のない変更をしたら上げる）
+    CHECKPOINT_VERSION = 1
+    
+    # run_full_analysisで実行する最終ステップ
+    FULL_ANALYSIS_STEPS = ["required_personality", "gap_analysis", "self_pr", "motivation", "interview_preparation"]
+    
+    # 入力が揃った時点で先行実行するステップ（ユーザーが結果を読んでいる間に実行しておく）
+    PREFETCH_STEPS = ["gap_analysis", "questions"]
+    
+    def __init__(self, ai_model: str = "claude", session_key: Optional[str] = None,
+                 store: Optional[WorkflowStore] = None, speculative: Optional[bool] = None):
         self.company_analyzer = CompanyAnalyzer(ai_model)
         self.personality_analyzer = PersonalityAnalyzer(ai_model)
         self.essay_generator = EssayGenerator(ai_model)
         self.interview_prep = InterviewPrep(ai_model)
         
-        # ワークフローの状態管理
-        self.workflow_state = {
-            "company_analysis": None,
-            "required_personality": None,
-            "user_personality": None,
-            "gap_analysis": None,
-            "generated_essays": {},
-            "interview_preparation": None
+        # ワークフローの状態管理（内容はステップ結果のメモから同期する）
+        self._state = WorkflowState()
+        
+        # ステップの外部入力（変更されると依存する下流のステップだけが再計算される）
+        self.workflow_inputs = {
+            "company_name": None,
+            "user_info": None
         }
+        
+        # 入力のフィンガープリント付きのステップ結果（内容が同じ部分はセッション間で共有する）
+        self._step_memo = StepMemo()
+        self.artifacts = get_artifact_pool()
+        
+        # 直近のグラフ実行の所要時間レポート
+        self.last_execution_report: Optional[ExecutionReport] = None
+        
+        # アイドル状態のセッションはステップ結果を圧縮して保持する
+        self._compacted: Optional[bytes] = None
+        self._compact_lock = threading.RLock()
+        # 入力の更新からステップの実行までを1回ずつ行う（_compact_lockは実行中の数を数えるだけ）
+        self._run_lock = threading.RLock()
+        self._last_access = time.monotonic()
+        self._running = 0
+        
+        # 次のステップの先行実行（WORKFLOW_SPECULATIVE=true で有効）
+        if speculative is None:
+            speculative = os.getenv("WORKFLOW_SPECULATIVE", "false").lower() in ("1", "true", "yes")
+        self.speculative = speculative
+        self._speculation: Optional[SpeculativeRun] = None
+        
+        # セッションキーが指定されていれば各ステップの完了ごとにチェックポイントを保存し、前回の続きから再開
+        self.session_key = session_key
+        self.store = store if store is not None else (get_workflow_store() if session_key else None)
+        if self.session_key and self.store:
+            self.resume()
+        
+        compactor = get_idle_compactor()
+        if compactor is not None:
+            compactor.register(self)
+    
+    @property
+    def workflow_state(self) -> WorkflowState:
+        self._touch()
+        return self._state
+    
+    @property
+    def step_memo(self) -> StepMemo:
+        self._touch()
+        return self._step_memo
     
+    @exclusive_run
     def start_workflow(self, company_name: str) -> Dict[str, Any]:
         """Step 1: 企業分析からワークフローを開始"""
         try:
-            # 企業分析実行
-            company_analysis = self.company_analyzer.analyze(company_name)
+            # 表記ゆれのある企業名も企業マスタの正式名称にそろえ、同じ企業の結果を再利用する
+            company_name = get_company_master().canonical_name(company_name)
+            self.workflow_inputs["company_name"] = company_name
             
-            if company_analysis.get("status") == "success":
-                self.workflow_state["company_analysis"] = company_analysis
-                
-                # 企業が求める人物像を分析
-                required_personality = self.personality_analyzer.analyze_required_personality(company_analysis)
-                self.workflow_state["required_personality"] = required_personality
-                
-                return {
-                    "status": "success",
-                    "step": "company_analysis_completed",
-                    "company_analysis": company_analysis,
-                    "required_personality": required_personality,
-                    "next_step": "user_personality_definition"
-                }
-            else:
-                return company_analysis
+            # 企業分析と企業が求める人物像の分析（同じ企業であれば前回の結果を再利用）
+            report = self._run_steps(["required_personality"])
+            if not report.ok:
+                return {"company_name": company_name, "error": self._first_error(report), "status": "error"}
+            
+            if self.speculative:
+                self.prefetch()
+            
+            return {
+                "status": "success",
+                "step": "company_analysis_completed",
+                "company_analysis": report.results["company_analysis"],
+                "required_personality": report.results["required_personality"],
+                "next_step": "user_personality_definition"
+            }
                 
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
+    @exclusive_run
     def define_user_personality(self, user_info: Dict[str, Any] = None) -> Dict[str, Any]:
         """Step 2: ユーザーのパーソナリティを定義"""
         try:
@@ -58,55 +132,68 @@ class IntegratedWorkflow:
             
             # user_infoが提供されていない場合、セッション状態から取得を試みる
             if user_info is None:
-                try:
-                    import streamlit as st
-                    if hasattr(st, 'session_state') and 'user_profile' in st.session_state:
-                        profile = st.session_state.user_profile
-                        user_info = {
-                            "name": profile.get('name', ''),
-                            "university": f"{profile.get('university', '')} {profile.get('faculty', '')} {profile.get('department', '')}".strip(),
-                            "graduation_year": profile.get('graduation_year', ''),
-                            "club_activities": profile.get('club_activities', ''),
-                            "part_time_job": profile.get('part_time_job', ''),
-                            "internship": profile.get('internship', ''),
-                            "gakuchika": profile.get('gakuchika', ''),
-                            "strengths": profile.get('strengths', ''),
-                            "values": profile.get('values', ''),
-                            "career_goals": profile.get('career_goals', ''),
-                            "target_industries": ', '.join(profile.get('target_industries', [])),
-                            "job_types": ', '.join(profile.get('job_types', []))
-                        }
-                    else:
-                        return {"status": "error", "error": "ユーザープロフィール情報が見つかりません"}
-                except ImportError:
-                    return {"status": "error", "error": "ユーザー情報を提供してください"}
+                user_info, error = self.get_session_user_info()
+                if error:
+                    return {"status": "error", "error": error}
+            
+            # ユーザーパーソナリティ分析（プロフィールが変わった場合のみ再計算し、下流の結果は無効化される）
+            self.workflow_inputs["user_info"] = user_info
+            report = self._run_steps(["user_personality"])
+            if not report.ok:
+                return {"status": "error", "error": self._first_error(report)}
             
-            # ユーザーパーソナリティ分析
-            user_personality = self.personality_analyzer.define_user_personality(user_info)
-            self.workflow_state["user_personality"] = user_personality
+            if self.speculative:
+                self.prefetch()
             
             return {
                 "status": "success",
                 "step": "user_personality_defined",
-                "user_personality": user_personality,
+                "user_personality": report.results["user_personality"],
                 "next_step": "gap_analysis"
             }
             
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
-    def analyze_personality_gap(self) -> Dict[str, Any]:
-        """Step 3: パーソナリティギャップ分析"""
+    def get_session_user_info(self):
+        """Streamlitのセッション状態のプロフィールからユーザー情報を作成（戻り値: user_info, エラーメッセージ）"""
+        try:
+            import streamlit as st
+            if hasattr(st, 'session_state') and 'user_profile' in st.session_state:
+                profile = st.session_state.user_profile
+                return {
+                    "name": profile.get('name', ''),
+                    "university": f"{profile.get('university', '')} {profile.get('faculty', '')} {profile.get('department', '')}".strip(),
+                    "graduation_year": profile.get('graduation_year', ''),
+                    "club_activities": profile.get('club_activities', ''),
+                    "part_time_job": profile.get('part_time_job', ''),
+                    "internship": profile.get('internship', ''),
+                    "gakuchika": profile.get('gakuchika', ''),
+                    "strengths": profile.get('strengths', ''),
+                    "values": profile.get('values', ''),
+                    "career_goals": profile.get('career_goals', ''),
+                    "target_industries": ', '.join(profile.get('target_industries', [])),
+                    "job_types": ', '.join(profile.get('job_types', []))
+                }, None
+            return None, "ユーザープロフィール情報が見つかりません"
+        except ImportError:
+            return None, "ユーザー情報を提供してください"
+        except Exception:
+            # ジョブのスレッドなどStreamlitのスクリプト外から呼ばれた場合
+            return None, "ユーザープロフィール情報が見つかりません"
+    
+    @exclusive_run
+    def analyze_personality_gap(self, event_handler: Optional[Callable[[tuple, Any], None]] = None) -> Dict[str, Any]:
+        """Step 3: パーソナリティギャップ分析（event_handlerを渡すと確定した項目から順に通知）"""
         try:
             if not self.workflow_state["user_personality"] or not self.workflow_state["required_personality"]:
                 return {"status": "error", "error": "ユーザーパーソナリティと企業要求パーソナリティの両方が必要です"}
             
             # ギャップ分析実行
-            gap_analysis = self.personality_analyzer.analyze_personality_gap(
-                self.workflow_state["user_personality"],
-                self.workflow_state["required_personality"]
-            )
-            self.workflow_state["gap_analysis"] = gap_analysis
+            report = self._run_steps(["gap_analysis"], event_handler=event_handler)
+            if not report.ok:
+                return {"status": "error", "error": self._first_error(report)}
+            gap_analysis = report.results["gap_analysis"]
             
             return {
                 "status": "success",
@@ -118,35 +205,23 @@ class IntegratedWorkflow:
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
+    @exclusive_run
     def generate_tailored_essays(self) -> Dict[str, Any]:
         """Step 4: ギャップ分析を踏まえたES生成"""
         try:
             if not self.workflow_state["gap_analysis"]:
                 return {"status": "error", "error": "ギャップ分析を先に実行してください"}
             
-            company_name = self.workflow_state["company_analysis"].get("company_name", "")
-            user_info = self.workflow_state["user_personality"]
-            gap_analysis = self.workflow_state["gap_analysis"]
-            
-            # 改善されたユーザー情報を作成
-            enhanced_user_info = self._create_enhanced_user_info(user_info, gap_analysis)
-            
-            # 自己PR生成
-            self_pr = self.essay_generator.generate_self_pr(enhanced_user_info, company_name)
-            
-            # 志望動機生成
-            motivation = self.essay_generator.generate_motivation_letter(
-                self.workflow_state["company_analysis"],
-                enhanced_user_info
-            )
+            # 自己PRと志望動機は互いに独立しているため並行して生成
+            report = self._run_steps(["self_pr", "motivation"])
+            if not report.ok:
+                return {"status": "error", "error": self._first_error(report)}
             
             essays = {
-                "self_pr": self_pr,
-                "motivation": motivation
+                "self_pr": report.results["self_pr"],
+                "motivation": report.results["motivation"]
             }
             
-            self.workflow_state["generated_essays"] = essays
-            
             return {
                 "status": "success",
                 "step": "essays_generated",
@@ -157,50 +232,378 @@ class IntegratedWorkflow:
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
-    def prepare_interview_strategy(self) -> Dict[str, Any]:
-        """Step 5: 面接戦略準備"""
+    @exclusive_run
+    def prepare_interview_strategy(self, plan_renderer: Optional[Callable[[ResponseStream], str]] = None) -> Dict[str, Any]:
+        """Step 5: 面接戦略準備（plan_rendererを渡すと改善プランをストリーミング表示）"""
         try:
             if not self.workflow_state["gap_analysis"]:
                 return {"status": "error", "error": "ギャップ分析が必要です"}
             
-            company_name = self.workflow_state["company_analysis"].get("company_name", "")
-            company_info = self.workflow_state["company_analysis"]
-            gap_analysis = self.workflow_state["gap_analysis"]
+            # 想定質問の生成と改善プランの生成は並行して実行（改善プランの表示は呼び出し元スレッドで行う）
+            report = self._run_steps(["interview_preparation"], plan_renderer=plan_renderer)
+            if not report.ok:
+                return {"status": "error", "error": self._first_error(report)}
             
-            # 企業・業界特化の想定質問生成
-            questions = self.interview_prep.generate_questions(
-                company_name, 
-                company_info.get("basic_info", {}).get("industry", ""), 
-                "総合職"
-            )
+            interview_preparation = report.results["interview_preparation"]
+            
+            return {
+                "status": "success",
+                "step": "interview_preparation_completed",
+                "interview_preparation": interview_preparation,
+                "workflow_completed": True
+            }
             
-            # ギャップ分析に基づく面接戦略
-            interview_strategy = gap_analysis.get("interview_strategy", {})
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+    
+    @exclusive_run
+    def run_full_analysis(self, company_name: str, user_info: Dict[str, Any] = None,
+                          plan_renderer: Optional[Callable[[ResponseStream], str]] = None,
+                          steps: Optional[List[str]] = None) -> Dict[str, Any]:
+        """全ステップを依存関係に従って並行実行（所要時間は最長の依存チェーン分になる）
+
+        stepsを指定するとそれらのステップ（と依存するステップ）だけを実行する。
+        """
+        try:
+            if user_info is None:
+                user_info, error = self.get_session_user_info()
+                if error:
+                    return {"status": "error", "error": error}
             
-            # パーソナリティ改善プラン
-            development_plan = self.personality_analyzer.generate_personality_development_plan(
-                gap_analysis, company_name
-            )
+            # 企業・ユーザー情報が前回と同じステップは結果を再利用する（企業名は正式名称にそろえる）
+            if company_name is not None:
+                company_name = get_company_master().canonical_name(company_name)
+            self.workflow_inputs["company_name"] = company_name
+            self.workflow_inputs["user_info"] = user_info
             
-            interview_preparation = {
-                "questions": questions,
-                "strategy": interview_strategy,
-                "development_plan": development_plan,
-                "key_points": self._extract_interview_key_points(gap_analysis)
-            }
+            report = self._run_steps(steps or self.FULL_ANALYSIS_STEPS, plan_renderer=plan_renderer)
             
-            self.workflow_state["interview_preparation"] = interview_preparation
+            if not report.ok:
+                return {
+                    "status": "error",
+                    "error": self._first_error(report),
+                    "execution_report": report.summary()
+                }
             
             return {
                 "status": "success",
-                "step": "interview_preparation_completed",
-                "interview_preparation": interview_preparation,
+                "step": "full_analysis_completed",
+                "workflow_summary": self.get_complete_workflow_summary()["workflow_summary"],
+                "execution_report": report.summary(),
                 "workflow_completed": True
             }
             
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
+    def adopt_user_results(self, source: "IntegratedWorkflow") -> None:
+        """別のワークフローで計算済みのユーザー側の結果（パーソナリティ定義）を引き継ぐ
+
+        ユーザー側のステップは企業に依存しないため、複数企業を分析する場合に一度だけ計算すればよい。
+        """
+        self.workflow_inputs["user_info"] = source.workflow_inputs["user_info"]
+        if "user_personality" in source.step_memo.entries:
+            self.step_memo.entries["user_personality"] = source.step_memo.entries["user_personality"]
+    
+    def _build_graph(self, plan_renderer: Optional[Callable[[ResponseStream], str]] = None,
+                     event_handler: Optional[Callable[[tuple, Any], None]] = None) -> WorkflowGraph:
+        """ワークフローの依存関係グラフを作成"""
+        graph = WorkflowGraph()
+        
+        # 実行中に入力が変更されてもフィンガープリントと結果が食い違わないよう、作成時点の入力を使う
+        external = dict(self.workflow_inputs)
+        
+        def analyze_company(_):
+            company_analysis = self.company_analyzer.analyze(external["company_name"])
+            if company_analysis.get("status") != "success":
+                raise RuntimeError(company_analysis.get("error", "企業分析に失敗しました"))
+            return company_analysis
+        
+        def analyze_gap(inputs):
+            if event_handler:
+                events = self.personality_analyzer.stream_personality_gap(
+                    inputs["user_personality"], inputs["required_personality"]
+                )
+                for path, value in events:
+                    event_handler(path, value)
+                return events.result
+            return self.personality_analyzer.analyze_personality_gap(
+                inputs["user_personality"], inputs["required_personality"]
+            )
+        
+        def name_of(company_analysis: Dict) -> str:
+            return company_analysis.get("company_name", "")
+        
+        def develop_plan(inputs):
+            company = name_of(inputs["company_analysis"])
+            if plan_renderer:
+                return plan_renderer(
+                    self.personality_analyzer.stream_personality_development_plan(inputs["gap_analysis"], company)
+                )
+            return self.personality_analyzer.generate_personality_development_plan(inputs["gap_analysis"], company)
+        
+        graph.add("company_analysis", analyze_company,
+                  inputs=lambda: external["company_name"])
+        graph.add("required_personality",
+                  lambda i: self.personality_analyzer.analyze_required_personality(i["company_analysis"]),
+                  ("company_analysis",))
+        # ユーザーのパーソナリティ定義は企業分析に依存しない
+        graph.add("user_personality",
+                  lambda i: self.personality_analyzer.define_user_personality(external["user_info"]),
+                  inputs=lambda: external["user_info"])
+        graph.add("gap_analysis", analyze_gap, ("user_personality", "required_personality"),
+                  inline=event_handler is not None)
+        graph.add("enhanced_user_info",
+                  lambda i: self._create_enhanced_user_info(i["user_personality"], i["gap_analysis"]),
+                  ("user_personality", "gap_analysis"))
+        graph.add("self_pr",
+                  lambda i: self.essay_generator.generate_self_pr(i["enhanced_user_info"], name_of(i["company_analysis"])),
+                  ("enhanced_user_info", "company_analysis"))
+        graph.add("motivation",
+                  lambda i: self.essay_generator.generate_motivation_letter(i["company_analysis"], i["enhanced_user_info"]),
+                  ("company_analysis", "enhanced_user_info"))
+        # 企業・業界特化の想定質問は企業分析だけで生成できる
+        graph.add("questions",
+                  lambda i: self.interview_prep.generate_questions(
+                      name_of(i["company_analysis"]),
+                      i["company_analysis"].get("basic_info", {}).get("industry", ""),
+                      "総合職"
+                  ),
+                  ("company_analysis",))
+        graph.add("development_plan", develop_plan, ("company_analysis", "gap_analysis"), inline=plan_renderer is not None)
+        graph.add("interview_preparation",
+                  lambda i: {
+                      "questions": i["questions"],
+                      "strategy": i["gap_analysis"].get("interview_strategy", {}),
+                      "development_plan": i["development_plan"],
+                      "key_points": self._extract_interview_key_points(i["gap_analysis"])
+                  },
+                  ("questions", "development_plan", "gap_analysis"))
+        return graph
+    
+    def _run_steps(self, targets: List[str], plan_renderer: Optional[Callable[[ResponseStream], str]] = None,
+                   event_handler: Optional[Callable[[tuple, Any], None]] = None,
+                   speculation: Optional[SpeculativeRun] = None) -> ExecutionReport:
+        """指定ステップまでをグラフ実行（入力が変わっていないステップは前回の結果を再利用）"""
+        with self._compact_lock:
+            self._running += 1
+        try:
+            return self._execute_steps(targets, plan_renderer, event_handler, speculation)
+        finally:
+            with self._compact_lock:
+                self._running -= 1
+    
+    def _execute_steps(self, targets: List[str], plan_renderer: Optional[Callable[[ResponseStream], str]],
+                       event_handler: Optional[Callable[[tuple, Any], None]],
+                       speculation: Optional[SpeculativeRun]) -> ExecutionReport:
+        graph = self._build_graph(plan_renderer, event_handler)
+        fingerprints = graph.fingerprints()
+        
+        # 入力が変わったステップとその下流だけを無効化
+        self.step_memo.invalidate(fingerprints)
+        
+        if speculation is None:
+            self._settle_speculation(graph, targets, fingerprints)
+        
+        def on_complete(name: str, result: Any) -> None:
+            # 実行中に入力が変わった場合、古い入力での結果で上書きしない
+            current = self._current_fingerprints()
+            if current.get(name) == fingerprints[name]:
+                # ステップが完了するたびに結果をメモに反映してチェックポイントを保存
+                self.step_memo.update(fingerprints, {name: self.artifacts.intern(result)}, cacheable=self._is_cacheable)
+                self._sync_state(current)
+                self.checkpoint()
+            if speculation is not None:
+                speculation.mark_done(name)
+        
+        with get_tracer().span("prefetch" if speculation is not None else "workflow", "workflow",
+                               session_key=self.session_key, company_name=self.workflow_inputs["company_name"],
+                               targets=targets) as span:
+            report = graph.run(
+                targets=targets,
+                initial=self.step_memo.valid(fingerprints),
+                on_complete=on_complete,
+                cancel=speculation.cancel_event if speculation is not None else None
+            )
+            span.set(reused=report.reused, failed=sorted(report.errors))
+        self._sync_state(self._current_fingerprints())
+        
+        # 呼び出し元に返す結果もメモと同じ共有オブジェクトにする
+        memo = self.step_memo.valid(fingerprints)
+        report.results.update({name: memo[name] for name in report.results if name in memo})
+        
+        if speculation is None:
+            self.last_execution_report = report
+        return report
+    
+    def _current_fingerprints(self) -> Dict[str, str]:
+        return self._build_graph().fingerprints()
+    
+    @exclusive_run
+    def prefetch(self, targets: Optional[List[str]] = None) -> bool:
+        """次に実行されそうなステップをバックグラウンドで先行実行（開始した場合True）"""
+        targets = list(targets or self.PREFETCH_STEPS)
+        
+        # プロフィールはセッション状態にあるため、バックグラウンドに渡す前に呼び出し元スレッドで取得
+        if self.workflow_inputs["user_info"] is None:
+            user_info, _ = self.get_session_user_info()
+            self.workflow_inputs["user_info"] = user_info
+        if self.workflow_inputs["user_info"] is None:
+            targets = [name for name in targets if name == "questions"]
+        if self.workflow_inputs["company_name"] is None:
+            return False
+        
+        graph = self._build_graph()
+        fingerprints = graph.fingerprints()
+        needed, _ = graph.plan(targets, self.step_memo.valid(fingerprints))
+        if not needed:
+            return False
+        
+        current = self._speculation
+        if current is not None and current.active:
+            if current.matches(fingerprints) and needed <= current.steps:
+                return False
+            current.cancel()
+        
+        speculation = SpeculativeRun(needed, fingerprints)
+        speculation.thread = threading.Thread(
+            target=self._run_speculation,
+            args=(speculation, targets),
+            name="workflow-prefetch",
+            daemon=True
+        )
+        self._speculation = speculation
+        speculation.thread.start()
+        logger.info("prefetching workflow steps: %s", ", ".join(sorted(needed)))
+        return True
+    
+    def _run_speculation(self, speculation: SpeculativeRun, targets: List[str]) -> None:
+        try:
+            self._run_steps(targets, speculation=speculation)
+        except Exception as e:
+            logger.warning("prefetch failed: %s", e)
+        finally:
+            speculation.finish()
+    
+    def _settle_speculation(self, graph: WorkflowGraph, targets: List[str], fingerprints: Dict[str, str]) -> None:
+        """先行実行中のステップがあれば、入力が同じなら完了を待って再利用し、変わっていればキャンセルする"""
+        speculation = self._speculation
+        if speculation is None or not speculation.active:
+            return
+        
+        if not speculation.matches(fingerprints):
+            speculation.cancel()
+            logger.info("prefetch cancelled: inputs changed")
+            return
+        
+        needed, _ = graph.plan(targets, self.step_memo.valid(fingerprints))
+        speculation.wait(needed & speculation.steps)
+    
+    def checkpoint(self) -> None:
+        """現在の入力とステップ結果を永続化バックエンドに保存"""
+        if not (self.session_key and self.store):
+            return
+        
+        self.store.save(self.session_key, {
+            "version": self.CHECKPOINT_VERSION,
+            "inputs": self.workflow_inputs,
+            "steps": {name: [fp, result] for name, (fp, result) in self.step_memo.snapshot().items()}
+        })
+    
+    def resume(self) -> bool:
+        """保存済みのチェックポイントから入力とステップ結果を復元（復元できた場合True）"""
+        checkpoint = self.store.load(self.session_key) if (self.session_key and self.store) else None
+        if not checkpoint or checkpoint.get("version") != self.CHECKPOINT_VERSION:
+            return False
+        
+        self.workflow_inputs.update(checkpoint.get("inputs", {}))
+        self.step_memo.entries = {
+            name: (fp, self.artifacts.intern(result)) for name, (fp, result) in checkpoint.get("steps", {}).items()
+        }
+        
+        # 入力から再計算したフィンガープリントと一致する結果だけを有効にする
+        fingerprints = self._build_graph().fingerprints()
+        self.step_memo.invalidate(fingerprints)
+        self._sync_state(fingerprints)
+        return True
+    
+    def current_step(self) -> int:
+        """完了済みのステップから、次に表示すべきステップ番号を返す"""
+        if self.workflow_state["interview_preparation"] is not None:
+            return 5
+        if self.workflow_state["generated_essays"]:
+            return 5
+        if self.workflow_state["gap_analysis"] is not None:
+            return 4
+        if self.workflow_state["user_personality"] is not None:
+            return 3
+        if self.workflow_state["company_analysis"] is not None:
+            return 2
+        return 1
+    
+    def _touch(self) -> None:
+        """アクセス時刻を更新し、圧縮中であれば展開する"""
+        self._last_access = time.monotonic()
+        if self._compacted is not None:
+            with self._compact_lock:
+                if self._compacted is not None:
+                    data, self._compacted = self._compacted, None
+                    self._step_memo.entries = decompress_entries(data, self.artifacts)
+                    self._sync_state(self._current_fingerprints())
+    
+    def compact(self) -> bool:
+        """ステップ結果を圧縮して保持し、展開済みの結果を手放す（実行中・先行実行中は何もしない）
+        
+        次に結果へアクセスしたときに自動で展開される。
+        """
+        with self._compact_lock:
+            if self._compacted is not None or self._running:
+                return False
+            if self._speculation is not None and self._speculation.active:
+                return False
+            
+            self._compacted = compress_entries(self._step_memo.snapshot())
+            self._step_memo.entries = {}
+            self._state = WorkflowState()
+            self.last_execution_report = None
+            return True
+    
+    def compact_if_idle(self, idle_seconds: float) -> bool:
+        """最後のアクセスからidle_seconds以上経過していれば圧縮する"""
+        if time.monotonic() - self._last_access < idle_seconds:
+            return False
+        return self.compact()
+    
+    def memory_usage(self) -> Dict[str, Any]:
+        """このセッションが保持しているステップ結果のおおよそのメモリ量（バイト）"""
+        with self._compact_lock:
+            if self._compacted is not None:
+                return {"bytes": deep_sizeof(self._compacted) + deep_sizeof(self.workflow_inputs), "compacted": True}
+            seen = set()
+            size = sum(deep_sizeof(obj, seen) for obj in (self._step_memo.entries, self._state, self.workflow_inputs))
+            return {"bytes": size, "compacted": False}
+    
+    def _sync_state(self, fingerprints: Dict[str, str]) -> None:
+        """メモの有効な結果をworkflow_stateに反映（無効化された結果は取り除く）"""
+        valid = self.step_memo.valid(fingerprints)
+        for key in ("company_analysis", "required_personality", "user_personality", "gap_analysis", "interview_preparation"):
+            self.workflow_state[key] = valid.get(key)
+        self.workflow_state["generated_essays"] = {
+            key: valid[key] for key in ("self_pr", "motivation") if key in valid
+        }
+    
+    def _is_cacheable(self, result: Any) -> bool:
+        """エラー結果は再実行できるようにメモしない"""
+        if isinstance(result, dict):
+            return result.get("status") != "error"
+        if isinstance(result, list) and result and isinstance(result[0], dict):
+            return result[0].get("status") != "error"
+        return True
+    
+    def _first_error(self, report: ExecutionReport) -> str:
+        """最初に失敗したステップのエラーメッセージ"""
+        return str(next(iter(report.errors.values())))
+    
     def get_complete_workflow_summary(self) -> Dict[str, Any]:
         """完全なワークフロー結果のサマリー"""
         return {
@@ -220,14 +623,14 @@ class IntegratedWorkflow:
         enhanced_info = user_info.copy()
         
         # ギャップ分析から強みをアピールポイントとして追加
-        if "gap_analysis" in gap_analysis and "strengths_match" in gap_analysis["gap_analysis"]:
-            strengths_match = gap_analysis["gap_analysis"]["strengths_match"]
-            enhanced_info["highlighted_strengths"] = [item.get("description", "") for item in strengths_match]
+        strengths_match = gap_analysis.get("gap_analysis", {}).get("strengths_match", [])
+        if strengths_match:
+            enhanced_info["highlighted_strengths"] = [self._item_text(item, "description", "area") for item in strengths_match]
         
         # 改善提案をエピソードとして追加
-        if "improvement_plan" in gap_analysis and "immediate_actions" in gap_analysis["improvement_plan"]:
-            actions = gap_analysis["improvement_plan"]["immediate_actions"]
-            enhanced_info["improvement_actions"] = [action.get("action", "") for action in actions]
+        actions = gap_analysis.get("improvement_plan", {}).get("immediate_actions", [])
+        if actions:
+            enhanced_info["improvement_actions"] = [self._item_text(action, "action") for action in actions]
         
         return enhanced_info
     
@@ -235,17 +638,21 @@ class IntegratedWorkflow:
         """ギャップ分析から面接の重要ポイントを抽出"""
         key_points = []
         
-        if "interview_strategy" in gap_analysis:
-            strategy = gap_analysis["interview_strategy"]
-            
-            if "highlight_strengths" in strategy:
-                key_points.extend([f"強みとしてアピール: {strength}" for strength in strategy["highlight_strengths"]])
-            
-            if "address_gaps" in strategy:
-                key_points.extend([f"ギャップ対処法: {gap}" for gap in strategy["address_gaps"]])
+        strategy = gap_analysis.get("interview_strategy", {})
+        key_points.extend([f"強みとしてアピール: {self._item_text(strength)}" for strength in strategy.get("highlight_strengths", [])])
+        key_points.extend([f"ギャップ対処法: {self._item_text(gap)}" for gap in strategy.get("address_gaps", [])])
         
         return key_points
     
+    def _item_text(self, item: Any, *keys: str) -> str:
+        """リスト要素が文字列・オブジェクトのどちらで返ってきてもテキストを取り出す"""
+        if isinstance(item, dict):
+            for key in keys:
+                if item.get(key):
+                    return str(item[key])
+            return next((str(v) for v in item.values() if isinstance(v, str)), "")
+        return str(item)
+    
     def _is_workflow_complete(self) -> bool:
         """ワークフローが完了しているかチェック"""
         required_steps = [
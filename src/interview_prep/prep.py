@@ -1,7 +1,11 @@
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Tuple, Iterator
 import json
 import random
-from ..ai_client import get_ai_client
+import asyncio
+from ..ai_client import get_ai_client, run_async
+from ..prompt_builder import serialize_for_prompt
+from ..streaming_json import JSONEventStream
+from ..structured_output import request_json, json_finalizer, extract_json
 
 class InterviewPrep:
     def __init__(self, ai_model: str = "claude"):
@@ -36,6 +40,62 @@ class InterviewPrep:
     def generate_questions(self, company_name: str, industry: str, job_type: str = "総合職") -> List[Dict[str, Any]]:
         """企業・業界別の想定質問を生成"""
         
+        prompt, system_prompt = self._build_questions_prompt(company_name, industry, job_type)
+        
+        try:
+            result = request_json(self.ai_client, prompt, system_prompt, "interview_questions")
+            questions = self._flatten_questions(result)
+            # フォールバック: 基本質問を返す
+            return questions or self._get_basic_questions()
+        except Exception as e:
+            return [{"error": str(e), "status": "error"}]
+    
+    def stream_questions(self, company_name: str, industry: str, job_type: str = "総合職") -> Iterator[Dict[str, Any]]:
+        """想定質問をストリーミング生成（生成が完了した質問から順に返す）"""
+        
+        prompt, system_prompt = self._build_questions_prompt(company_name, industry, job_type)
+        events = JSONEventStream(
+            self.ai_client.stream_response(prompt, system_prompt),
+            emit_depth=2,
+            finalize=json_finalizer(self.ai_client, "interview_questions", prompt, system_prompt)
+        )
+        
+        streamed_categories = set()
+        for path, value in events:
+            if len(path) == 2 and isinstance(value, str):
+                streamed_categories.add(path[0])
+                yield {
+                    "question": value,
+                    "category": path[0],
+                    "difficulty": self._assess_difficulty(value)
+                }
+        
+        # ストリーム中に取り出せなかったカテゴリは検証・補完後の結果から返す
+        remaining = [q for q in self._flatten_questions(events.result) if q["category"] not in streamed_categories]
+        if not streamed_categories and not remaining:
+            # フォールバック: 基本質問を返す
+            remaining = self._get_basic_questions()
+        yield from remaining
+    
+    def _flatten_questions(self, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """カテゴリ別の質問をフラットなリストに変換"""
+        
+        all_questions = []
+        for category, questions in result.items():
+            if not isinstance(questions, list):
+                continue
+            for q in questions:
+                if isinstance(q, str):
+                    all_questions.append({
+                        "question": q,
+                        "category": category,
+                        "difficulty": self._assess_difficulty(q)
+                    })
+        return all_questions
+    
+    def _build_questions_prompt(self, company_name: str, industry: str, job_type: str) -> Tuple[str, str]:
+        """想定質問生成用のプロンプトを作成"""
+        
         system_prompt = """
 あなたは人事面接官の専門家です。
 企業情報を基に、その企業の面接で実際に聞かれそうな質問を生成してください。
@@ -67,25 +127,7 @@ JSONフォーマットで回答：
 }}
 """
         
-        try:
-            response = self.ai_client.generate_response(prompt, system_prompt)
-            try:
-                result = json.loads(response)
-                # フラットなリストに変換
-                all_questions = []
-                for category, questions in result.items():
-                    for q in questions:
-                        all_questions.append({
-                            "question": q,
-                            "category": category,
-                            "difficulty": self._assess_difficulty(q)
-                        })
-                return all_questions
-            except json.JSONDecodeError:
-                # フォールバック: 基本質問を返す
-                return self._get_basic_questions()
-        except Exception as e:
-            return [{"error": str(e), "status": "error"}]
+        return prompt, system_prompt
     
     def generate_answer_template(self, question: str, user_profile: Dict[str, Any]) -> Dict[str, Any]:
         """質問に対する回答テンプレートを生成"""
@@ -107,7 +149,7 @@ STAR法（Situation, Task, Action, Result）を意識した構成にしてくだ
 面接質問: {question}
 
 学生プロフィール:
-{json.dumps(user_profile, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(user_profile, "answer_template")}
 
 上記の質問に対する効果的な回答例を作成してください。
 回答時間は1-2分程度を想定してください。
@@ -122,12 +164,7 @@ JSONフォーマットで回答：
 """
         
         try:
-            response = self.ai_client.generate_response(prompt, system_prompt)
-            try:
-                result = json.loads(response)
-                return result
-            except json.JSONDecodeError:
-                return {"raw_response": response, "status": "text_response"}
+            return request_json(self.ai_client, prompt, system_prompt, "answer_template")
         except Exception as e:
             return {"error": str(e), "status": "error"}
     
@@ -135,9 +172,12 @@ JSONフォーマットで回答：
         """模擬面接セッション（回答評価とフィードバック）"""
         
         feedback_list = []
+        pairs = list(zip(questions, user_answers))
+        
+        # 各回答の評価は独立しているため並行して実行
+        feedbacks = run_async(self._aevaluate_answers(pairs))
         
-        for i, (question, answer) in enumerate(zip(questions, user_answers)):
-            feedback = self._evaluate_answer(question, answer)
+        for i, ((question, answer), feedback) in enumerate(zip(pairs, feedbacks)):
             feedback_list.append({
                 "question_no": i + 1,
                 "question": question,
@@ -145,7 +185,10 @@ JSONフォーマットで回答：
                 "feedback": feedback
             })
         
-        overall_assessment = self._generate_overall_assessment(feedback_list)
+        try:
+            overall_assessment = self._generate_overall_assessment(feedback_list)
+        except Exception as e:
+            return {"error": str(e), "status": "error", "individual_feedback": feedback_list}
         
         return {
             "individual_feedback": feedback_list,
@@ -156,7 +199,30 @@ JSONフォーマットで回答：
     def _evaluate_answer(self, question: str, answer: str) -> Dict[str, Any]:
         """個別回答の評価"""
         
-        prompt = f"""
+        try:
+            response = self.ai_client.generate_response(self._build_evaluation_prompt(question, answer))
+            return self._parse_evaluation(response)
+        except Exception as e:
+            return {"error": str(e)}
+    
+    async def _aevaluate_answer(self, question: str, answer: str) -> Dict[str, Any]:
+        """個別回答の評価（非同期版）"""
+        
+        try:
+            response = await self.ai_client.agenerate_response(self._build_evaluation_prompt(question, answer))
+            return self._parse_evaluation(response)
+        except Exception as e:
+            return {"error": str(e)}
+    
+    async def _aevaluate_answers(self, pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """複数回答の評価を並行実行"""
+        
+        return await asyncio.gather(*(self._aevaluate_answer(q, a) for q, a in pairs))
+    
+    def _build_evaluation_prompt(self, question: str, answer: str) -> str:
+        """回答評価用プロンプトの作成"""
+        
+        return f"""
 面接質問: {question}
 学生の回答: {answer}
 
@@ -171,15 +237,14 @@ JSONフォーマットで回答：
 
 JSONフォーマットで回答してください。
 """
+    
+    def _parse_evaluation(self, response: str) -> Dict[str, Any]:
+        """回答評価レスポンスの解析"""
         
-        try:
-            response = self.ai_client.generate_response(prompt)
-            try:
-                return json.loads(response)
-            except json.JSONDecodeError:
-                return {"raw_feedback": response}
-        except Exception as e:
-            return {"error": str(e)}
+        result = extract_json(response, dict)
+        if isinstance(result, dict):
+            return result
+        return {"raw_feedback": response}
     
     def _generate_overall_assessment(self, feedback_list: List[Dict]) -> str:
         """全体的な評価コメント生成"""
@@ -188,7 +253,7 @@ JSONフォーマットで回答してください。
 模擬面接の結果を基に、全体的な評価とアドバイスを生成してください：
 
 面接結果:
-{json.dumps(feedback_list, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(feedback_list, "overall_assessment")}
 
 以下の形式で回答してください：
 - 全体的な印象（良い点）
@@ -0,0 +1,174 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """キューに投入された1件の処理"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, kind: str, dedupe_key: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.dedupe_key = dedupe_key
+        self.status = self.QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.SUCCEEDED, self.FAILED, self.CANCELLED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ポーリング用の状態（結果本体は含めない）"""
+        now = time.time()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "queue_time": round((self.started_at or now) - self.submitted_at, 3),
+            "run_time": round((self.finished_at or now) - self.started_at, 3) if self.started_at else None
+        }
+
+class JobQueue:
+    """LLMを使う処理をStreamlitのスクリプト実行から切り離して実行するジョブキュー
+
+    ページは処理を投入してジョブIDを受け取り、状態と結果をポーリングする。
+    再実行やタブ切り替えでスクリプトが中断されても処理は継続し、
+    同じdedupe_keyのジョブが実行中なら新たに投入せず既存のジョブIDを返す。
+    ワーカー数がプロセス全体の同時実行数の上限になる。
+    """
+
+    def __init__(self, max_workers: int = 4, retention_seconds: float = 3600):
+        self.max_workers = max_workers
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._active_keys: Dict[str, str] = {}
+        self._counters = {"submitted": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "cancelled": 0}
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args: Any, dedupe_key: Optional[str] = None,
+               **kwargs: Any) -> str:
+        """処理を投入してジョブIDを返す"""
+        with self._lock:
+            self._purge()
+            if dedupe_key and dedupe_key in self._active_keys:
+                self._counters["deduplicated"] += 1
+                return self._active_keys[dedupe_key]
+
+            job = Job(kind, dedupe_key)
+            self._jobs[job.id] = job
+            if dedupe_key:
+                self._active_keys[dedupe_key] = job.id
+            self._counters["submitted"] += 1
+            job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+            return job.id
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]) -> None:
+        with self._lock:
+            if job.status == Job.CANCELLED:
+                return
+            job.status = Job.RUNNING
+            job.started_at = time.time()
+
+        try:
+            result, error, status = fn(*args, **kwargs), None, Job.SUCCEEDED
+        except Exception as e:
+            logger.exception("job %s (%s) failed", job.id, job.kind)
+            result, error, status = None, str(e), Job.FAILED
+
+        with self._lock:
+            job.result = result
+            job.error = error
+            job.status = status
+            job.finished_at = time.time()
+            self._counters[status] += 1
+            self._release_key(job)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態を取得（存在しない・期限切れの場合はNone）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def result(self, job_id: str) -> Any:
+        """完了したジョブの結果（未完了・失敗の場合はNone）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.result if job and job.status == Job.SUCCEEDED else None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """ジョブの完了を待って状態を返す（タイムアウトした場合は実行中の状態を返す）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job.future is not None:
+            try:
+                job.future.result(timeout)
+            except Exception:
+                pass
+        return self.status(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """実行待ちのジョブを取り消す（実行中のジョブは取り消せない）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != Job.QUEUED:
+                return False
+            job.status = Job.CANCELLED
+            job.finished_at = time.time()
+            self._counters["cancelled"] += 1
+            self._release_key(job)
+            return True
+
+    def _release_key(self, job: Job) -> None:
+        if job.dedupe_key and self._active_keys.get(job.dedupe_key) == job.id:
+            del self._active_keys[job.dedupe_key]
+
+    def _purge(self) -> None:
+        """保持期間を過ぎた完了済みジョブを削除"""
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                "max_workers": self.max_workers,
+                "queued": statuses.count(Job.QUEUED),
+                "running": statuses.count(Job.RUNNING),
+                **self._counters
+            }
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """プロセス全体で共有するジョブキューを取得"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(
+                max_workers=int(os.getenv("JOB_MAX_WORKERS", "4")),
+                retention_seconds=float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+            )
+        return _job_queue
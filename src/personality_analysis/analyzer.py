@@ -1,13 +1,38 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 import json
-from ..ai_client import get_ai_client
+from ..ai_client import get_ai_client, ResponseStream
+from ..prompt_builder import serialize_for_prompt, get_budget
+from ..streaming_json import JSONEventStream
+from ..structured_output import request_json, json_finalizer, validate, SCHEMAS
+from ..artifact_store import fingerprint, get_analysis_artifact_store
+from ..company_analysis.company_master import get_company_master
 
 class PersonalityAnalyzer:
+    # 求める人物像のプロンプトを変更したら上げる（保存済みの結果は使われなくなる）
+    REQUIRED_PERSONALITY_PROMPT_VERSION = 1
+    
     def __init__(self, ai_model: str = "claude"):
         self.ai_client = get_ai_client(ai_model)
+        self.artifacts = get_analysis_artifact_store()
         
     def analyze_required_personality(self, company_analysis: Dict[str, Any]) -> Dict[str, Any]:
-        """企業分析結果から求められる人物像を分析"""
+        """企業分析結果から求められる人物像を分析（保存済みの企業分析から作成済みであれば再利用）"""
+        source = company_analysis.get("artifact") if self.artifacts is not None else None
+        if source is not None:
+            subject = get_company_master().company_key(company_analysis.get("company_name", ""))
+            artifact = self.artifacts.get("required_personality", subject, fingerprint(source),
+                                          self.REQUIRED_PERSONALITY_PROMPT_VERSION, self.ai_client.model)
+            if artifact is not None:
+                return artifact.data
+        
+        result = self._analyze_required_personality(company_analysis)
+        # エラーや解析できなかった応答（raw_response）は保存せず、次回は再分析する
+        if source is not None and not validate(result, SCHEMAS["required_personality"]):
+            self.artifacts.put("required_personality", subject, fingerprint(source),
+                               self.REQUIRED_PERSONALITY_PROMPT_VERSION, self.ai_client.model, result)
+        return result
+    
+    def _analyze_required_personality(self, company_analysis: Dict[str, Any]) -> Dict[str, Any]:
         
         system_prompt = """
 あなたは人事コンサルタントです。
@@ -28,7 +53,7 @@ class PersonalityAnalyzer:
         
         prompt = f"""
 企業分析結果:
-{json.dumps(company_analysis, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(company_analysis, "required_personality")}
 
 上記の企業分析を基に、この企業が求める理想的な人物像・パーソナリティを分析してください。
 
@@ -59,12 +84,7 @@ class PersonalityAnalyzer:
 """
         
         try:
-            response = self.ai_client.generate_response(prompt, system_prompt)
-            try:
-                result = json.loads(response)
-                return result
-            except json.JSONDecodeError:
-                return {"raw_response": response, "status": "text_response"}
+            return request_json(self.ai_client, prompt, system_prompt, "required_personality")
         except Exception as e:
             return {"error": str(e), "status": "error"}
     
@@ -90,7 +110,7 @@ class PersonalityAnalyzer:
         
         prompt = f"""
 ユーザー情報:
-{json.dumps(user_info, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(user_info, "user_personality")}
 
 上記の情報を基に、このユーザーの現在のパーソナリティプロフィールを作成してください。
 
@@ -121,18 +141,32 @@ class PersonalityAnalyzer:
 """
         
         try:
-            response = self.ai_client.generate_response(prompt, system_prompt)
-            try:
-                result = json.loads(response)
-                return result
-            except json.JSONDecodeError:
-                return {"raw_response": response, "status": "text_response"}
+            return request_json(self.ai_client, prompt, system_prompt, "user_personality")
         except Exception as e:
             return {"error": str(e), "status": "error"}
     
     def analyze_personality_gap(self, user_personality: Dict, required_personality: Dict) -> Dict[str, Any]:
         """ユーザーのパーソナリティと企業要求のギャップ分析"""
         
+        prompt, system_prompt = self._build_gap_prompt(user_personality, required_personality)
+        
+        try:
+            return request_json(self.ai_client, prompt, system_prompt, "personality_gap")
+        except Exception as e:
+            return {"error": str(e), "status": "error"}
+    
+    def stream_personality_gap(self, user_personality: Dict, required_personality: Dict) -> JSONEventStream:
+        """ギャップ分析をストリーミング実行（確定した項目から順にイベントを返す）"""
+        
+        prompt, system_prompt = self._build_gap_prompt(user_personality, required_personality)
+        return JSONEventStream(
+            self.ai_client.stream_response(prompt, system_prompt),
+            finalize=json_finalizer(self.ai_client, "personality_gap", prompt, system_prompt)
+        )
+    
+    def _build_gap_prompt(self, user_personality: Dict, required_personality: Dict) -> Tuple[str, str]:
+        """ギャップ分析用のプロンプトを作成"""
+        
         system_prompt = """
 あなたは人事・キャリアコンサルタントです。
 ユーザーの現在のパーソナリティと企業が求めるパーソナリティを比較分析し、
@@ -148,10 +182,10 @@ class PersonalityAnalyzer:
         
         prompt = f"""
 ユーザーの現在のパーソナリティ:
-{json.dumps(user_personality, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(user_personality, "personality_gap", max_tokens=get_budget("personality_gap") // 2)}
 
 企業が求めるパーソナリティ:
-{json.dumps(required_personality, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(required_personality, "personality_gap", max_tokens=get_budget("personality_gap") // 2)}
 
 上記を比較分析して、ギャップ分析と改善提案を行ってください。
 
@@ -209,25 +243,27 @@ class PersonalityAnalyzer:
 }}
 """
         
-        try:
-            response = self.ai_client.generate_response(prompt, system_prompt)
-            try:
-                result = json.loads(response)
-                return result
-            except json.JSONDecodeError:
-                return {"raw_response": response, "status": "text_response"}
-        except Exception as e:
-            return {"error": str(e), "status": "error"}
+        return prompt, system_prompt
     
     def generate_personality_development_plan(self, gap_analysis: Dict[str, Any], company_name: str) -> str:
         """パーソナリティ改善のための具体的なアクションプランを生成"""
         
-        prompt = f"""
+        return self.ai_client.generate_response(self._build_development_plan_prompt(gap_analysis, company_name))
+    
+    def stream_personality_development_plan(self, gap_analysis: Dict[str, Any], company_name: str) -> ResponseStream:
+        """パーソナリティ改善プランをストリーミング生成"""
+        
+        return self.ai_client.stream_response(self._build_development_plan_prompt(gap_analysis, company_name))
+    
+    def _build_development_plan_prompt(self, gap_analysis: Dict[str, Any], company_name: str) -> str:
+        """改善プラン生成用のプロンプトを作成"""
+        
+        return f"""
 以下のギャップ分析結果を基に、{company_name}への転職・就職を目指す人向けの
 具体的なパーソナリティ改善プランを作成してください。
 
 ギャップ分析結果:
-{json.dumps(gap_analysis, ensure_ascii=False, indent=2)}
+{serialize_for_prompt(gap_analysis, "development_plan", exclude=("sample_responses",))}
 
 以下の構成で実践的なプランを作成してください：
 1. 改善の優先順位
@@ -238,6 +274,4 @@ class PersonalityAnalyzer:
 6. 進捗確認・測定方法
 
 実行可能で具体的な内容にしてください。
-"""
-        
-        return self.ai_client.generate_response(prompt)
\ No newline at end of file
+"""
\ No newline at end of file
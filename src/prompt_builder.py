@@ -0,0 +1,103 @@
+import os
+import json
+import logging
+from typing import Any, Iterable, Optional
+from .ai_client import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# タスクごとのプロンプトに埋め込むデータのトークン予算（PROMPT_BUDGET_<TASK>で上書き可）
+TASK_BUDGETS = {
+    "company_analysis": 1500,
+    "ir_excerpts": 3000,
+    "interview_points": 1500,
+    "required_personality": 1500,
+    "user_personality": 1500,
+    "personality_gap": 2500,
+    "development_plan": 2000,
+    "self_pr": 1200,
+    "motivation_letter": 1500,
+    "industry_fit": 1200,
+    "answer_template": 1200,
+    "overall_assessment": 2500
+}
+
+DEFAULT_BUDGET = 1500
+
+# どのタスクでもプロンプトに不要なキー
+COMMON_DROP_KEYS = ("status", "error", "step", "next_step", "artifact")
+
+TRUNCATION_MARK = "…"
+
+def count_tokens(text: str) -> int:
+    """テキストのトークン数（概算）"""
+    return estimate_tokens(text)
+
+def compact_json(data: Any) -> str:
+    """空白を省いたJSON文字列に変換"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def get_budget(task: str) -> int:
+    """タスクのトークン予算を取得"""
+    return int(os.getenv(f"PROMPT_BUDGET_{task.upper()}", TASK_BUDGETS.get(task, DEFAULT_BUDGET)))
+
+def drop_keys(data: Any, keys: Iterable[str]) -> Any:
+    """ネストしたdict/listから指定キーを再帰的に除去"""
+    keys = set(keys)
+    if isinstance(data, dict):
+        return {k: drop_keys(v, keys) for k, v in data.items() if k not in keys}
+    if isinstance(data, list):
+        return [drop_keys(item, keys) for item in data]
+    return data
+
+def _truncate(data: Any, max_chars: int, max_items: int) -> Any:
+    if isinstance(data, dict):
+        return {k: _truncate(v, max_chars, max_items) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_truncate(item, max_chars, max_items) for item in data[:max_items]]
+    if isinstance(data, str) and len(data) > max_chars:
+        return data[:max_chars] + TRUNCATION_MARK
+    return data
+
+def _longest_string(data: Any) -> int:
+    if isinstance(data, dict):
+        return max((_longest_string(v) for v in data.values()), default=0)
+    if isinstance(data, list):
+        return max((_longest_string(item) for item in data), default=0)
+    if isinstance(data, str):
+        return len(data)
+    return 0
+
+def _longest_list(data: Any) -> int:
+    if isinstance(data, dict):
+        return max((_longest_list(v) for v in data.values()), default=0)
+    if isinstance(data, list):
+        return max([len(data)] + [_longest_list(item) for item in data])
+    return 0
+
+def fit_to_budget(data: Any, max_tokens: int) -> Any:
+    """長い文字列・配列から順に切り詰めて予算内に収める"""
+    if count_tokens(compact_json(data)) <= max_tokens:
+        return data
+
+    max_chars = _longest_string(data)
+    max_items = _longest_list(data)
+    fitted = data
+    while max_chars > 20 or max_items > 1:
+        max_chars = max(20, max_chars * 3 // 4)
+        max_items = max(1, max_items * 3 // 4)
+        fitted = _truncate(data, max_chars, max_items)
+        if count_tokens(compact_json(fitted)) <= max_tokens:
+            break
+    return fitted
+
+def serialize_for_prompt(data: Any, task: str, exclude: Iterable[str] = (), max_tokens: Optional[int] = None) -> str:
+    """プロンプト埋め込み用に不要キー除去・コンパクト化・予算内への切り詰めを行う"""
+    budget = max_tokens or get_budget(task)
+    before = count_tokens(json.dumps(data, ensure_ascii=False, indent=2))
+
+    pruned = drop_keys(data, tuple(COMMON_DROP_KEYS) + tuple(exclude))
+    serialized = compact_json(fit_to_budget(pruned, budget))
+
+    logger.info("prompt data for %s: %d -> %d tokens (budget %d)", task, before, count_tokens(serialized), budget)
+    return serialized
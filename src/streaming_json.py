@@ -0,0 +1,206 @@
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from .ai_client import ResponseStream
+from .structured_output import extract_json
+
+JSONPath = Tuple[Any, ...]
+
+class IncrementalJSONParser:
+    """ストリーミングされたJSONテキストを逐次解析し、閉じた要素から順にイベントを返す
+
+    feed() に渡したテキストのうち、値が確定した要素を (パス, 値) のリストで返す。
+    パスはオブジェクトのキーと配列のインデックスのタプルで、emit_depth より深い要素は
+    親の要素が閉じたときにまとめて返す。JSONの前後にある説明文やコードフェンスは無視し、
+    説明文中の括弧から始まってJSONとして不正になった場合はその括弧の次から解析し直す。
+    """
+
+    WHITESPACE = " \t\r\n"
+    CLOSING = {"{": "}", "[": "]"}
+    SCALAR_START = "-0123456789tfn"
+
+    def __init__(self, emit_depth: int = 3):
+        self.emit_depth = emit_depth
+        self.buffer = ""
+        self.pos = 0
+        self.stack: List[Dict[str, Any]] = []
+        self.started = False
+        self.done = False
+        self.result: Any = None
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._scalar_start: Optional[int] = None
+        self._root_start = 0
+        self._root_events = 0
+
+    def feed(self, chunk: str) -> List[Tuple[JSONPath, Any]]:
+        self.buffer += chunk
+        events: List[Tuple[JSONPath, Any]] = []
+        self._root_events = 0
+
+        while self.pos < len(self.buffer) and not self.done:
+            ch = self.buffer[self.pos]
+
+            # ルート要素が始まるまでの前置き（説明文・```json 等）は読み飛ばす
+            if not self.started:
+                if ch in "{[":
+                    self.started = True
+                    self._root_start = self.pos
+                    self._root_events = len(events)
+                    self._open(ch)
+                self.pos += 1
+                continue
+
+            if self._in_string:
+                if self._read_string_char(ch, events):
+                    self.pos += 1
+                continue
+
+            if self._scalar_start is not None:
+                if ch in ",}]" or ch in self.WHITESPACE:
+                    # 区切り文字は次のループで改めて処理する
+                    self._finish_scalar(events)
+                    continue
+                self.pos += 1
+                continue
+
+            frame = self.stack[-1]
+            expect = frame["expect"]
+            if ch in self.WHITESPACE:
+                pass
+            elif ch == '"' and expect in ("key", "value"):
+                self._in_string = True
+                self._string_start = self.pos
+                self._string_is_key = expect == "key"
+                if not self._string_is_key:
+                    self._begin_value(frame)
+            elif ch == ":" and expect == "colon":
+                frame["expect"] = "value"
+            elif ch == "," and expect == "comma":
+                frame["expect"] = "key" if frame["kind"] == "{" else "value"
+            elif ch in "{[" and expect == "value":
+                self._begin_value(frame)
+                self._open(ch)
+            elif ch == self.CLOSING[frame["kind"]] and expect != "colon":
+                if not self._close(events):
+                    continue
+            elif ch in self.SCALAR_START and expect == "value":
+                self._begin_value(frame)
+                self._scalar_start = self.pos
+            else:
+                self._abandon_root(events)
+                continue
+            self.pos += 1
+
+        return events
+
+    def _abandon_root(self, events: List[Tuple[JSONPath, Any]]) -> bool:
+        """JSONとして不正なルート要素（「[参考]」のような説明文中の括弧）を捨て、その直後から探し直す
+
+        このfeed()で返す予定だったルート要素のイベントも取り消す。
+        """
+        del events[self._root_events:]
+        self.stack = []
+        self.started = False
+        self._in_string = False
+        self._escape = False
+        self._scalar_start = None
+        self.pos = self._root_start + 1
+        return False
+
+    def _read_string_char(self, ch: str, events: List[Tuple[JSONPath, Any]]) -> bool:
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            try:
+                value = json.loads(self.buffer[self._string_start:self.pos + 1], strict=False)
+            except json.JSONDecodeError:
+                return self._abandon_root(events)
+            if self._string_is_key:
+                frame = self.stack[-1]
+                frame["key"] = value
+                frame["expect"] = "colon"
+            else:
+                self._complete(value, events)
+        return True
+
+    def _begin_value(self, frame: Dict[str, Any]) -> None:
+        if frame["kind"] == "[":
+            frame["index"] += 1
+
+    def _open(self, kind: str) -> None:
+        self.stack.append({
+            "kind": kind,
+            "key": None,
+            "index": -1,
+            "expect": "key" if kind == "{" else "value",
+            "start": self.pos
+        })
+
+    def _close(self, events: List[Tuple[JSONPath, Any]]) -> bool:
+        frame = self.stack.pop()
+        try:
+            value = json.loads(self.buffer[frame["start"]:self.pos + 1], strict=False)
+        except json.JSONDecodeError:
+            return self._abandon_root(events)
+
+        if not self.stack:
+            self.done = True
+            self.result = value
+            return True
+        self._complete(value, events)
+        return True
+
+    def _finish_scalar(self, events: List[Tuple[JSONPath, Any]]) -> None:
+        text = self.buffer[self._scalar_start:self.pos]
+        self._scalar_start = None
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            self._abandon_root(events)
+            return
+        self._complete(value, events)
+
+    def _complete(self, value: Any, events: List[Tuple[JSONPath, Any]]) -> None:
+        self.stack[-1]["expect"] = "comma"
+        if len(self.stack) <= self.emit_depth:
+            path = tuple(f["key"] if f["kind"] == "{" else f["index"] for f in self.stack)
+            events.append((path, value))
+
+class JSONEventStream:
+    """ResponseStreamをJSONイベント列に変換するストリーム
+
+    イテレートすると確定した要素の (パス, 値) を順に返し、終了後は result で全体を取得できる。
+    """
+
+    def __init__(self, stream: ResponseStream, emit_depth: int = 3,
+                 finalize: Optional[Callable[[str], Dict[str, Any]]] = None):
+        self.stream = stream
+        self.parser = IncrementalJSONParser(emit_depth)
+        self.finalize = finalize
+        self._result: Optional[Dict[str, Any]] = None
+
+    def __iter__(self) -> Iterator[Tuple[JSONPath, Any]]:
+        for chunk in self.stream:
+            for event in self.parser.feed(chunk):
+                yield event
+
+    @property
+    def result(self) -> Dict[str, Any]:
+        """解析結果（finalizeが指定されていれば検証・補完済みの結果を返す）"""
+        if self._result is None:
+            if self.finalize is not None:
+                self._result = self.finalize(self.stream.text)
+            elif self.parser.done and self.parser.result is not None:
+                self._result = self.parser.result
+            else:
+                data = extract_json(self.stream.text, dict)
+                self._result = data if isinstance(data, dict) else {"raw_response": self.stream.text, "status": "text_response"}
+        return self._result
+
+    def metrics(self) -> Dict[str, Any]:
+        return self.stream.metrics()
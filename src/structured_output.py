@@ -0,0 +1,311 @@
+import os
+import json
+import re
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .ai_client import AIClient
+
+logger = logging.getLogger(__name__)
+
+# スカラー値（モデルによって "70" と 70 のように表記が揺れるため文字列・数値を同一視）
+SCALAR = (str, int, float)
+
+# タスクごとの出力スキーマ（フィールド名 → 型。dictを指定した場合はネストしたスキーマ）
+# 後続処理が参照する構造だけを定義し、それ以外のフィールドは自由とする
+SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "required_personality": {
+        "required_personality": {
+            "values": list,
+            "behavioral_traits": list,
+            "skills": list,
+            "communication_style": SCALAR,
+            "leadership_style": SCALAR,
+            "problem_solving": SCALAR,
+            "growth_mindset": SCALAR,
+            "teamwork": SCALAR
+        },
+        "key_interview_points": list,
+        "success_factors": list
+    },
+    "user_personality": {
+        "current_personality": dict,
+        "strengths": list,
+        "development_areas": list,
+        "personality_summary": SCALAR
+    },
+    "personality_gap": {
+        "gap_analysis": {
+            "strengths_match": list,
+            "gaps_identified": list
+        },
+        "improvement_plan": {
+            "immediate_actions": list,
+            "medium_term_goals": list,
+            "long_term_development": list
+        },
+        "interview_strategy": {
+            "highlight_strengths": list,
+            "address_gaps": list,
+            "sample_responses": list
+        },
+        "overall_fit_score": SCALAR,
+        "fit_assessment": SCALAR
+    },
+    "industry_fit": {
+        "industry_scores": dict,
+        "overall_assessment": SCALAR,
+        "top_recommendations": list
+    },
+    "essay_improvement": {
+        "scores": {
+            "structure": SCALAR,
+            "specificity": SCALAR,
+            "uniqueness": SCALAR,
+            "motivation": SCALAR,
+            "writing": SCALAR
+        },
+        "total_score": SCALAR,
+        "improvements": list,
+        "revised_text": SCALAR
+    },
+    "interview_questions": {
+        "basic_questions": list,
+        "company_specific": list,
+        "industry_questions": list,
+        "situational": list,
+        "culture_fit": list
+    },
+    "answer_template": {
+        "answer_template": SCALAR,
+        "key_points": list,
+        "tips": list,
+        "avoid": list
+    }
+}
+
+# 出力フォーマットの例示JSONが続く目印
+TEMPLATE_MARKERS = ("期待する出力フォーマット", "JSONフォーマットで回答")
+
+FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.DOTALL)
+
+_OPEN_BRACKET = re.compile(r"[{\[]")
+
+def strip_code_fence(text: str) -> str:
+    """```json ... ``` で囲まれている場合は中身を取り出す"""
+    match = FENCE_PATTERN.search(text)
+    return match.group(1) if match else text
+
+def extract_template(prompt: str) -> Optional[Any]:
+    """プロンプト中で出力フォーマットとして例示されたJSONを取り出す"""
+    decoder = json.JSONDecoder()
+    for marker in TEMPLATE_MARKERS:
+        index = prompt.find(marker)
+        if index < 0:
+            continue
+        start = prompt.find("{", index)
+        if start < 0:
+            continue
+        try:
+            template, _ = decoder.raw_decode(prompt, start)
+            return template
+        except json.JSONDecodeError:
+            continue
+    return None
+
+def _scan(text: str, start: int) -> Tuple[int, List[str], List[Tuple[int, List[str]]]]:
+    """括弧の対応を追いながら走査し、(終了位置, 閉じていない括弧, 安全に切り詰められる位置) を返す"""
+    stack: List[str] = []
+    safe_points: List[Tuple[int, List[str]]] = []
+    in_string = False
+    escape = False
+
+    for pos in range(start, len(text)):
+        ch = text[pos]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            safe_points.append((pos + 1, list(stack)))
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return pos + 1, [], safe_points
+            safe_points.append((pos + 1, list(stack)))
+        elif ch == ",":
+            # 直前の値までは確定しているので、カンマの手前で切り詰められる
+            safe_points.append((pos, list(stack)))
+
+    return len(text), stack, safe_points
+
+def repair_truncated(fragment: str, safe_points: List[Tuple[int, List[str]]]) -> Optional[Any]:
+    """途中で途切れたJSONを、確定している部分まで切り詰めて括弧を補って復元"""
+    for end, stack in reversed(safe_points):
+        candidate = fragment[:end].rstrip().rstrip(",") + "".join(reversed(stack))
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+def extract_json(text: str, prefer: Optional[type] = None) -> Optional[Any]:
+    """説明文やコードフェンスに囲まれたレスポンスからJSONを取り出す（途切れた場合は部分的に復元）
+
+    「[分析結果]」のような説明文中の括弧は読み飛ばし、先頭から順に解析できる括弧を探す。
+    prefer（dictなど）を指定すると、その型の値を他の型の値より優先する。
+    """
+    if not text:
+        return None
+
+    parsed = None
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    else:
+        if prefer is None or isinstance(parsed, prefer):
+            return parsed
+
+    body = strip_code_fence(text)
+    decoder = json.JSONDecoder()
+    repaired: List[Any] = []
+    pos = 0
+    while True:
+        match = _OPEN_BRACKET.search(body, pos)
+        if not match:
+            break
+        start = match.start()
+        try:
+            value, pos = decoder.raw_decode(body, start)
+        except json.JSONDecodeError:
+            # 途切れた値や末尾カンマなどの軽微な崩れは、安全な位置まで戻して復元を試みる
+            end, _, safe_points = _scan(body, start)
+            value = repair_truncated(body[start:end], [(point - start, stack) for point, stack in safe_points])
+            if value:
+                repaired.append(value)
+                pos = max(end, start + 1)
+            else:
+                # 説明文中の対応しない括弧（「[注」など）なら、その直後から探し直す
+                pos = start + 1
+            continue
+        if prefer is None or isinstance(value, prefer):
+            return value
+        if parsed is None:
+            parsed = value
+
+    for value in repaired:
+        if prefer is None or isinstance(value, prefer):
+            return value
+    if parsed is not None:
+        return parsed
+    return repaired[0] if repaired else None
+
+def _type_ok(value: Any, spec: Any) -> bool:
+    if isinstance(spec, dict):
+        return isinstance(value, dict)
+    if spec is SCALAR:
+        return isinstance(value, SCALAR) and not isinstance(value, bool) and value != ""
+    return isinstance(value, spec)
+
+def validate(data: Any, schema: Dict[str, Any], prefix: str = "") -> List[str]:
+    """スキーマに対して欠落・型不正のフィールドをドット区切りのパスで返す"""
+    if not isinstance(data, dict):
+        return [prefix.rstrip(".") or "$"]
+
+    invalid = []
+    for field, spec in schema.items():
+        path = prefix + field
+        if field not in data or not _type_ok(data[field], spec):
+            invalid.append(path)
+        elif isinstance(spec, dict):
+            invalid.extend(validate(data[field], spec, path + "."))
+    return invalid
+
+def get_max_repairs() -> int:
+    """不足フィールドの再問い合わせ回数（STRUCTURED_OUTPUT_MAX_REPAIRSで上書き可）"""
+    return int(os.getenv("STRUCTURED_OUTPUT_MAX_REPAIRS", "1"))
+
+class StructuredOutput:
+    """モデルのJSON出力を抽出・検証し、不足しているフィールドだけを再問い合わせする"""
+
+    def __init__(self, ai_client: AIClient, task: str, max_repairs: Optional[int] = None):
+        self.ai_client = ai_client
+        self.task = task
+        self.schema = SCHEMAS.get(task)
+        self.max_repairs = get_max_repairs() if max_repairs is None else max_repairs
+
+    def request(self, prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """生成して検証済みの結果を返す"""
+        response = self.ai_client.generate_response(prompt, system_prompt)
+        return self.finalize(response, prompt, system_prompt)
+
+    def finalize(self, response: str, prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """レスポンス全文を解析し、必要なら不足分を補完して返す"""
+        data = extract_json(response, dict)
+        if not isinstance(data, dict):
+            data = {}
+
+        if self.schema is None:
+            return data or {"raw_response": response, "status": "text_response"}
+
+        invalid = validate(data, self.schema)
+        for _ in range(self.max_repairs):
+            if not invalid:
+                break
+            logger.info("structured output for %s missing %s; re-asking", self.task, ", ".join(invalid))
+            data = self._repair(data, invalid, prompt, system_prompt)
+            invalid = validate(data, self.schema)
+
+        if not data:
+            return {"raw_response": response, "status": "text_response"}
+        return data
+
+    def _repair(self, data: Dict[str, Any], invalid: List[str], prompt: str,
+                system_prompt: Optional[str]) -> Dict[str, Any]:
+        """不足・不正なトップレベルのフィールドだけを再生成してマージ"""
+        fields = list(dict.fromkeys(path.split(".")[0] for path in invalid))
+        response = self.ai_client.generate_response(self._build_repair_prompt(prompt, fields), system_prompt)
+
+        patch = extract_json(response, dict)
+        if not isinstance(patch, dict):
+            return data
+
+        merged = dict(data)
+        for field in fields:
+            if field in patch and not validate({field: patch[field]}, {field: self.schema[field]}):
+                merged[field] = patch[field]
+        return merged
+
+    def _build_repair_prompt(self, prompt: str, fields: List[str]) -> str:
+        """不足しているフィールドのみを回答させるプロンプトを作成"""
+        template = extract_template(prompt)
+        if isinstance(template, dict):
+            subset = {field: template[field] for field in fields if field in template}
+        else:
+            subset = {field: "..." for field in fields}
+
+        return f"""{prompt}
+
+※ 他の項目は回答済みです。以下の項目のみを、このJSONフォーマットで回答してください：
+{json.dumps(subset, ensure_ascii=False, indent=2)}
+"""
+
+def request_json(ai_client: AIClient, prompt: str, system_prompt: Optional[str] = None,
+                 task: Optional[str] = None) -> Dict[str, Any]:
+    """JSON形式のレスポンスを生成して、抽出・検証・補完済みの結果を返す"""
+    return StructuredOutput(ai_client, task).request(prompt, system_prompt)
+
+def json_finalizer(ai_client: AIClient, task: str, prompt: str,
+                   system_prompt: Optional[str] = None) -> Callable[[str], Dict[str, Any]]:
+    """ストリーミング完了後のレスポンス全文を検証・補完する関数を作成"""
+    structured = StructuredOutput(ai_client, task)
+    return lambda response: structured.finalize(response, prompt, system_prompt)
@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# モデルごとの料金（USD / 100万トークン、入力・出力）
+MODEL_PRICES = {
+    "claude-3-5-sonnet-20241022": (3.0, 15.0),
+    "gpt-4": (30.0, 60.0),
+    "fake": (0.0, 0.0)
+}
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """ワークフローのステップやLLM呼び出し1回分の計測区間"""
+
+    def __init__(self, tracer: "Tracer", name: str, kind: str, parent: Optional["Span"] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self._dispatched: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def dispatched(self) -> None:
+        """リクエストを送信した時点を記録（それまでの待ち時間をキュー時間とする）"""
+        self._dispatched = time.perf_counter()
+        self.attributes["queue_time"] = round(self._dispatched - self._started, 4)
+        self.attributes["attempts"] = self.attributes.get("attempts", 0) + 1
+
+    def first_token(self) -> None:
+        """最初のトークンを受信した時点を記録（送信からの時間をTTFTとする）"""
+        if "ttft" not in self.attributes:
+            origin = self._dispatched if self._dispatched is not None else self._started
+            self.attributes["ttft"] = round(time.perf_counter() - origin, 4)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self.duration is not None:
+            return
+        self.duration = self.elapsed()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time": round(self.start_time, 4),
+            "duration": round(self.duration or 0.0, 4),
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+class Tracer:
+    """スパンを生成し、終了したスパンをJSONLファイルと直近分のメモリに書き出す
+
+    現在のスパンはcontextvarsで保持するため、スレッドプールに処理を渡す場合は
+    contextvars.copy_context().run で呼び出し元のコンテキストを引き継ぐ。
+    """
+
+    def __init__(self, path: Optional[str] = None, buffer_size: int = 2000, max_bytes: int = 50 * 1024 * 1024,
+                 enabled: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._recent: deque = deque(maxlen=buffer_size)
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def start(self, name: str, kind: str = "internal", **attributes: Any) -> Span:
+        """現在のスパンを親とするスパンを開始（現在のスパンは切り替えない）
+
+        ストリーミングのように呼び出し元が少しずつ消費する処理で使い、終了時に end() を呼ぶ。
+        """
+        return Span(self, name, kind, self.current(), attributes)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes: Any) -> Iterator[Span]:
+        """with文の間、現在のスパンとして扱うスパン"""
+        span = self.start(name, kind, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def record(self, name: str, kind: str = "internal", **attributes: Any) -> None:
+        """所要時間のない出来事（キャッシュヒットなど）をスパンとして記録"""
+        self.start(name, kind, **attributes).end()
+
+    def export(self, span: Span) -> None:
+        if not self.enabled:
+            return
+        record = span.to_dict()
+        with self._lock:
+            self._recent.append(record)
+            if not self.path:
+                return
+            try:
+                self._rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                logger.warning("failed to export span: %s", e)
+
+    def _rotate(self) -> None:
+        """ファイルが上限を超えたら1世代だけ残して切り替える"""
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+            os.replace(self.path, self.path + ".1")
+
+    def spans(self, limit: int = 5000) -> List[Dict[str, Any]]:
+        """直近のスパン（ファイルがあればファイルから、なければメモリから）"""
+        with self._lock:
+            if not self.path or not os.path.exists(self.path):
+                return list(self._recent)[-limit:]
+            with open(self.path, encoding="utf-8") as f:
+                lines = deque(f, maxlen=limit)
+
+        spans = []
+        for line in lines:
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                # 書き込み途中の行は読み飛ばす
+                continue
+        return spans
+
+def traced_iter(span: Span, chunks: Iterator[str]) -> Iterator[str]:
+    """ストリームを消費し終えた（または中断した）時点でスパンを終了するイテレータ"""
+    try:
+        for chunk in chunks:
+            span.first_token()
+            yield chunk
+    except BaseException as e:
+        span.end(e)
+        raise
+    finally:
+        span.end()
+
+async def atraced_iter(span: Span, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    try:
+        async for chunk in chunks:
+            span.first_token()
+            yield chunk
+    except BaseException as e:
+        span.end(e)
+        raise
+    finally:
+        span.end()
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """トークン数から料金（USD）を概算（料金不明のモデルはNone）"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+def _percentile(values: List[float], ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+def summarize_spans(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """スパンをステップ別・モデル別・ワークフロー別に集計
+
+    LLM呼び出しのトークン数と料金は、親を辿って最も近いステップに計上する。
+    """
+    by_id = {span["span_id"]: span for span in spans}
+
+    def owner(span: Dict[str, Any], kind: str) -> Optional[Dict[str, Any]]:
+        parent = by_id.get(span.get("parent_id"))
+        while parent is not None and parent["kind"] != kind:
+            parent = by_id.get(parent.get("parent_id"))
+        return parent
+
+    steps: Dict[str, Dict[str, Any]] = {}
+    models: Dict[str, Dict[str, Any]] = {}
+    workflows: Dict[str, Dict[str, Any]] = {}
+
+    for span in spans:
+        attrs = span.get("attributes", {})
+        if span["kind"] == "step":
+            step = steps.setdefault(span["name"], {"step": span["name"], "runs": 0, "failed": 0, "durations": [],
+                                                   "queue_time": 0.0, "llm_calls": 0, "input_tokens": 0,
+                                                   "output_tokens": 0, "cost": 0.0})
+            step["runs"] += 1
+            step["failed"] += 1 if span.get("error") else 0
+            step["durations"].append(span["duration"])
+            step["queue_time"] += attrs.get("queue_time", 0.0)
+        elif span["kind"] == "workflow":
+            workflows[span["span_id"]] = {"trace_id": span["trace_id"], "name": span["name"],
+                                          "started": span["start_time"], "duration": span["duration"],
+                                          "targets": attrs.get("targets"), "company_name": attrs.get("company_name"),
+                                          "llm_calls": 0, "cache_hits": 0, "input_tokens": 0, "output_tokens": 0,
+                                          "cost": 0.0}
+
+    for span in spans:
+        if span["kind"] != "llm":
+            continue
+        attrs = span.get("attributes", {})
+        model_name = attrs.get("model", "unknown")
+        input_tokens = attrs.get("input_tokens") or 0
+        output_tokens = attrs.get("output_tokens") or 0
+        cost = estimate_cost(model_name, input_tokens, output_tokens) or 0.0
+
+        model = models.setdefault(model_name, {"model": model_name, "calls": 0, "cache_hits": 0, "errors": 0,
+                                               "durations": [], "ttfts": [], "queue_time": 0.0,
+                                               "input_tokens": 0, "output_tokens": 0, "cost": 0.0})
+        model["calls"] += 1
+        model["errors"] += 1 if span.get("error") else 0
+        model["input_tokens"] += input_tokens
+        model["output_tokens"] += output_tokens
+        model["cost"] += cost
+        if attrs.get("cache_hit"):
+            model["cache_hits"] += 1
+        else:
+            model["durations"].append(span["duration"])
+            model["queue_time"] += attrs.get("queue_time", 0.0)
+            if attrs.get("ttft") is not None:
+                model["ttfts"].append(attrs["ttft"])
+
+        step_span = owner(span, "step")
+        if step_span is not None and step_span["name"] in steps:
+            step = steps[step_span["name"]]
+            step["llm_calls"] += 1
+            step["input_tokens"] += input_tokens
+            step["output_tokens"] += output_tokens
+            step["cost"] += cost
+
+        workflow_span = owner(span, "workflow")
+        if workflow_span is not None:
+            workflow = workflows[workflow_span["span_id"]]
+            workflow["llm_calls"] += 1
+            workflow["cache_hits"] += 1 if attrs.get("cache_hit") else 0
+            workflow["input_tokens"] += input_tokens
+            workflow["output_tokens"] += output_tokens
+            workflow["cost"] += cost
+
+    step_rows = []
+    for step in steps.values():
+        durations = step.pop("durations")
+        step.update({
+            "avg_time": round(sum(durations) / len(durations), 3),
+            "p95_time": round(_percentile(durations, 0.95), 3),
+            "total_time": round(sum(durations), 3),
+            "avg_queue_time": round(step.pop("queue_time") / step["runs"], 3),
+            "cost": round(step["cost"], 5)
+        })
+        step_rows.append(step)
+    step_rows.sort(key=lambda row: -row["total_time"])
+
+    model_rows = []
+    for model in models.values():
+        durations, ttfts = model.pop("durations"), model.pop("ttfts")
+        requests = len(durations)
+        model.update({
+            "cache_hit_rate": round(model["cache_hits"] / model["calls"], 3),
+            "avg_time": round(sum(durations) / requests, 3) if requests else None,
+            "p95_time": round(_percentile(durations, 0.95), 3) if requests else None,
+            "avg_ttft": round(sum(ttfts) / len(ttfts), 3) if ttfts else None,
+            "avg_queue_time": round(model.pop("queue_time") / requests, 3) if requests else None,
+            "cost": round(model["cost"], 5)
+        })
+        model_rows.append(model)
+
+    workflow_rows = sorted(workflows.values(), key=lambda row: -row["started"])
+    for workflow in workflow_rows:
+        workflow["cost"] = round(workflow["cost"], 5)
+
+    return {
+        "steps": step_rows,
+        "models": model_rows,
+        "workflows": workflow_rows,
+        "totals": {
+            "llm_calls": sum(model["calls"] for model in model_rows),
+            "cache_hits": sum(model["cache_hits"] for model in model_rows),
+            "input_tokens": sum(model["input_tokens"] for model in model_rows),
+            "output_tokens": sum(model["output_tokens"] for model in model_rows),
+            "cost": round(sum(model["cost"] for model in model_rows), 5)
+        }
+    }
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    """環境変数の設定に従って共有のトレーサーを取得（TRACE_ENABLED=false で記録しない）"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(
+                path=os.getenv("TRACE_PATH", ".cache/traces.jsonl") or None,
+                buffer_size=int(os.getenv("TRACE_BUFFER_SIZE", "2000")),
+                max_bytes=int(float(os.getenv("TRACE_MAX_MB", "50")) * 1024 * 1024),
+                enabled=os.getenv("TRACE_ENABLED", "true").lower() not in ("0", "false", "no")
+            )
+        return _tracer
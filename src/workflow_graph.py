@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+StepFunc = Callable[[Dict[str, Any]], Any]
+
+def fingerprint(data: Any) -> str:
+    """入力データのフィンガープリント（キー順や整形に依存しない）"""
+    payload = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class StepNode:
+    """ワークフローの1ステップ（依存ステップの結果を受け取って結果を返す）"""
+
+    def __init__(self, name: str, func: StepFunc, deps: Tuple[str, ...] = (), inline: bool = False,
+                 inputs: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        # Streamlitへの描画など呼び出し元スレッドで実行する必要があるステップ
+        self.inline = inline
+        # 依存ステップ以外の外部入力（企業名・ユーザー情報など）を返す関数
+        self.inputs = inputs
+
+class StepFailed(Exception):
+    """依存ステップが失敗したため実行されなかったことを表す例外"""
+
+class ExecutionReport:
+    """グラフ実行の結果と各ステップの所要時間"""
+
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, Exception] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self.deps: Dict[str, Tuple[str, ...]] = {}
+        self.reused: List[str] = []
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def wall_time(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    def duration(self, name: str) -> float:
+        start, end = self.timings[name]
+        return end - start
+
+    def critical_path(self) -> List[str]:
+        """最後に完了したステップから、最も遅く完了した依存ステップを辿った経路"""
+        if not self.timings:
+            return []
+
+        current = max(self.timings, key=lambda name: self.timings[name][1])
+        path = [current]
+        while True:
+            finished_deps = [dep for dep in self.deps.get(current, ()) if dep in self.timings]
+            if not finished_deps:
+                break
+            current = max(finished_deps, key=lambda name: self.timings[name][1])
+            path.append(current)
+        return list(reversed(path))
+
+    def summary(self) -> Dict[str, Any]:
+        """所要時間のサマリー（逐次実行した場合の合計時間との比較を含む）"""
+        path = self.critical_path()
+        return {
+            "wall_time": round(self.wall_time, 3),
+            "sequential_time": round(sum(self.duration(name) for name in self.timings), 3),
+            "critical_path": path,
+            "critical_path_time": round(sum(self.duration(name) for name in path), 3),
+            "steps": {name: round(self.duration(name), 3) for name in self.timings},
+            "reused": self.reused,
+            "failed": {name: str(error) for name, error in self.errors.items()}
+        }
+
+class WorkflowGraph:
+    """ステップの依存関係を表すDAG。実行可能になったステップから並行して実行する"""
+
+    def __init__(self):
+        self.nodes: Dict[str, StepNode] = {}
+
+    def add(self, name: str, func: StepFunc, deps: Tuple[str, ...] = (), inline: bool = False,
+            inputs: Optional[Callable[[], Any]] = None) -> "WorkflowGraph":
+        """ステップを追加（依存ステップは先に追加しておく）"""
+        if name in self.nodes:
+            raise ValueError(f"Duplicate step: {name}")
+        missing = [dep for dep in deps if dep not in self.nodes]
+        if missing:
+            raise ValueError(f"Unknown dependencies for {name}: {', '.join(missing)}")
+        self.nodes[name] = StepNode(name, func, deps, inline, inputs)
+        return self
+
+    def fingerprints(self) -> Dict[str, str]:
+        """各ステップの外部入力と依存ステップのフィンガープリントから、ステップごとのフィンガープリントを計算
+
+        実行前に計算できるため、入力が変わったステップとその下流だけを再実行の対象にできる。
+        """
+        fingerprints: Dict[str, str] = {}
+        # 依存ステップは先に追加されているため、追加順に計算すれば依存関係の順になる
+        for name, node in self.nodes.items():
+            fingerprints[name] = fingerprint([
+                name,
+                node.inputs() if node.inputs else None,
+                [fingerprints[dep] for dep in node.deps]
+            ])
+        return fingerprints
+
+    def run(self, targets: Optional[List[str]] = None, initial: Optional[Dict[str, Any]] = None,
+            max_workers: Optional[int] = None,
+            on_complete: Optional[Callable[[str, Any], None]] = None,
+            cancel: Optional[threading.Event] = None) -> ExecutionReport:
+        """依存関係の解決したステップから並行実行する
+
+        targetsを指定するとそれらの実行に必要なステップだけを実行し、
+        initialに結果が与えられたステップは実行せずにその結果を使う。
+        on_completeは成功したステップごとに呼び出し元スレッドで呼ばれる。
+        cancelがセットされると、それ以降は新しいステップを開始しない。
+        """
+        report = ExecutionReport()
+        report.results.update(initial or {})
+        report.deps = {name: node.deps for name, node in self.nodes.items()}
+
+        needed, reused = self.plan(targets or list(self.nodes), report.results)
+        pending = [name for name in self.nodes if name in needed]
+        report.reused = [name for name in self.nodes if name in reused]
+        running: Dict[Future, str] = {}
+        workers = max_workers or int(os.getenv("WORKFLOW_MAX_WORKERS", "4"))
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="workflow") as pool:
+            while pending or running:
+                if cancel is not None and cancel.is_set() and pending:
+                    for name in pending:
+                        report.errors[name] = StepFailed(f"{name} cancelled")
+                    pending.clear()
+                self._skip_failed(pending, report)
+                for name in self._ready(pending, report):
+                    node = self.nodes[name]
+                    if not node.inline:
+                        pending.remove(name)
+                        # ステップのスパンが呼び出し元のスパンの子になるようにコンテキストを引き継ぐ
+                        context = contextvars.copy_context()
+                        running[pool.submit(context.run, self._execute, node, report, time.perf_counter())] = name
+
+                inline_ready = [name for name in self._ready(pending, report) if self.nodes[name].inline]
+                if inline_ready:
+                    # 呼び出し元スレッドで実行する間もプール側のステップは並行して進む
+                    name = inline_ready[0]
+                    pending.remove(name)
+                    self._record(name, self._execute(self.nodes[name], report), report, on_complete)
+                    continue
+
+                if not running:
+                    if pending:
+                        # 依存関係が解決できないステップは失敗扱い
+                        for name in pending:
+                            report.errors[name] = StepFailed(f"{name} has unresolved dependencies")
+                        pending.clear()
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._record(running.pop(future), future.result(), report, on_complete)
+
+        report.finished_at = time.perf_counter()
+        logger.info("workflow graph finished: %s", report.summary())
+        return report
+
+    def plan(self, targets: List[str], available: Dict[str, Any]) -> Tuple[set, set]:
+        """targetsの実行に必要なステップと、結果を再利用するステップ（再利用するステップより上流は辿らない）"""
+        needed, reused = set(), set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name in needed or name in reused:
+                continue
+            if name in available:
+                reused.add(name)
+                continue
+            needed.add(name)
+            stack.extend(self.nodes[name].deps)
+        return needed, reused
+
+    def _skip_failed(self, pending: List[str], report: ExecutionReport) -> None:
+        """失敗したステップに依存するステップを（連鎖的に）スキップ扱いにする"""
+        skipped = True
+        while skipped:
+            skipped = False
+            for name in list(pending):
+                failed = [dep for dep in self.nodes[name].deps if dep in report.errors]
+                if failed:
+                    pending.remove(name)
+                    report.errors[name] = StepFailed(f"{name} skipped: {', '.join(failed)} failed")
+                    skipped = True
+
+    def _ready(self, pending: List[str], report: ExecutionReport) -> List[str]:
+        finished = set(report.results) | set(report.errors)
+        return [name for name in pending if all(dep in finished for dep in self.nodes[name].deps)]
+
+    def _execute(self, node: StepNode, report: ExecutionReport,
+                 submitted: Optional[float] = None) -> Tuple[float, float, Any, Optional[Exception]]:
+        inputs = {dep: report.results[dep] for dep in node.deps}
+        start = time.perf_counter()
+        with get_tracer().span(node.name, "step", inline=node.inline,
+                               queue_time=round(start - submitted, 4) if submitted else 0.0) as span:
+            try:
+                result, error = node.func(inputs), None
+            except Exception as e:
+                result, error = None, e
+                span.error = f"{type(e).__name__}: {e}"
+        return start, time.perf_counter(), result, error
+
+    def _record(self, name: str, outcome: Tuple[float, float, Any, Optional[Exception]], report: ExecutionReport,
+                on_complete: Optional[Callable[[str, Any], None]] = None) -> None:
+        start, end, result, error = outcome
+        report.timings[name] = (start, end)
+        if error is not None:
+            report.errors[name] = error
+        else:
+            report.results[name] = result
+            if on_complete:
+                on_complete(name, result)
+
+class StepMemo:
+    """ステップの結果を入力のフィンガープリントと組で保持するメモ（複数スレッドから更新可能）"""
+
+    def __init__(self):
+        self.entries: Dict[str, Tuple[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def valid(self, fingerprints: Dict[str, str]) -> Dict[str, Any]:
+        """フィンガープリントが一致する（入力が変わっていない）ステップの結果"""
+        with self._lock:
+            return {
+                name: result
+                for name, (fp, result) in self.entries.items()
+                if fingerprints.get(name) == fp
+            }
+
+    def update(self, fingerprints: Dict[str, str], results: Dict[str, Any],
+               cacheable: Callable[[Any], bool] = lambda result: True) -> None:
+        """実行したステップの結果を保存（エラー結果などcacheableでないものは保存しない）"""
+        with self._lock:
+            for name, result in results.items():
+                if name in fingerprints and cacheable(result):
+                    self.entries[name] = (fingerprints[name], result)
+
+    def invalidate(self, fingerprints: Dict[str, str]) -> List[str]:
+        """入力が変わって古くなった結果を破棄し、破棄したステップ名を返す"""
+        with self._lock:
+            stale = [name for name, (fp, _) in self.entries.items() if fingerprints.get(name) != fp]
+            for name in stale:
+                del self.entries[name]
+            return stale
+
+    def snapshot(self) -> Dict[str, Tuple[str, Any]]:
+        """保存用に現在のエントリをコピー"""
+        with self._lock:
+            return dict(self.entries)
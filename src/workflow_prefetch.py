@@ -0,0 +1,46 @@
+import threading
+from typing import Dict, Iterable, Optional
+
+class SpeculativeRun:
+    """バックグラウンドで先行実行しているステップ群
+
+    開始時点の入力のフィンガープリントを保持し、入力が変わった場合はキャンセルされる。
+    同じ入力でステップが要求された場合、呼び出し側は完了を待って結果を再利用する。
+    """
+
+    def __init__(self, steps: Iterable[str], fingerprints: Dict[str, str]):
+        self.steps = set(steps)
+        self.fingerprints = {name: fingerprints[name] for name in self.steps}
+        self.cancel_event = threading.Event()
+        self._step_done = {name: threading.Event() for name in self.steps}
+        self._finished = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        """実行中かつキャンセルされていない"""
+        return not self._finished.is_set() and not self.cancel_event.is_set()
+
+    def matches(self, fingerprints: Dict[str, str]) -> bool:
+        """先行実行しているステップの入力が現在の入力と同じか"""
+        return all(fingerprints.get(name) == fp for name, fp in self.fingerprints.items())
+
+    def mark_done(self, name: str) -> None:
+        if name in self._step_done:
+            self._step_done[name].set()
+
+    def finish(self) -> None:
+        """実行終了（失敗・キャンセルを含む）。待機中の呼び出し側をすべて解放する"""
+        self._finished.set()
+        for event in self._step_done.values():
+            event.set()
+
+    def cancel(self) -> None:
+        """新しいステップの開始を止める（実行中のLLM呼び出しは完了を待たずに結果を破棄する）"""
+        self.cancel_event.set()
+
+    def wait(self, steps: Iterable[str], timeout: Optional[float] = None) -> None:
+        """指定ステップの先行実行が終わるまで待つ"""
+        for name in steps:
+            if name in self._step_done:
+                self._step_done[name].wait(timeout)
@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SharedDict(dict):
+    """プールで共有される辞書（弱参照できるdict）"""
+    __slots__ = ("__weakref__",)
+
+class SharedList(list):
+    """プールで共有されるリスト（弱参照できるlist）"""
+    __slots__ = ("__weakref__",)
+
+class SharedStr(str):
+    """プールで共有される長い文字列（弱参照できるstr）"""
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+class ArtifactPool:
+    """内容が同じステップ結果（とその一部）を1つのオブジェクトにまとめるプール
+
+    同じ企業の企業分析・求める人物像や、ギャップ分析の一部を引き継いだ面接対策のように、
+    セッション間・ステップ間で同じ内容が重複して保持されるのを防ぐ。
+    どのセッションからも参照されなくなったオブジェクトはプールからも消える（弱参照で保持）。
+    共有されたオブジェクトは変更してはならない。
+    """
+
+    def __init__(self, min_str_length: int = 256):
+        self.min_str_length = min_str_length
+        self._objects: "weakref.WeakValueDictionary[bytes, Any]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def intern(self, value: Any) -> Any:
+        """valueと同じ内容のオブジェクトがプールにあればそれを、なければvalueを共有用に登録して返す"""
+        return self._intern(value)[0]
+
+    def _intern(self, value: Any) -> Tuple[Any, bytes]:
+        if isinstance(value, str):
+            digest = _digest(b"s" + value.encode("utf-8"))
+            if len(value) < self.min_str_length:
+                return value, digest
+            return self._lookup(digest, lambda: SharedStr(value)), digest
+
+        if isinstance(value, dict):
+            items = {}
+            hasher = hashlib.blake2b(b"d", digest_size=16)
+            for key, item in value.items():
+                items[key], item_digest = self._intern(item)
+                hasher.update(_digest(repr(key).encode("utf-8")))
+                hasher.update(item_digest)
+            digest = hasher.digest()
+            return self._lookup(digest, lambda: SharedDict(items)), digest
+
+        if isinstance(value, list):
+            items = []
+            hasher = hashlib.blake2b(b"l", digest_size=16)
+            for item in value:
+                item, item_digest = self._intern(item)
+                items.append(item)
+                hasher.update(item_digest)
+            digest = hasher.digest()
+            return self._lookup(digest, lambda: SharedList(items)), digest
+
+        return value, _digest(f"{type(value).__name__}:{value!r}".encode("utf-8"))
+
+    def _lookup(self, digest: bytes, create) -> Any:
+        with self._lock:
+            shared = self._objects.get(digest)
+            if shared is not None:
+                self._counters["hits"] += 1
+                return shared
+            shared = create()
+            self._objects[digest] = shared
+            self._counters["misses"] += 1
+            return shared
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"objects": len(self._objects), **self._counters}
+
+class WorkflowState:
+    """画面表示用のワークフローの状態（各ステップの最新の有効な結果）
+
+    従来の辞書と同じく workflow_state["gap_analysis"] / .get() で参照できる。
+    """
+
+    __slots__ = ("company_analysis", "required_personality", "user_personality", "gap_analysis",
+                 "generated_essays", "interview_preparation")
+
+    def __init__(self):
+        self.company_analysis: Optional[Dict[str, Any]] = None
+        self.required_personality: Optional[Dict[str, Any]] = None
+        self.user_personality: Optional[Dict[str, Any]] = None
+        self.gap_analysis: Optional[Dict[str, Any]] = None
+        self.generated_essays: Dict[str, Any] = {}
+        self.interview_preparation: Optional[Dict[str, Any]] = None
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+def compress_entries(entries: Dict[str, Tuple[str, Any]]) -> bytes:
+    """ステップ結果を圧縮したJSONに変換（アイドル状態のセッション用）"""
+    payload = json.dumps({name: [fp, result] for name, (fp, result) in entries.items()},
+                         ensure_ascii=False, separators=(",", ":"), default=str)
+    return zlib.compress(payload.encode("utf-8"), 6)
+
+def decompress_entries(data: bytes, pool: Optional[ArtifactPool] = None) -> Dict[str, Tuple[str, Any]]:
+    """圧縮したステップ結果を復元（プールを渡すと共有できる部分は共有オブジェクトを使う）"""
+    entries = json.loads(zlib.decompress(data).decode("utf-8"))
+    return {
+        name: (fp, pool.intern(result) if pool is not None else result)
+        for name, (fp, result) in entries.items()
+    }
+
+def deep_sizeof(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """オブジェクトが参照する辞書・リスト・文字列を含めたおおよそのメモリ量（共有オブジェクトは1回だけ数える）"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__") and not isinstance(obj, (str, bytes)):
+        size += sum(deep_sizeof(getattr(obj, name, None), seen) for name in obj.__slots__ if name != "__weakref__")
+    return size
+
+class IdleCompactor:
+    """一定時間アクセスのないセッションのステップ結果を圧縮するバックグラウンドの掃除役"""
+
+    def __init__(self, idle_seconds: float, interval: Optional[float] = None):
+        self.idle_seconds = idle_seconds
+        self.interval = interval or max(1.0, min(60.0, idle_seconds / 2))
+        self._sessions: "weakref.WeakSet" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"sweeps": 0, "compacted": 0}
+
+    def register(self, session) -> None:
+        """compact_if_idle(idle_seconds) を持つセッションを登録（参照されなくなったセッションは自動で外れる）"""
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="workflow-compactor", daemon=True)
+                self._thread.start()
+
+    def sweep(self) -> int:
+        with self._lock:
+            sessions = list(self._sessions)
+        compacted = 0
+        for session in sessions:
+            try:
+                compacted += 1 if session.compact_if_idle(self.idle_seconds) else 0
+            except Exception as e:
+                logger.warning("failed to compact session: %s", e)
+        with self._lock:
+            self._counters["sweeps"] += 1
+            self._counters["compacted"] += compacted
+        return compacted
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.sweep()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "idle_seconds": self.idle_seconds, **self._counters}
+
+_artifact_pool: Optional[ArtifactPool] = None
+_artifact_pool_lock = threading.Lock()
+
+def get_artifact_pool() -> ArtifactPool:
+    """プロセス全体で共有するステップ結果のプールを取得"""
+    global _artifact_pool
+    with _artifact_pool_lock:
+        if _artifact_pool is None:
+            _artifact_pool = ArtifactPool(min_str_length=int(os.getenv("WORKFLOW_SHARED_MIN_CHARS", "256")))
+        return _artifact_pool
+
+_idle_compactor: Optional[IdleCompactor] = None
+_idle_compactor_lock = threading.Lock()
+
+def get_idle_compactor() -> Optional[IdleCompactor]:
+    """環境変数の設定に従ってアイドルセッションの圧縮役を取得（WORKFLOW_COMPACT_IDLE_SECONDS=0 で無効）"""
+    global _idle_compactor
+    idle_seconds = float(os.getenv("WORKFLOW_COMPACT_IDLE_SECONDS", "900"))
+    if idle_seconds <= 0:
+        return None
+
+    with _idle_compactor_lock:
+        if _idle_compactor is None:
+            _idle_compactor = IdleCompactor(idle_seconds)
+        return _idle_compactor
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+class WorkflowStore(ABC):
+    """ワークフローのチェックポイントを保存する永続化バックエンド"""
+
+    @abstractmethod
+    def load(self, session_key: str) -> Optional[Dict[str, Any]]:
+        """保存済みのチェックポイントを取得（なければNone）"""
+        pass
+
+    @abstractmethod
+    def save(self, session_key: str, checkpoint: Dict[str, Any]) -> None:
+        """チェックポイントを保存（同じキーの既存データは上書き）"""
+        pass
+
+    @abstractmethod
+    def delete(self, session_key: str) -> None:
+        """チェックポイントを削除"""
+        pass
+
+class SQLiteWorkflowStore(WorkflowStore):
+    """SQLiteにチェックポイントを保存するバックエンド（WALモードで複数プロセスから共有可能）"""
+
+    def __init__(self, path: str, ttl_seconds: float = 30 * 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                session_key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def load(self, session_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM checkpoints WHERE session_key = ?", (session_key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            data, updated_at = row
+            if self.ttl_seconds and time.time() - updated_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM checkpoints WHERE session_key = ?", (session_key,))
+                self._conn.commit()
+                return None
+            return json.loads(data)
+
+    def save(self, session_key: str, checkpoint: Dict[str, Any]) -> None:
+        data = json.dumps(checkpoint, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (session_key, data, updated_at) VALUES (?, ?, ?)",
+                (session_key, data, time.time())
+            )
+            self._conn.commit()
+
+    def delete(self, session_key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE session_key = ?", (session_key,))
+            self._conn.commit()
+
+class MemoryWorkflowStore(WorkflowStore):
+    """プロセス内のメモリに保存するバックエンド（永続化しない場合・検証用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkpoints: Dict[str, str] = {}
+
+    def load(self, session_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._checkpoints.get(session_key)
+        return json.loads(data) if data is not None else None
+
+    def save(self, session_key: str, checkpoint: Dict[str, Any]) -> None:
+        # 保存後に呼び出し元が結果を変更しても影響しないようにシリアライズして保持
+        data = json.dumps(checkpoint, ensure_ascii=False, default=str)
+        with self._lock:
+            self._checkpoints[session_key] = data
+
+    def delete(self, session_key: str) -> None:
+        with self._lock:
+            self._checkpoints.pop(session_key, None)
+
+_workflow_store: Optional[WorkflowStore] = None
+_workflow_store_lock = threading.Lock()
+
+def get_workflow_store() -> Optional[WorkflowStore]:
+    """環境変数の設定に従って共有のチェックポイント保存先を取得（WORKFLOW_STORE=none で無効）"""
+    global _workflow_store
+    backend = os.getenv("WORKFLOW_STORE", "sqlite").lower()
+    if backend in ("none", "false", "0"):
+        return None
+
+    with _workflow_store_lock:
+        if _workflow_store is None:
+            if backend == "memory":
+                _workflow_store = MemoryWorkflowStore()
+            elif backend == "sqlite":
+                _workflow_store = SQLiteWorkflowStore(
+                    path=os.getenv("WORKFLOW_STORE_PATH", ".cache/workflow_state.db"),
+                    ttl_seconds=float(os.getenv("WORKFLOW_STORE_TTL_SECONDS", str(30 * 24 * 3600)))
+                )
+            else:
+                raise ValueError(f"Unsupported workflow store: {backend}")
+        return _workflow_store
@@ -0,0 +1,30 @@
+from src.streaming_json import IncrementalJSONParser
+
+
+def feed_all(chunks, emit_depth=3):
+    parser = IncrementalJSONParser(emit_depth)
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return parser, events
+
+
+def test_events_for_plain_object():
+    parser, events = feed_all(['{"a": 1, "b": ["x", ', '"y"]}'])
+    assert events == [(("a",), 1), (("b", 0), "x"), (("b", 1), "y"), (("b",), ["x", "y"])]
+    assert parser.done
+    assert parser.result == {"a": 1, "b": ["x", "y"]}
+
+
+def test_leading_bracketed_prose_is_skipped():
+    text = '[参考] 以下が[分析結果]です。\n```json\n{"score": 8, "tags": ["a"]}\n```'
+    parser, events = feed_all([text])
+    assert events == [(("score",), 8), (("tags", 0), "a"), (("tags",), ["a"])]
+    assert parser.result == {"score": 8, "tags": ["a"]}
+
+
+def test_leading_bracketed_prose_split_across_chunks():
+    text = '[参考]\n{"score": 8, "comment": "良い"}'
+    parser, events = feed_all([text[i:i + 3] for i in range(0, len(text), 3)])
+    assert events == [(("score",), 8), (("comment",), "良い")]
+    assert parser.result == {"score": 8, "comment": "良い"}
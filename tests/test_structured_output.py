@@ -0,0 +1,15 @@
+from src.structured_output import extract_json
+
+
+def test_unbalanced_bracket_in_prose_is_skipped():
+    assert extract_json('[参考: 以下 {"a": 1, "b": [2]} 以上', dict) == {"a": 1, "b": [2]}
+
+
+def test_whole_text_respects_prefer():
+    assert extract_json('"要約" {"a": 1}', dict) == {"a": 1}
+    assert extract_json('[1, 2]', dict) == [1, 2]
+    assert extract_json('42') == 42
+
+
+def test_truncated_object_is_repaired():
+    assert extract_json('{"a": 1, "b": [1, 2', dict) == {"a": 1, "b": [1]}